@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+
+"""Generate synthetic rpSBML files, for benchmarking purpose.
+
+Pathways are linear: a precursor from the chassis is turned into the target
+through intermediates, one per step. Files follow the layout of rpSBML files
+written by the RetroPath Suite (brsynth annotations and pathway groups), so
+that they go through the same code paths as real ones.
+"""
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import argparse
+import csv
+import hashlib
+import random
+import tarfile
+from io import BytesIO
+from itertools import count, product
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from rdkit import Chem, RDLogger
+
+DEFAULT_COFACTOR_FILE = (
+    Path(__file__).resolve().parent.parent
+    / "rpviz"
+    / "data"
+    / "cofactors_mnx_202507.tsv"
+)
+TARGET_SMILES = "C=Cc1ccccc1"  # styrene, as in tests
+
+# Fragments used to build distinct chemicals
+_FRAGMENTS = ["C", "C(O)", "C(=O)", "C(N)", "CC", "C(C)"]
+
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<sbml xmlns="http://www.sbml.org/sbml/level3/version1/core" xmlns:groups="http://www.sbml.org/sbml/level3/version1/groups/version1" xmlns:fbc="http://www.sbml.org/sbml/level3/version1/fbc/version2" level="3" version="1" groups:required="false" fbc:required="false">
+  <model metaid={metaid} id="RP_model_{name}" name="{name}" substanceUnits="mole" timeUnits="second" extentUnits="mole" fbc:strict="true">
+    <listOfCompartments>
+      <compartment metaid="_c" sboTerm="SBO:0000290" id="c" name="cytosol" size="1" constant="true"/>
+    </listOfCompartments>
+    <listOfSpecies>
+"""
+
+SPECIES = """      <species metaid={metaid} id="{id}" name="{id}" compartment="c" initialConcentration="1" hasOnlySubstanceUnits="false" boundaryCondition="false" constant="false">
+        <annotation>
+          <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:bqbiol="http://biomodels.net/biology-qualifiers/">
+            <rdf:Description rdf:about="#{about}">
+              <bqbiol:is>
+                <rdf:Bag>
+                  <rdf:li rdf:resource="http://identifiers.org/metanetx.chemical/{id}"/>
+                </rdf:Bag>
+              </bqbiol:is>
+            </rdf:Description>
+            <rdf:BRSynth rdf:about="#{about}">
+              <brsynth:brsynth xmlns:brsynth="http://brsynth.eu">
+                <brsynth:smiles value={smiles}/>
+                <brsynth:inchi value={inchi}/>
+                <brsynth:inchikey value={inchikey}/>
+                <brsynth:thermo_standard_dg_formation>
+                  <brsynth:value value="{dg}"/>
+                  <brsynth:units value="kilojoule / mole"/>
+                </brsynth:thermo_standard_dg_formation>
+              </brsynth:brsynth>
+            </rdf:BRSynth>
+          </rdf:RDF>
+        </annotation>
+      </species>
+"""
+
+PARAMETERS = """    </listOfSpecies>
+    <listOfParameters>
+      <parameter sboTerm="SBO:0000625" id="BRS_FBC_10000_0" value="10000" constant="true"/>
+      <parameter sboTerm="SBO:0000625" id="BRS_FBC_0_0" value="0" constant="true"/>
+    </listOfParameters>
+    <listOfReactions>
+"""
+
+THERMO = """                <brsynth:thermo_dGm_prime>
+                  <brsynth:value value="{dg}"/>
+                  <brsynth:error value="{dg_error}"/>
+                  <brsynth:units value="kilojoule / mole"/>
+                </brsynth:thermo_dGm_prime>
+"""
+
+REACTION = """      <reaction metaid={metaid} sboTerm="SBO:0000176" id="{id}" reversible="false" fast="false" fbc:lowerFluxBound="BRS_FBC_0_0" fbc:upperFluxBound="BRS_FBC_10000_0">
+        <annotation>
+          <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:bqbiol="http://biomodels.net/biology-qualifiers/">
+            <rdf:Description rdf:about="#{about}">
+              <bqbiol:is>
+                <rdf:Bag>
+                  <rdf:li rdf:resource="http://identifiers.org/ec-code/{ec}"/>
+                </rdf:Bag>
+              </bqbiol:is>
+            </rdf:Description>
+            <rdf:BRSynth rdf:about="#{about}">
+              <brsynth:brsynth xmlns:brsynth="http://brsynth.eu">
+                <brsynth:smiles value={smiles}/>
+                <brsynth:transfo_id value="TRS_{rule}"/>
+                <brsynth:rule_ids>
+                  <brsynth:RR-02-{rule}-16-F/>
+                </brsynth:rule_ids>
+                <brsynth:tmpl_rxn_ids>
+                  <brsynth:MNXR{rule}/>
+                </brsynth:tmpl_rxn_ids>
+                <brsynth:rule_score value="{rule_score}"/>
+                <brsynth:idx_in_path value="{idx}"/>
+                <brsynth:selenzy/>
+{thermo}              </brsynth:brsynth>
+            </rdf:BRSynth>
+          </rdf:RDF>
+        </annotation>
+        <listOfReactants>
+{reactants}        </listOfReactants>
+        <listOfProducts>
+{products}        </listOfProducts>
+      </reaction>
+"""
+
+SPECIES_REF = (
+    '          <speciesReference species="{}" stoichiometry="1" constant="true"/>\n'
+)
+
+PATHWAY_GROUP = """    </listOfReactions>
+    <groups:listOfGroups>
+      <groups:group metaid={metaid} groups:id="rp_pathway" groups:kind="collection">
+        <annotation>
+          <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:bqbiol="http://biomodels.net/biology-qualifiers/">
+            <rdf:BRSynth rdf:about="#{about}">
+              <brsynth:brsynth xmlns:brsynth="http://brsynth.eu">
+                <brsynth:fba_fraction>
+                  <brsynth:value value="{fba}"/>
+                  <brsynth:units value="milimole / gDW / hour"/>
+                </brsynth:fba_fraction>
+{thermo}                <brsynth:global_score value="{global_score}"/>
+                <brsynth:target_id value="{target_id}"/>
+              </brsynth:brsynth>
+            </rdf:BRSynth>
+          </rdf:RDF>
+        </annotation>
+        <groups:listOfMembers>
+{members}        </groups:listOfMembers>
+      </groups:group>
+"""
+
+SPECIES_GROUP = """      <groups:group metaid={metaid} groups:id="{id}" groups:kind="collection">
+        <annotation>
+          <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:bqbiol="http://biomodels.net/biology-qualifiers/">
+            <rdf:BRSynth rdf:about="#{about}">
+              <brsynth:brsynth xmlns:brsynth="http://brsynth.eu"/>
+            </rdf:BRSynth>
+          </rdf:RDF>
+        </annotation>
+        <groups:listOfMembers>
+{members}        </groups:listOfMembers>
+      </groups:group>
+"""
+
+MEMBER = '          <groups:member groups:idRef="{}"/>\n'
+
+FOOTER = """    </groups:listOfGroups>
+  </model>
+</sbml>
+"""
+
+
+class Chemical:
+    """Chemical, with the identifiers written into rpSBML files."""
+
+    def __init__(self, id: str, smiles: str, inchi: str, inchikey: str):
+        self.id = id
+        self.smiles = smiles
+        self.inchi = inchi
+        self.inchikey = inchikey
+
+
+def _iter_chemicals(prefix: str):
+    """Yield distinct chemicals, built from chains of fragments.
+
+    :param prefix: prefix of chemical IDs
+    """
+    seen = set()
+    ids = count(1)
+    for length in count(3):
+        for fragments in product(_FRAGMENTS, repeat=length):
+            smiles = "OC(=O)" + "".join(fragments)
+            mol = Chem.MolFromSmiles(smiles)
+            if mol is None:
+                continue
+            inchikey = Chem.MolToInchiKey(mol)
+            if inchikey in seen:
+                continue
+            seen.add(inchikey)
+            yield Chemical(
+                f"{prefix}_{next(ids):010d}",
+                Chem.MolToSmiles(mol),
+                Chem.MolToInchi(mol),
+                inchikey,
+            )
+
+
+def _read_cofactors(cofactor_file: str) -> list:
+    """Read cofactors from a cofactor file having SMILES."""
+    cofactors = {}
+    with open(cofactor_file, "r", encoding="utf-8") as ifh:
+        for row in csv.DictReader(ifh, delimiter="\t"):
+            if row["ID"].startswith("#") or not row.get("SMILES") or not row["INCHI"]:
+                continue
+            # One chemical per structure
+            cofactors.setdefault(
+                row["INCHI"],
+                Chemical(row["ID"], row["SMILES"], row["INCHI"], row["INCHIKEY"]),
+            )
+    return list(cofactors.values())
+
+
+def _metaid(*tokens) -> str:
+    digest = hashlib.sha256("_".join(str(t) for t in tokens).encode()).hexdigest()
+    return "_" + digest
+
+
+class PathwayGenerator:
+    """Generate synthetic pathways.
+
+    :param steps: number of reactions per pathway
+    :param overlap: probability, for each chemical of a pathway except the
+        target, to be picked among chemicals shared by pathways rather than
+        being specific to the pathway
+    :param cofactors: average number of cofactors on each side of reactions
+    :param pool_size: number of chemicals shared by pathways
+    :param cofactor_file: file listing cofactors (ID, SMILES, INCHI, INCHIKEY)
+    :param seed: seed of the random generator
+    """
+
+    def __init__(
+        self,
+        steps: int = 4,
+        overlap: float = 0.5,
+        cofactors: float = 1.0,
+        pool_size: int = 100,
+        cofactor_file: str = DEFAULT_COFACTOR_FILE,
+        seed: int = 0,
+    ):
+        RDLogger.DisableLog("rdApp.*")
+        self.steps = steps
+        self.overlap = overlap
+        self.cofactors = cofactors
+        self.random = random.Random(seed)
+        self.target = self._make_target()
+        chemicals = _iter_chemicals("CMPD")
+        self.pool = [next(chemicals) for _ in range(pool_size)]
+        self._specific = chemicals
+        self.cofactor_pool = _read_cofactors(cofactor_file)
+
+    def _make_target(self) -> Chemical:
+        mol = Chem.MolFromSmiles(TARGET_SMILES)
+        return Chemical(
+            "TARGET_0000000001",
+            Chem.MolToSmiles(mol),
+            Chem.MolToInchi(mol),
+            Chem.MolToInchiKey(mol),
+        )
+
+    def _pick_chemical(self) -> Chemical:
+        if self.random.random() < self.overlap:
+            return self.random.choice(self.pool)
+        return next(self._specific)
+
+    def _pick_cofactors(self) -> list:
+        nb = int(self.cofactors)
+        if self.random.random() < self.cofactors - nb:
+            nb += 1
+        nb = min(nb, len(self.cofactor_pool))
+        return self.random.sample(self.cofactor_pool, nb)
+
+    def make_pathway(self, name: str) -> str:
+        """Generate one pathway.
+
+        :param name: name of the pathway
+        :return: the rpSBML content
+        """
+        # Chain of chemicals, from precursor to target
+        chain = []
+        while len(chain) < self.steps:
+            chemical = self._pick_chemical()
+            if chemical not in chain:
+                chain.append(chemical)
+        chain.append(self.target)
+        precursor = chain[0]
+
+        species = {chemical.id: chemical for chemical in chain}
+        reactions = []
+        completed = {}
+        for idx in range(1, self.steps + 1):
+            left_cofactors = self._pick_cofactors()
+            right_cofactors = [
+                cofactor
+                for cofactor in self._pick_cofactors()
+                if cofactor not in left_cofactors
+            ]
+            for cofactor in left_cofactors + right_cofactors:
+                species[cofactor.id] = cofactor
+                completed[cofactor.id] = cofactor
+            reactants = [chain[idx - 1]] + left_cofactors
+            products = [chain[idx]] + right_cofactors
+            reactions.append((idx, reactants, products))
+
+        parts = [HEADER.format(metaid=quoteattr(_metaid(name)), name=name)]
+        for chemical in species.values():
+            metaid = _metaid(name, chemical.id)
+            parts.append(
+                SPECIES.format(
+                    metaid=quoteattr(metaid),
+                    about=metaid,
+                    id=chemical.id,
+                    smiles=quoteattr(chemical.smiles),
+                    inchi=quoteattr(chemical.inchi),
+                    inchikey=quoteattr(chemical.inchikey),
+                    dg=round(self.random.uniform(-500, 100), 3),
+                )
+            )
+        parts.append(PARAMETERS)
+        dg_total = 0
+        for idx, reactants, products in reactions:
+            metaid = _metaid(name, idx)
+            smiles = ">>".join(
+                ".".join(chemical.smiles for chemical in side)
+                for side in (reactants, products)
+            )
+            # Same rule for the same transformation, so that reactions shared
+            # by pathways look the same
+            rule = hashlib.sha256(smiles.encode()).hexdigest()[:16]
+            dg = round(self.random.uniform(-50, 20), 3)
+            dg_total += dg
+            parts.append(
+                REACTION.format(
+                    metaid=quoteattr(metaid),
+                    about=metaid,
+                    id=f"rxn_{idx}",
+                    ec=f"{int(rule[:2], 16) % 7 + 1}.1.1.{int(rule[2:4], 16)}",
+                    smiles=quoteattr(smiles),
+                    rule=rule,
+                    rule_score=int(rule[4:8], 16) / 0xFFFF,
+                    idx=idx,
+                    thermo=THERMO.format(dg=dg, dg_error=1.0),
+                    reactants="".join(SPECIES_REF.format(c.id) for c in reactants),
+                    products="".join(SPECIES_REF.format(c.id) for c in products),
+                )
+            )
+        metaid = _metaid(name, "rp_pathway")
+        parts.append(
+            PATHWAY_GROUP.format(
+                metaid=quoteattr(metaid),
+                about=metaid,
+                fba=round(self.random.uniform(0, 2), 3),
+                thermo=THERMO.format(dg=round(dg_total, 3), dg_error=1.0),
+                global_score=round(self.random.random(), 6),
+                target_id=self.target.id,
+                members="".join(MEMBER.format(f"rxn_{r[0]}") for r in reactions),
+            )
+        )
+        groups = {
+            "rp_intermediate_species": [c.id for c in chain[1:-1]],
+            "rp_trunk_species": [c.id for c in chain],
+            "rp_completed_species": list(completed),
+            "rp_sink_species": [precursor.id] + list(completed),
+        }
+        for group_id, members in groups.items():
+            metaid = _metaid(name, group_id)
+            parts.append(
+                SPECIES_GROUP.format(
+                    metaid=quoteattr(metaid),
+                    about=metaid,
+                    id=group_id,
+                    members="".join(MEMBER.format(member) for member in members),
+                )
+            )
+        parts.append(FOOTER)
+        return "".join(parts)
+
+
+def generate(
+    out_path: str,
+    pathways: int = 100,
+    tar: bool = False,
+    **kwargs,
+) -> Path:
+    """Write a set of synthetic rpSBML files.
+
+    :param out_path: output folder, or tar file if tar is True
+    :param pathways: number of pathways
+    :param tar: whether to write files into a (gzipped) tar archive
+    :param kwargs: parameters of PathwayGenerator
+    :return: path to the folder or archive
+    """
+    generator = PathwayGenerator(**kwargs)
+    out_path = Path(out_path)
+    names = [f"{idx:06d}_0001" for idx in range(1, pathways + 1)]
+    if tar:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with tarfile.open(out_path, "w:gz") as ofh:
+            for name in names:
+                content = generator.make_pathway(name).encode("utf-8")
+                info = tarfile.TarInfo(f"rp_{name}.xml")
+                info.size = len(content)
+                ofh.addfile(info, BytesIO(content))
+    else:
+        out_path.mkdir(parents=True, exist_ok=True)
+        for name in names:
+            with open(out_path / f"rp_{name}.xml", "w", encoding="utf-8") as ofh:
+                ofh.write(generator.make_pathway(name))
+    return out_path
+
+
+def build_arg_parser(parser: argparse.ArgumentParser | None = None):
+    if parser is None:
+        parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--pathways",
+        type=int,
+        default=100,
+        help="Number of pathways. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=4,
+        help="Number of reactions per pathway. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--overlap",
+        type=float,
+        default=0.5,
+        help=(
+            "Probability, for each chemical other than the target, to be shared "
+            "with other pathways (0: nothing shared but the target and "
+            "cofactors). Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--cofactors",
+        type=float,
+        default=1.0,
+        help=(
+            "Average number of cofactors on each side of reactions. "
+            "Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=100,
+        help="Number of chemicals shared by pathways. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--cofactor-file",
+        default=str(DEFAULT_COFACTOR_FILE),
+        help="File listing cofactors to pick from. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Random seed. Default: %(default)s"
+    )
+    return parser
+
+
+def generator_kwargs(args) -> dict:
+    """Extract PathwayGenerator parameters from parsed arguments."""
+    return {
+        "steps": args.steps,
+        "overlap": args.overlap,
+        "cofactors": args.cofactors,
+        "pool_size": args.pool_size,
+        "cofactor_file": args.cofactor_file,
+        "seed": args.seed,
+    }
+
+
+if __name__ == "__main__":
+    parser = build_arg_parser()
+    parser.add_argument("output", help="Output folder, or tar file with --tar.")
+    parser.add_argument(
+        "--tar", action="store_true", help="Write files into a tar.gz archive."
+    )
+    args = parser.parse_args()
+    generate(
+        args.output, pathways=args.pathways, tar=args.tar, **generator_kwargs(args)
+    )
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""Measure the startup cost of the rpviz CLI.
+
+A module (by default the CLI one) is imported in fresh interpreters with
+`-X importtime`, and `python -m rpviz --help` is timed end to end. Results
+are reported as JSON, along with the slowest imports and the heavy
+dependencies (rplibs, RDKit, pandas...) pulled in at import, which should
+be none. The exit status is 1 if any heavy dependency is imported, or if
+the median import time exceeds --max-ms.
+"""
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Dependencies only needed by some stages, not to be imported at startup
+HEAVY_MODULES = ["rplibs", "cobra", "libsbml", "rdkit", "pandas", "bs4"]
+
+
+def parse_importtime(output: str) -> list:
+    """Parse the output of `python -X importtime`.
+
+    :param output: standard error of the interpreter
+    :return: list of (module, self time, cumulative time) tuples, times in
+        milliseconds, in the order of the output
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        imports.append((module.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return imports
+
+
+def measure(module: str = "rpviz.__main__", repeat: int = 5) -> dict:
+    """Import a module in fresh interpreters.
+
+    :param module: module to import
+    :param repeat: number of interpreters started
+    :return: dictionary of results
+    """
+    import_times = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imports = parse_importtime(process.stderr)
+        import_times.append(
+            next(cumulative for name, _, cumulative in imports if name == module)
+        )
+
+    help_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "rpviz", "--help"],
+            capture_output=True,
+            check=True,
+        )
+        help_times.append((time.perf_counter() - start) * 1000)
+
+    heavy_modules = sorted(
+        {
+            name.split(".")[0]
+            for name, _, _ in imports
+            if name.split(".")[0] in HEAVY_MODULES
+        }
+    )
+    slowest = sorted(imports, key=lambda entry: entry[1], reverse=True)[:10]
+    return {
+        "module": module,
+        "import_time_ms": {
+            "median": round(statistics.median(import_times), 1),
+            "min": round(min(import_times), 1),
+        },
+        "help_wall_time_ms": {
+            "median": round(statistics.median(help_times), 1),
+            "min": round(min(help_times), 1),
+        },
+        "heavy_modules": heavy_modules,
+        "slowest_imports": [
+            {"module": name, "self_ms": self_ms} for name, self_ms, _ in slowest
+        ],
+    }
+
+
+def __build_arg_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--module",
+        default="rpviz.__main__",
+        help="Module to import. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of runs. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="If set, fail when the median import time exceeds this value.",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="File where results are written (JSON). Default: standard output.",
+    )
+    return parser
+
+
+def __main():
+    args = __build_arg_parser().parse_args()
+    results = measure(args.module, repeat=args.repeat)
+    output = json.dumps(results, indent=4)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as ofh:
+            ofh.write(output + "\n")
+    if results["heavy_modules"]:
+        print(
+            f"Heavy modules imported: {', '.join(results['heavy_modules'])}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    if args.max_ms is not None and results["import_time_ms"]["median"] > args.max_ms:
+        print(
+            f"Import time above {args.max_ms} ms: "
+            f"{results['import_time_ms']['median']} ms",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    __main()
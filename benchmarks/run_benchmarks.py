@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""Time each stage of rpviz on a set of rpSBML files.
+
+Stages are run one after the other, as the CLI does: parse, merge, cofactor
+annotation, depiction, templates copy, JSON write and autonomous HTML. Each
+of them is measured by the profiler of rpviz (see rpviz.profiling.Profiler):
+wall and CPU times, and the peak resident memory of the process (and of
+worker processes) reached so far are reported as JSON. Input files are either
+generated (see generate_rpsbml.py) or given.
+"""
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from generate_rpsbml import build_arg_parser, generate, generator_kwargs
+
+from rpviz._version import __version__
+from rpviz.profiling import Profiler
+from rpviz.utils import (
+    NetworkMerger,
+    _iter_parsed_sources,
+    annotate_chemical_svg,
+    annotate_cofactors,
+    write_autonomous_html,
+    write_network_json,
+)
+from rpviz.Viewer import Viewer
+
+DEFAULT_COFACTOR_FILE = (
+    Path(__file__).resolve().parent.parent
+    / "rpviz"
+    / "data"
+    / "cofactors_mnx_202507.tsv"
+)
+
+
+def run(input_folder: Path, out_folder: Path, jobs: int = 1, compact: bool = False):
+    """Run all stages on a folder of rpSBML files.
+
+    :param input_folder: folder of rpSBML files
+    :param out_folder: folder where outputs are written
+    :param jobs: number of worker processes used to parse and draw
+    :param compact: whether to write network.json in compact mode
+    :return: dictionary of results
+    """
+    profiler = Profiler()
+    input_files = sorted(Path(input_folder).glob("*.xml"))
+
+    with profiler.stage("parse"):
+        parsed = list(_iter_parsed_sources(input_files, workers=jobs))
+    with profiler.stage("merge"):
+        merger = NetworkMerger()
+        for nodes, edges, pathway in parsed:
+            merger.add(nodes, edges, pathway)
+        network, pathways_info = merger.get_network()
+    del parsed
+    with profiler.stage("cofactors"):
+        network = annotate_cofactors(network, str(DEFAULT_COFACTOR_FILE))
+    with profiler.stage("depiction"):
+        network = annotate_chemical_svg(network, workers=jobs)
+    with profiler.stage("templates"):
+        Viewer(out_folder=str(out_folder)).copy_templates()
+    json_file = out_folder / "network.json"
+    with profiler.stage("json_write"), open(json_file, "w", encoding="utf-8") as ofh:
+        write_network_json(network, pathways_info, ofh, compact=compact)
+    html_file = out_folder / "autonomous.html"
+    with profiler.stage("autonomous_html"), open(html_file, "wb") as ofh:
+        write_autonomous_html(str(out_folder), ofh)
+
+    return {
+        "counts": {
+            "files": len(input_files),
+            "pathways": len(pathways_info),
+            "nodes": len(network["elements"]["nodes"]),
+            "edges": len(network["elements"]["edges"]),
+        },
+        "sizes_mb": {
+            name: round((out_folder / name).stat().st_size / 1024**2, 3)
+            for name in ("network.json", "autonomous.html")
+        },
+        "stages": profiler.stages,
+        "total_wall_time_s": profiler.report()["total_wall_time_s"],
+    }
+
+
+def __build_arg_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--input",
+        default=None,
+        help=(
+            "Folder of rpSBML files to use. If not set, files are generated "
+            "according to the generation options below."
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="File where results are written (JSON). Default: standard output.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="Write network.json in compact mode.",
+    )
+    build_arg_parser(parser.add_argument_group("generation options"))
+    return parser
+
+
+def __main():
+    args = __build_arg_parser().parse_args()
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        tmp_folder = Path(tmp_folder)
+        parameters = {"jobs": args.jobs, "compact_json": args.compact_json}
+        if args.input is None:
+            parameters["generation"] = {
+                "pathways": args.pathways,
+                **generator_kwargs(args),
+            }
+            start = time.perf_counter()
+            input_folder = generate(
+                tmp_folder / "inputs", pathways=args.pathways, **generator_kwargs(args)
+            )
+            parameters["generation"]["wall_time_s"] = round(
+                time.perf_counter() - start, 4
+            )
+        else:
+            input_folder = Path(args.input)
+            parameters["input"] = str(input_folder)
+        out_folder = tmp_folder / "outputs"
+        out_folder.mkdir()
+        results = {
+            "rpviz_version": __version__,
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": parameters,
+            **run(input_folder, out_folder, jobs=args.jobs, compact=args.compact_json),
+        }
+    output = json.dumps(results, indent=4)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as ofh:
+            ofh.write(output + "\n")
+
+
+if __name__ == "__main__":
+    __main()
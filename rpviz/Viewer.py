@@ -3,15 +3,83 @@
 
 """Handle html generation."""
 
+from __future__ import annotations
+
 __author__ = "Thomas Duigou"
 __license__ = "MIT"
 
 
-import pandas
-from shutil import copytree
+import os
+import logging
+import hashlib
+import tempfile
+
+from shutil import copy2, copytree, rmtree
 from pathlib import Path
 
-from bs4 import BeautifulSoup
+from rpviz._version import __version__
+from rpviz.cache import default_cache_folder
+
+logger = logging.getLogger(__name__)
+
+# Ways of putting template files into output folders
+ASSET_MODES = ["copy", "update", "hardlink", "symlink"]
+
+
+def _templates_fingerprint(folder: Path) -> str:
+    """Hash of the names and contents of files in a template folder."""
+    digest = hashlib.sha256()
+    for path in sorted(folder.rglob("*")):
+        if path.is_file():
+            digest.update(path.relative_to(folder).as_posix().encode("utf-8"))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def _is_link(path: Path) -> bool:
+    """Tell whether a file is a symlink, or a hardlink shared with other files."""
+    return path.is_symlink() or (path.exists() and path.stat().st_nlink > 1)
+
+
+def _copy_file(source: str | Path, target: str | Path) -> None:
+    """Copy a file, replacing the target rather than writing through it if
+    it is a link (e.g. into the asset store)."""
+    target = Path(target)
+    if _is_link(target):
+        target.unlink()
+    copy2(source, target)
+
+
+def _update_file(source: Path, target: Path) -> None:
+    """Copy a file, unless the target has the same size and modification time.
+
+    Links are always replaced by copies, even if up to date.
+    """
+    if target.exists() and not _is_link(target):
+        source_stat = source.stat()
+        target_stat = target.stat()
+        if target_stat.st_size == source_stat.st_size and int(
+            target_stat.st_mtime
+        ) == int(source_stat.st_mtime):
+            return
+    if target.is_symlink() or target.exists():
+        # Never write through a link into the asset store
+        target.unlink()
+    copy2(source, target)
+
+
+def _link_file(source: Path, target: Path, symbolic: bool) -> None:
+    """Link a file, unless the target already is a link to it."""
+    if target.is_symlink() or target.exists():
+        if symbolic and target.is_symlink() and os.readlink(target) == str(source):
+            return
+        if not symbolic and not target.is_symlink() and target.samefile(source):
+            return
+        target.unlink()
+    if symbolic:
+        os.symlink(source, target)
+    else:
+        os.link(source, target)
 
 
 class Viewer(object):
@@ -28,12 +96,90 @@ class Viewer(object):
         self.json_file = self.out_folder / "network_elements.js"
         self.html_file = self.out_folder / "index.html"
 
-    def copy_templates(self):
+    def copy_templates(
+        self, mode: str = "copy", asset_store: str | Path | None = None
+    ) -> None:
         """Copy the complete template tree
 
+        :param mode: how template files are put into the output folder:
+            "copy" copies all of them, "update" only copies files missing or
+            changed, "hardlink" and "symlink" link to files of a shared asset
+            store. Hardlinks fall back to copies if the asset store is on
+            another file system.
+        :param asset_store: folder of the asset store, used by "hardlink" and
+            "symlink" modes. Default: "assets" in the rpviz cache folder
         :return: None
         """
-        copytree(self.template_folder, self.out_folder, dirs_exist_ok=True)
+        if mode not in ASSET_MODES:
+            raise ValueError(f'Unknown asset mode "{mode}"')
+        if mode == "copy":
+            copytree(
+                self.template_folder,
+                self.out_folder,
+                dirs_exist_ok=True,
+                copy_function=_copy_file,
+            )
+            return
+
+        if mode == "update":
+            source_folder = self.template_folder
+        else:
+            source_folder = self.populate_asset_store(asset_store)
+        for source in sorted(source_folder.rglob("*")):
+            if source.is_dir():
+                continue
+            target = self.out_folder / source.relative_to(source_folder)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if mode == "update":
+                _update_file(source, target)
+                continue
+            try:
+                _link_file(source, target, symbolic=(mode == "symlink"))
+            except OSError as e:
+                if mode != "hardlink":
+                    raise
+                logger.warning(
+                    f"Unable to hardlink assets from {source_folder}, "
+                    f"copying them instead: {e}"
+                )
+                mode = "update"
+                _update_file(source, target)
+
+    def populate_asset_store(self, asset_store: str | Path | None = None) -> Path:
+        """Fill the asset store with the template tree, if not already done.
+
+        Each version of templates gets its own folder in the store, named
+        after the rpviz version and a hash of template files, so that
+        viewers written by other versions keep working.
+
+        :param asset_store: folder of the asset store. Default: "assets" in
+            the rpviz cache folder
+        :return: folder holding the template tree within the store
+        """
+        if asset_store is None:
+            asset_store = default_cache_folder() / "assets"
+        asset_store = Path(asset_store).resolve()
+        fingerprint = _templates_fingerprint(self.template_folder)
+        folder = asset_store / f"{__version__}-{fingerprint}"
+        if folder.is_dir():
+            return folder
+
+        # Filled aside then renamed, so that concurrent runs never link to a
+        # partial folder
+        asset_store.mkdir(parents=True, exist_ok=True)
+        tmp_folder = Path(tempfile.mkdtemp(prefix=".tmp-", dir=asset_store))
+        try:
+            copytree(self.template_folder, tmp_folder, dirs_exist_ok=True)
+            try:
+                os.rename(tmp_folder, folder)
+            except OSError:
+                # Filled in the meantime by another run
+                if not folder.is_dir():
+                    raise
+        finally:
+            if tmp_folder.exists():
+                rmtree(tmp_folder)
+        return folder
 
     def write_json_deprecated(self, dict_paths, scores):
         """
@@ -45,6 +191,9 @@ class Viewer(object):
         :param scores: {'score_type_1': {'pathway_1': int, 'pathway_2': int, ...}, ...}
         :return: None
         """
+        import pandas
+        from bs4 import BeautifulSoup
+
         # Get template content
         with open(self.template_html_file) as ifh:
             soup = BeautifulSoup(ifh, "html.parser")
@@ -0,0 +1,6 @@
+"""Visualize pathways from the RetroPath Suite."""
+
+from rpviz._version import __version__
+from rpviz.pipeline import Pipeline, PipelineResult
+
+__all__ = ["Pipeline", "PipelineResult", "__version__"]
@@ -9,21 +9,30 @@ __license__ = "MIT"
 
 import os
 import sys
-import json
 import logging
 import tarfile
+import sqlite3
 import argparse
-import tempfile
 
 from pathlib import Path
 
-from rpviz.utils import (
-    annotate_cofactors,
-    annotate_chemical_svg,
-    get_autonomous_html,
-    parse_all_pathways,
-)
-from rpviz.Viewer import Viewer
+from rpviz.utils import PATHWAY_SCORES, iter_tar_rpsbmls, write_autonomous_html
+from rpviz.cache import DepictionCache, ParseCache, default_cache_folder
+from rpviz.pipeline import DEPICTION_MODES, IncrementalBuild, Pipeline, watch_folder
+from rpviz.profiling import Profiler
+from rpviz.Viewer import ASSET_MODES, Viewer
+
+logger = logging.getLogger(__name__)
+
+PROFILE_STAGES = [
+    "parse",
+    "cofactors",
+    "depiction",
+    "layout",
+    "templates",
+    "write_json",
+    "autonomous_html",
+]
 
 
 def __build_arg_parser(prog="python -m rpviz.cli"):
@@ -74,6 +83,200 @@ def __build_arg_parser(prog="python -m rpviz.cli"):
             " containing all dependencies."
         ),
     )
+    parser.add_argument(
+        "--depiction-cache",
+        default=None,
+        help=(
+            "Optional file used to cache chemical depictions between runs, "
+            "eg ~/.cache/rpviz/depictions.sqlite. If not provided, depictions "
+            "are only cached in memory during the run."
+        ),
+    )
+    parser.add_argument(
+        "--depiction-cache-size",
+        type=int,
+        default=DepictionCache.DEFAULT_MAX_SIZE // 1024**2,
+        help=(
+            "Maximum size of the depiction cache, in MB. Least recently used "
+            "depictions are evicted first. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--no-depiction-cache",
+        action="store_true",
+        help=(
+            "If set, chemical depictions are neither read from nor stored in "
+            "the --depiction-cache file."
+        ),
+    )
+    parser.add_argument(
+        "--parse-cache",
+        default=None,
+        help=(
+            "Optional folder used to cache parsed rpSBML files between runs. "
+            "Only new or changed files are parsed again."
+        ),
+    )
+    parser.add_argument(
+        "--clear-parse-cache",
+        action="store_true",
+        help="If set, the parse cache is emptied before being used.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes used to parse rpSBML files "
+            "and to draw chemicals. "
+            "Use 0 to use all available cores. "
+            "Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help=(
+            "If set, network.json is written without indentation and without "
+            "empty fields, which makes it much smaller on large networks."
+        ),
+    )
+    parser.add_argument(
+        "--dedup-depictions",
+        action="store_true",
+        help=(
+            "If set, chemical depictions are written once into a table "
+            "referenced by nodes, instead of being repeated for each node "
+            "sharing a structure."
+        ),
+    )
+    parser.add_argument(
+        "--depiction",
+        default="svg",
+        choices=DEPICTION_MODES,
+        help=(
+            "How chemicals are depicted. svg: SVGs drawn by RDKit are "
+            "embedded. coords: only 2D coordinates and bonds of each "
+            "distinct structure are embedded, and drawn by the viewer when "
+            "displayed. coords gives much smaller outputs, and also depicts "
+            "reactions. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--precompute-layout",
+        action="store_true",
+        help=(
+            "If set, node positions are computed at build time (layered "
+            "layout rooted at targets) and used by the viewer as its default "
+            "layout, instead of laying out the network in the browser. The "
+            "redraw button still computes a fresh layout."
+        ),
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        help=(
+            "If set, network elements are split into shard files of this "
+            "number of pathways, that the viewer loads only when one of their "
+            "pathways is selected. Recommended for large runs. Cannot be used "
+            "along with --autonomous_html."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help=(
+            "Optional JSON file where the wall time, CPU time, peak memory and "
+            "number of processed items of each stage are written, along with "
+            "the parse time of each rpSBML file."
+        ),
+    )
+    parser.add_argument(
+        "--profile-stage",
+        default=None,
+        choices=PROFILE_STAGES,
+        help=(
+            "Stage to run under cProfile, if any. Requires --profile. "
+            "Stats are dumped in pstats format next to the --profile file, "
+            "as <profile>.<stage>.pstats."
+        ),
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help=(
+            "If set, the peak of Python allocations of each stage is also "
+            "measured. Requires --profile. Tracing allocations slows stages "
+            "down, so that their times are less accurate."
+        ),
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=None,
+        help=(
+            "If set, only this number of best pathways (see --rank-by) are "
+            "kept, which bounds memory use, output size and viewer load time."
+        ),
+    )
+    parser.add_argument(
+        "--rank-by",
+        default="global_score",
+        choices=PATHWAY_SCORES,
+        help=(
+            "Score to rank pathways by, with --top-k. Higher values rank "
+            "first, except for thermo_dg_m_gibbs and steps. Pathways without "
+            "this score rank last. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--assets",
+        default="copy",
+        choices=ASSET_MODES,
+        help=(
+            "How static assets (HTML, JS, CSS) are put into the output "
+            "folder: copy all of them, only copy missing or changed ones "
+            "(update), or link to a shared asset store (hardlink, symlink), "
+            "so that a viewer only costs its network.json. Linked assets must "
+            "not be edited. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--asset-store",
+        default=str(default_cache_folder() / "assets"),
+        help=(
+            "Folder of the shared asset store, used by --assets hardlink and "
+            "symlink. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "If set, the input folder is watched for new rpSBML files, and "
+            "the viewer is updated as they appear. Only new files are parsed "
+            "and annotated. Stop with Ctrl-C, or see --watch-timeout."
+        ),
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=2.0,
+        help=(
+            "Polling interval of --watch, in seconds. Files are taken once "
+            "they have not been modified for this time. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--watch-timeout",
+        type=float,
+        default=None,
+        help=(
+            "If set, --watch stops once no new file showed up for this "
+            "number of seconds."
+        ),
+    )
     parser.add_argument(
         "--hide-panels",
         action="store_true",
@@ -88,6 +291,27 @@ def __build_arg_parser(prog="python -m rpviz.cli"):
 
 def __run(args):
 
+    if args.shard_size is not None and args.autonomous_html is not None:
+        raise ValueError("--shard-size cannot be used along with --autonomous_html")
+    if args.depiction == "coords" and args.dedup_depictions:
+        raise ValueError("--dedup-depictions cannot be used along with coords")
+    if args.profile_stage is not None and args.profile is None:
+        raise ValueError("--profile-stage requires --profile")
+    if args.profile_memory and args.profile is None:
+        raise ValueError("--profile-memory requires --profile")
+    if args.watch:
+        if not os.path.isdir(args.input_rpSBMLs):
+            raise ValueError("--watch requires a folder as input")
+        if (
+            args.shard_size is not None
+            or args.profile is not None
+            or args.top_k is not None
+        ):
+            raise ValueError(
+                "--watch cannot be used along with --shard-size, --profile "
+                "or --top-k"
+            )
+
     # Make out folder if needed
     if not os.path.isfile(args.output_folder):
         try:
@@ -95,6 +319,59 @@ def __run(args):
         except IOError as e:
             raise e
 
+    # Cache of parsed files (if any)
+    parse_cache = None
+    if args.parse_cache is not None:
+        parse_cache = ParseCache(args.parse_cache)
+        if args.clear_parse_cache:
+            parse_cache.clear()
+
+    # Cofactor file (if any)
+    cofactor_file = None
+    if args.no_cofactor_detection:
+        logging.info("No cofactor detection requested, skipping.")
+    elif args.cofactor_file is not None and args.cofactor_file != "None":
+        logging.info("Using cofactor file: %s", args.cofactor_file)
+        cofactor_file = args.cofactor_file
+
+    # Cache of depictions (if any)
+    depiction_cache = None
+    if args.depiction_cache is not None and not args.no_depiction_cache:
+        try:
+            depiction_cache = DepictionCache(
+                args.depiction_cache, max_size=args.depiction_cache_size * 1024**2
+            )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(
+                f'Unable to use depiction cache "{args.depiction_cache}": {e}'
+            )
+
+    # Instrumentation (if requested)
+    profiler = Profiler(
+        enabled=args.profile is not None,
+        cprofile_stage=args.profile_stage,
+        cprofile_path=f"{args.profile}.{args.profile_stage}.pstats",
+        trace_memory=args.profile_memory,
+    )
+
+    if args.watch:
+        pipeline = Pipeline(
+            cofactor_file=cofactor_file,
+            depiction_cache=depiction_cache,
+            parse_cache=parse_cache,
+            workers=args.jobs,
+            compact_json=args.compact_json,
+            dedup_depictions=args.dedup_depictions,
+            depiction=args.depiction,
+            precompute_layout=args.precompute_layout,
+        )
+        try:
+            __watch(args, pipeline)
+        finally:
+            if depiction_cache is not None:
+                depiction_cache.close()
+        return
+
     # Both folder and tar file are valid inputs
     input_path = Path(args.input_rpSBMLs)
     if input_path.exists():
@@ -107,30 +384,10 @@ def __run(args):
                     "but no rpSBML files (xml extension) has been find. "
                     "Exit. "
                 )
-            # Parse
-            (
-                network,
-                pathways_info,
-            ) = parse_all_pathways(input_files=input_files)
         # Input is a tarfile
         elif input_path.is_file() and tarfile.is_tarfile(args.input_rpSBMLs):
-            with tempfile.TemporaryDirectory() as tmp_folder:
-                with tarfile.open(args.input_rpSBMLs, mode="r") as tar:
-                    tar.extractall(path=tmp_folder)
-                _ = list(Path(tmp_folder).glob("*.xml"))
-                if len(_) == 0:  # Possible if there is a root folder
-                    _ = list(Path(tmp_folder).glob("*/*.xml"))
-                # Removed tar "fork" files if any (name starts by ._)
-                input_files = [item for item in _ if not item.name.startswith("._")]
-                # Check if any file to parse
-                if len(input_files) == 0:
-                    msg = (
-                        f'No rpSBML files found in "{args.input_rpSBMLs}" '
-                        "tarfile. Exit."
-                    )
-                    raise FileNotFoundError(msg)
-                # Parse
-                network, pathways_info = parse_all_pathways(input_files=input_files)
+            # Stream rpSBMLs out of the archive, no extraction on disk
+            input_files = iter_tar_rpsbmls(args.input_rpSBMLs)
         # Input is something else
         else:
             raise NotImplementedError(
@@ -139,34 +396,80 @@ def __run(args):
     else:
         raise FileNotFoundError(f'"{args.input_rpSBMLs}" not found. Exit')
 
-    # Add cofactor annotations (if any)
-    if args.no_cofactor_detection:
-        logging.info("No cofactor detection requested, skipping.")
-    elif args.cofactor_file is not None and args.cofactor_file != "None":
-        logging.info("Using cofactor file: %s", args.cofactor_file)
-        network = annotate_cofactors(network, args.cofactor_file)
-
-    # Add chemical SVGs
-    network = annotate_chemical_svg(network)
+    # Parse, annotate cofactors and depictions
+    pipeline = Pipeline(
+        cofactor_file=cofactor_file,
+        depiction_cache=depiction_cache,
+        parse_cache=parse_cache,
+        workers=args.jobs,
+        compact_json=args.compact_json,
+        dedup_depictions=args.dedup_depictions,
+        top_k=args.top_k,
+        rank_by=args.rank_by,
+        depiction=args.depiction,
+        precompute_layout=args.precompute_layout,
+    )
+    try:
+        result = pipeline.run(input_files, profiler=profiler)
+    finally:
+        if depiction_cache is not None:
+            depiction_cache.close()
 
     # Build the Viewer
-    viewer = Viewer(out_folder=args.output_folder)
-    viewer.copy_templates()
+    with profiler.stage("templates"):
+        viewer = Viewer(out_folder=args.output_folder)
+        viewer.copy_templates(mode=args.assets, asset_store=args.asset_store)
 
     # Write info extracted from rpSBMLs
-    json_out_file = os.path.join(args.output_folder, "network.json")
-    with open(json_out_file, "w", encoding="utf-8") as ofh:
-        ofh.write("network = " + json.dumps(network, indent=4))
-        ofh.write(os.linesep)
-        ofh.write("pathways_info = " + json.dumps(pathways_info, indent=4))
+    with profiler.stage("write_json") as items:
+        result.write_network(args.output_folder, shard_size=args.shard_size)
+        items["bytes"] = os.path.getsize(
+            os.path.join(args.output_folder, "network.json")
+        )
 
     # Write single HTML if requested
     if args.autonomous_html is not None:
-        str_html = get_autonomous_html(
-            args.output_folder, hide_side_panels=args.hide_panels
-        )
-        with open(args.autonomous_html, "wb") as ofh:
-            ofh.write(str_html)
+        with profiler.stage("autonomous_html") as items:
+            with open(args.autonomous_html, "wb") as ofh:
+                write_autonomous_html(
+                    args.output_folder, ofh, hide_side_panels=args.hide_panels
+                )
+            items["bytes"] = os.path.getsize(args.autonomous_html)
+
+    # Write instrumentation report
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+
+def __watch(args, pipeline):
+    """Update the viewer as rpSBML files appear in the input folder."""
+    Viewer(out_folder=args.output_folder).copy_templates(
+        mode=args.assets, asset_store=args.asset_store
+    )
+    build = IncrementalBuild(pipeline)
+    logger.info(f'Watching "{args.input_rpSBMLs}" for new rpSBML files')
+    try:
+        for input_files in watch_folder(
+            args.input_rpSBMLs,
+            interval=args.watch_interval,
+            idle_timeout=args.watch_timeout,
+        ):
+            if build.add(input_files) == 0:
+                continue
+            result = build.result()
+            result.write_network(args.output_folder)
+            if args.autonomous_html is not None:
+                tmp_file = args.autonomous_html + ".tmp"
+                with open(tmp_file, "wb") as ofh:
+                    write_autonomous_html(
+                        args.output_folder, ofh, hide_side_panels=args.hide_panels
+                    )
+                os.replace(tmp_file, args.autonomous_html)
+            logger.info(f"Viewer updated, {len(build)} pathway(s) so far")
+    except KeyboardInterrupt:
+        pass
+    if len(build) == 0:
+        raise FileNotFoundError("No rpSBML files found in input. Exit.")
 
 
 def __cli():
@@ -176,8 +479,19 @@ def __cli():
         datefmt="%d/%m/%Y %H:%M:%S",
         format="%(asctime)s -- %(levelname)s -- %(message)s",
     )
+    # Subcommands, an input path of the same name can be given as ./serve
+    if sys.argv[1:2] == ["serve"]:
+        from rpviz.server import main
+
+        main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["batch"]:
+        from rpviz.batch import main
+
+        sys.exit(main(sys.argv[2:]))
     parser = __build_arg_parser()
     args = parser.parse_args()
+    logging.getLogger().setLevel(logging.DEBUG if args.debug else logging.INFO)
     __run(args)
 
 
@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+
+"""Build many viewers in one invocation, sharing caches between jobs."""
+
+from __future__ import annotations
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from rpviz.cache import DepictionCache, default_cache_folder
+from rpviz.pipeline import DEFAULT_COFACTOR_FILE, DEPICTION_MODES, Pipeline
+from rpviz.Viewer import ASSET_MODES
+
+logger = logging.getLogger(__name__)
+
+# Extensions stripped from input names to name output folders
+_ARCHIVE_SUFFIXES = [".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tar"]
+
+# Pipeline of each worker process, set up once by _init_worker
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_kwargs: dict) -> None:
+    """Set up the pipeline of a worker process, shared by its jobs."""
+    global _worker_pipeline
+    _worker_pipeline = Pipeline(**pipeline_kwargs)
+
+
+def _run_job(job: dict, write_kwargs: dict) -> dict:
+    """Build one viewer, within a worker process.
+
+    Errors are reported in the returned status rather than raised, so that
+    a broken input does not abort other jobs.
+
+    :param job: job, with "input", "output" and "autonomous_html" (None if
+        not requested) keys
+    :param write_kwargs: parameters of PipelineResult.write
+    :return: status of the job
+    """
+    status = dict(job)
+    start = time.perf_counter()
+    try:
+        result = _worker_pipeline.run(job["input"])
+        result.write(job["output"], **write_kwargs)
+        if job["autonomous_html"] is not None:
+            with open(job["autonomous_html"], "wb") as ofh:
+                ofh.write(result.html())
+        status["status"] = "ok"
+        status["pathways"] = len(result.pathways_info)
+    except Exception as e:  # noqa: BLE001, reported in the job status
+        status["status"] = "failed"
+        status["error"] = f"{type(e).__name__}: {e}"
+    status["wall_time_s"] = round(time.perf_counter() - start, 3)
+    return status
+
+
+def _input_name(path: str) -> str:
+    """Name of an input, without archive extensions."""
+    name = Path(path).name
+    for suffix in _ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def read_manifest(manifest: str) -> list[dict]:
+    """Read jobs from a manifest file.
+
+    The manifest is a tab-separated file, one job per line: input (tar
+    archive or folder of rpSBML files), output folder and, optionally, path
+    of the autonomous HTML. Empty lines and lines starting by "#" are
+    skipped. Relative paths are relative to the manifest.
+
+    :param manifest: path to the manifest
+    :return: list of jobs
+    """
+    root = Path(manifest).resolve().parent
+    jobs = []
+    with open(manifest, encoding="utf-8", newline="") as ifh:
+        for row in csv.reader(ifh, delimiter="\t"):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"Missing output folder in manifest line: {row}")
+            html = row[2] if len(row) > 2 and row[2].strip() else None
+            jobs.append(
+                {
+                    "input": str(root / row[0].strip()),
+                    "output": str(root / row[1].strip()),
+                    "autonomous_html": None if html is None else str(root / html),
+                }
+            )
+    return jobs
+
+
+def glob_jobs(patterns: list[str], output_root: str, autonomous_html: bool) -> list:
+    """Make jobs out of input patterns.
+
+    Each input (tar archive or folder of rpSBML files) gets an output folder
+    named after it within the output root, e.g. "inputs/target_1.tgz" is
+    written into "<output_root>/target_1".
+
+    :param patterns: glob patterns of inputs
+    :param output_root: folder where output folders are made
+    :param autonomous_html: whether to write an autonomous HTML next to each
+        output folder, as "<output_root>/<name>.html"
+    :return: list of jobs
+    """
+    inputs = sorted({path for pattern in patterns for path in glob.glob(pattern)})
+    jobs = []
+    for path in inputs:
+        out_folder = os.path.join(output_root, _input_name(path))
+        jobs.append(
+            {
+                "input": path,
+                "output": out_folder,
+                "autonomous_html": out_folder + ".html" if autonomous_html else None,
+            }
+        )
+    return jobs
+
+
+def run_batch(
+    jobs: list[dict],
+    pipeline_kwargs: dict,
+    write_kwargs: dict | None = None,
+    workers: int = 1,
+) -> list[dict]:
+    """Run jobs, each on its own input, across a pool of worker processes.
+
+    Each worker process holds a Pipeline shared by the jobs it runs, so
+    that the cofactor index, imports and depiction caches are set up once
+    per worker rather than once per job.
+
+    :param jobs: jobs, as returned by read_manifest or glob_jobs
+    :param pipeline_kwargs: parameters of the Pipeline of each worker
+    :param write_kwargs: parameters of PipelineResult.write
+    :param workers: number of worker processes, 1 runs jobs in the current
+        process, 0 or less uses all available cores
+    :return: status of each job, in the order of jobs
+    """
+    if write_kwargs is None:
+        write_kwargs = {}
+    if workers < 1:
+        workers = os.cpu_count() or 1
+    workers = min(workers, max(1, len(jobs)))
+
+    def log(status):
+        if status["status"] == "ok":
+            logger.info(
+                f'{status["input"]}: {status["pathways"]} pathway(s) '
+                f'in {status["wall_time_s"]} s'
+            )
+        else:
+            logger.error(f'{status["input"]}: {status["error"]}')
+
+    statuses = [None] * len(jobs)
+    if workers == 1:
+        _init_worker(pipeline_kwargs)
+        try:
+            for index, job in enumerate(jobs):
+                statuses[index] = _run_job(job, write_kwargs)
+                log(statuses[index])
+        finally:
+            _worker_pipeline.close()
+        return statuses
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(pipeline_kwargs,)
+    ) as executor:
+        futures = {
+            executor.submit(_run_job, job, write_kwargs): index
+            for index, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                statuses[index] = future.result()
+            except Exception as e:  # noqa: BLE001
+                # Worker process lost (e.g. killed), not an error of the job
+                statuses[index] = {
+                    **jobs[index],
+                    "status": "failed",
+                    "error": f"{type(e).__name__}: {e}",
+                    "wall_time_s": None,
+                }
+            log(statuses[index])
+    return statuses
+
+
+def build_arg_parser(prog="python -m rpviz batch"):
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build one viewer per input (tar archive or folder of rpSBML "
+            "files), sharing caches between jobs."
+        ),
+        prog=prog,
+    )
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument(
+        "--manifest",
+        default=None,
+        help=(
+            "Tab-separated file listing jobs, one per line: input, output "
+            "folder and, optionally, autonomous HTML file."
+        ),
+    )
+    inputs.add_argument(
+        "--inputs",
+        nargs="+",
+        default=None,
+        help=(
+            "Glob pattern(s) of inputs, e.g. 'campaign/*.tgz'. Each input is "
+            "written into a folder named after it within --output-root."
+        ),
+    )
+    parser.add_argument(
+        "--output-root",
+        default=None,
+        help="Folder where output folders are made, required with --inputs.",
+    )
+    parser.add_argument(
+        "--autonomous-html",
+        action="store_true",
+        help=(
+            "With --inputs, also write an autonomous HTML next to each output "
+            "folder, as <output-root>/<name>.html."
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes, ie of jobs run at the same time. "
+            "Use 0 to use all available cores. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--summary",
+        default=None,
+        help="Optional JSON file where the status of each job is written.",
+    )
+    parser.add_argument(
+        "--cofactor-file",
+        default=str(DEFAULT_COFACTOR_FILE),
+        help="File listing structures to consider as cofactors. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--no-cofactor-detection",
+        action="store_true",
+        help="If set, no cofactor detection will be performed.",
+    )
+    parser.add_argument(
+        "--depiction-cache",
+        default=None,
+        help=(
+            "Optional file used to cache chemical depictions, shared by jobs, "
+            "eg ~/.cache/rpviz/depictions.sqlite. If not provided, depictions "
+            "are only cached in the memory of each worker."
+        ),
+    )
+    parser.add_argument(
+        "--depiction-cache-size",
+        type=int,
+        default=DepictionCache.DEFAULT_MAX_SIZE // 1024**2,
+        help="Maximum size of the depiction cache, in MB. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--no-depiction-cache",
+        action="store_true",
+        help=(
+            "If set, depictions are only cached in the memory of each worker, "
+            "not on disk."
+        ),
+    )
+    parser.add_argument(
+        "--compact-json",
+        action="store_true",
+        help="If set, network.json files are written in compact mode.",
+    )
+    parser.add_argument(
+        "--dedup-depictions",
+        action="store_true",
+        help="If set, chemical depictions are written once into a table.",
+    )
+    parser.add_argument(
+        "--depiction",
+        default="svg",
+        choices=DEPICTION_MODES,
+        help=(
+            "How chemicals are depicted, see python -m rpviz --help. "
+            "Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--precompute-layout",
+        action="store_true",
+        help="If set, node positions are computed at build time.",
+    )
+    parser.add_argument(
+        "--hide-panels",
+        action="store_true",
+        help="If set, the panels will be hidden by default in autonomous HTMLs.",
+    )
+    parser.add_argument(
+        "--assets",
+        default="copy",
+        choices=ASSET_MODES,
+        help=(
+            "How static assets are put into output folders, see "
+            "python -m rpviz --help. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--asset-store",
+        default=str(default_cache_folder() / "assets"),
+        help="Folder of the shared asset store. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--debug", action="store_true", help="Turn on debug instructions"
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    """Run a batch, and print the status of each job.
+
+    :param argv: command line arguments, by default read from sys.argv
+    :return: exit status, 1 if any job failed
+    """
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    if args.manifest is not None:
+        jobs = read_manifest(args.manifest)
+    elif args.output_root is None:
+        parser.error("--output-root is required with --inputs")
+    else:
+        jobs = glob_jobs(args.inputs, args.output_root, args.autonomous_html)
+    if len(jobs) == 0:
+        raise FileNotFoundError("No input found. Exit.")
+
+    pipeline_kwargs = {
+        "cofactor_file": None if args.no_cofactor_detection else args.cofactor_file,
+        "depiction_cache": None if args.no_depiction_cache else args.depiction_cache,
+        "depiction_cache_size": args.depiction_cache_size * 1024**2,
+        "compact_json": args.compact_json,
+        "dedup_depictions": args.dedup_depictions,
+        "depiction": args.depiction,
+        "precompute_layout": args.precompute_layout,
+        "hide_panels": args.hide_panels,
+    }
+    write_kwargs = {"assets": args.assets, "asset_store": args.asset_store}
+    start = time.perf_counter()
+    statuses = run_batch(jobs, pipeline_kwargs, write_kwargs, workers=args.jobs)
+    wall_time = time.perf_counter() - start
+
+    # Summary
+    failed = [status for status in statuses if status["status"] != "ok"]
+    for status in statuses:
+        if status["status"] == "ok":
+            print(f'ok\t{status["input"]}\t{status["output"]}')
+        else:
+            print(f'FAILED\t{status["input"]}\t{status["error"]}')
+    print(
+        f"{len(statuses) - len(failed)} / {len(statuses)} job(s) succeeded "
+        f"in {wall_time:.1f} s"
+    )
+    if args.summary is not None:
+        with open(args.summary, "w", encoding="utf-8") as ofh:
+            json.dump(
+                {"wall_time_s": round(wall_time, 3), "jobs": statuses}, ofh, indent=4
+            )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stderr)
+    sys.exit(main())
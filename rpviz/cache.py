@@ -0,0 +1,352 @@
+"""Persistent caches used to speed up repeated rpviz runs."""
+
+from __future__ import annotations
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+
+from rpviz._version import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def default_cache_folder() -> Path:
+    """Return the per-user folder where rpviz caches are stored.
+
+    :return: path to the cache folder
+    """
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(base) / "rpviz"
+
+
+def _package_version(package: str) -> str:
+    """Return the installed version of a package, "unknown" if not found."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+class DepictionCache:
+    """On-disk store of chemical depictions.
+
+    Depictions are stored in a SQLite database and addressed by a hash of the
+    structure and of the rendering parameters (see make_key), so that a change
+    in the rendering (size, RDKit version, ...) never returns a stale picture.
+    The total size of stored depictions is capped: least recently used
+    entries are evicted first.
+    """
+
+    DEFAULT_MAX_SIZE = 256 * 1024**2  # bytes
+
+    def __init__(self, path: str | Path, max_size: int = DEFAULT_MAX_SIZE):
+        """Open (or create) the cache.
+
+        :param path: path to the SQLite database file
+        :param max_size: maximum total size of depictions to keep, in bytes
+        """
+        self.path = Path(path)
+        self.max_size = max_size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS depictions ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS depictions_last_access"
+                " ON depictions (last_access)"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def make_key(structure: str, **params) -> str:
+        """Build the key addressing a depiction.
+
+        :param structure: structure depicted (e.g. an InChI)
+        :param params: rendering parameters the depiction depends on
+        :return: hexadecimal digest
+        """
+        payload = json.dumps([structure, params], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """Get depictions from the cache.
+
+        Entries found are marked as recently used.
+
+        :param keys: keys to look for
+        :return: dictionary of found depictions, by key
+        """
+        found = {}
+        keys = list(set(keys))
+        # Stay below the maximum number of SQL variables
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            query = "SELECT key, value FROM depictions WHERE key IN ({})".format(
+                ",".join("?" * len(chunk))
+            )
+            found.update(self._conn.execute(query, chunk).fetchall())
+        if found:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE depictions SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        return found
+
+    def get(self, key: str) -> str | None:
+        """Get one depiction from the cache.
+
+        :param key: key to look for
+        :return: the depiction, None if not found
+        """
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict[str, str]) -> None:
+        """Store depictions, then evict old entries if needed.
+
+        :param items: depictions to store, by key
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO depictions (key, value, size, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                [(key, value, len(value), now) for key, value in items.items()],
+            )
+        self._evict()
+
+    def put(self, key: str, value: str) -> None:
+        """Store one depiction.
+
+        :param key: key of the depiction
+        :param value: the depiction
+        """
+        self.put_many({key: value})
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._conn:
+            self._conn.execute("DELETE FROM depictions")
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the size cap is honoured."""
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM depictions"
+        ).fetchone()
+        if total <= self.max_size:
+            return
+        to_delete = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM depictions ORDER BY last_access ASC"
+        ):
+            to_delete.append((key,))
+            total -= size
+            if total <= self.max_size:
+                break
+        with self._conn:
+            self._conn.executemany("DELETE FROM depictions WHERE key = ?", to_delete)
+        logger.info(f"Evicted {len(to_delete)} entries from depiction cache")
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        self._conn.close()
+
+
+class MemoryDepictionCache:
+    """In-memory store of chemical depictions.
+
+    Same interface as DepictionCache, for long-running processes that do not
+    need depictions to outlive them. The total size of stored depictions is
+    capped: least recently used entries are evicted first.
+    """
+
+    DEFAULT_MAX_SIZE = DepictionCache.DEFAULT_MAX_SIZE
+
+    make_key = staticmethod(DepictionCache.make_key)
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+        """Create the cache.
+
+        :param max_size: maximum total size of depictions to keep, in bytes
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, str]:
+        """Get depictions from the cache.
+
+        Entries found are marked as recently used.
+
+        :param keys: keys to look for
+        :return: dictionary of found depictions, by key
+        """
+        found = {}
+        for key in keys:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[key] = self._entries[key]
+        return found
+
+    def get(self, key: str) -> str | None:
+        """Get one depiction from the cache.
+
+        :param key: key to look for
+        :return: the depiction, None if not found
+        """
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict[str, str]) -> None:
+        """Store depictions, then evict old entries if needed.
+
+        :param items: depictions to store, by key
+        """
+        for key, value in items.items():
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._size += len(value)
+        while self._size > self.max_size:
+            _, value = self._entries.popitem(last=False)
+            self._size -= len(value)
+
+    def put(self, key: str, value: str) -> None:
+        """Store one depiction.
+
+        :param key: key of the depiction
+        :param value: the depiction
+        """
+        self.put_many({key: value})
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._entries.clear()
+        self._size = 0
+
+    def close(self) -> None:
+        """Nothing to release, for compatibility with DepictionCache."""
+
+
+class ParseCache:
+    """On-disk store of parsed rpSBML files.
+
+    Each entry holds the (nodes, edges, pathway) output of parse_one_pathway
+    for one rpSBML file, stored as JSON. Entries are addressed by a hash of
+    the file content and of the rpviz and rplibs versions, so that changed
+    files and upgrades never return stale results. Hits and misses are
+    counted for reporting.
+    """
+
+    # Entries are sharded into folders named after the first two hex digits of keys
+    _SHARD_NAME = re.compile(r"[0-9a-f]{2}")
+
+    def __init__(self, folder: str | Path):
+        """Open (or create) the cache.
+
+        :param folder: folder where entries are stored
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._salt = f"rpviz={__version__};rplibs={_package_version('rplibs')};"
+
+    def make_key(self, content: bytes) -> str:
+        """Build the key addressing the parsed content of a file.
+
+        :param content: content of the rpSBML file
+        :return: hexadecimal digest
+        """
+        digest = hashlib.sha256(self._salt.encode("utf-8"))
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> tuple | None:
+        """Get a parsed file from the cache.
+
+        :param key: key to look for
+        :return: tuple of (nodes, edges, pathway), None if not found
+        """
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as ifh:
+                entry = json.load(ifh)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["nodes"], entry["edges"], entry["pathway"]
+
+    def put(self, key: str, parsed: tuple) -> None:
+        """Store a parsed file.
+
+        :param key: key of the file
+        :param parsed: tuple of (nodes, edges, pathway)
+        """
+        nodes, edges, pathway = parsed
+        path = self._entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write then rename, so that concurrent readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as ofh:
+                json.dump({"nodes": nodes, "edges": edges, "pathway": pathway}, ofh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def clear(self) -> None:
+        """Remove all entries.
+
+        Only the shard folders of the cache are removed, other content of
+        the folder is left untouched.
+        """
+        for child in self.folder.iterdir():
+            if child.is_dir() and self._SHARD_NAME.fullmatch(child.name):
+                shutil.rmtree(child)
+        self.hits = 0
+        self.misses = 0
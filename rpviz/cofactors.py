@@ -0,0 +1,170 @@
+"""Detection of cofactors among chemicals."""
+
+from __future__ import annotations
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import csv
+from collections import deque
+from collections.abc import Iterable
+
+
+class _AhoCorasick:
+    """Multi-pattern substring matcher.
+
+    Tells whether a text contains at least one of the patterns in a single
+    pass over the text, whatever the number of patterns.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        """Build the automaton.
+
+        :param patterns: non-empty strings to look for
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._final = [False]
+        # Trie of patterns
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._final.append(False)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._final[state] = True
+        # Failure links, breadth first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                if self._final[self._fail[next_state]]:
+                    self._final[next_state] = True
+
+    def search(self, text: str) -> bool:
+        """Tell whether text contains any of the patterns.
+
+        :param text: text to scan
+        :return: True if at least one pattern is found
+        """
+        goto = self._goto
+        fail = self._fail
+        final = self._final
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if final[state]:
+                return True
+        return False
+
+
+class CofactorIndex:
+    """Compiled set of cofactors, built once and queried for each chemical.
+
+    A chemical is a cofactor if one of the cofactor InChIs is a substring of
+    its InChI (so that cofactors can be described by their main InChI layers
+    only), or if one of its labels is a cofactor ID.
+    """
+
+    def __init__(
+        self,
+        inchis: Iterable[str] = (),
+        ids: Iterable[str] = (),
+        inchikeys: dict | None = None,
+    ):
+        """Build the index.
+
+        :param inchis: cofactor InChIs, or InChI prefixes
+        :param ids: cofactor IDs
+        :param inchikeys: cofactor InChIs by InChIKey, used as a shortcut
+            before scanning InChIs
+        """
+        self.inchis = {inchi for inchi in inchis if inchi != ""}
+        self.ids = set(ids)
+        self.inchikeys = {}
+        for inchikey, inchis_ in (inchikeys or {}).items():
+            self.inchikeys[inchikey] = set(inchis_) & self.inchis
+        self._matcher = _AhoCorasick(self.inchis)
+
+    @classmethod
+    def from_file(cls, cofactor_file: str) -> CofactorIndex:
+        """Build the index from a cofactor file.
+
+        The file is a tab separated file with at least the "ID" and "INCHI"
+        columns, and optionally an "INCHIKEY" column. The ID column can list
+        several IDs separated by commas. Rows whose ID starts by "#" are
+        skipped.
+
+        :param cofactor_file: path to the cofactor file
+        :return: the index
+        """
+        inchis = set()
+        ids = set()
+        inchikeys = {}
+        with open(cofactor_file, "r", encoding="utf-8") as ifh:
+            reader = csv.DictReader(ifh, delimiter="\t")
+            for row in reader:
+                if row["ID"].startswith("#"):
+                    # Skip row starting with comments
+                    continue
+                if row["INCHI"] != "":
+                    # InChI describing cofactors
+                    inchis.add(row["INCHI"])
+                    if row.get("INCHIKEY"):
+                        inchikeys.setdefault(row["INCHIKEY"], set()).add(row["INCHI"])
+                if row["ID"] != "":
+                    # IDs of cofactors
+                    ids |= set(row["ID"].split(","))
+        return cls(inchis=inchis, ids=ids, inchikeys=inchikeys)
+
+    def match_structure(self, inchi: str | None, inchikey: str | None = None) -> bool:
+        """Tell whether a structure is a cofactor.
+
+        :param inchi: InChI of the chemical
+        :param inchikey: InChIKey of the chemical, if known
+        :return: True if one of the cofactor InChIs is found in inchi
+        """
+        if inchi is None:
+            return False
+        if inchi in self.inchis:
+            return True
+        for cof_inchi in self.inchikeys.get(inchikey, ()):
+            if cof_inchi in inchi:
+                return True
+        return self._matcher.search(inchi)
+
+    def match_labels(self, labels: Iterable[str] | None) -> bool:
+        """Tell whether one of the labels is a cofactor ID.
+
+        :param labels: labels of the chemical
+        :return: True if one of the labels is a cofactor ID
+        """
+        if not labels:
+            return False
+        return not self.ids.isdisjoint(labels)
+
+    def match(
+        self,
+        inchi: str | None,
+        labels: Iterable[str] | None = None,
+        inchikey: str | None = None,
+    ) -> bool:
+        """Tell whether a chemical is a cofactor, from structure or labels.
+
+        :param inchi: InChI of the chemical
+        :param labels: labels of the chemical
+        :param inchikey: InChIKey of the chemical, if known
+        :return: True if the chemical is a cofactor
+        """
+        return self.match_structure(inchi, inchikey) or self.match_labels(labels)
@@ -0,0 +1,537 @@
+"""In-process pipeline, from rpSBML files to the viewer."""
+
+from __future__ import annotations
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import logging
+import os
+import tarfile
+import time
+from collections.abc import Iterator
+from io import BytesIO, StringIO
+from pathlib import Path
+
+from rpviz.cache import DepictionCache, MemoryDepictionCache, ParseCache
+from rpviz.cofactors import CofactorIndex
+from rpviz.profiling import Profiler
+from rpviz.utils import (
+    NetworkMerger,
+    _iter_parsed_sources,
+    annotate_chemical_svg,
+    annotate_cofactors,
+    annotate_layout,
+    annotate_structures,
+    deduplicate_depictions,
+    iter_tar_rpsbmls,
+    parse_all_pathways,
+    write_autonomous_html,
+    write_network_json,
+    write_network_shards,
+)
+from rpviz.Viewer import Viewer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COFACTOR_FILE = (
+    Path(__file__).resolve().parent / "data" / "cofactors_mnx_202507.tsv"
+)
+TEMPLATE_FOLDER = Path(__file__).resolve().parent / "templates"
+
+# Ways chemicals are depicted: SVGs drawn by RDKit, or 2D structures drawn
+# by the viewer
+DEPICTION_MODES = ["svg", "coords"]
+
+# Magic numbers of compressed data, and of the tar format
+_ARCHIVE_MAGICS = [b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00"]
+
+
+def _is_archive(content: bytes) -> bool:
+    """Tell whether content is a (compressed) tar archive rather than SBML."""
+    if any(content.startswith(magic) for magic in _ARCHIVE_MAGICS):
+        return True
+    return content[257:262] == b"ustar"
+
+
+def iter_sources(sources) -> Iterator[str | bytes]:
+    """Yield rpSBML file paths or contents out of any kind of input.
+
+    Accepted inputs are:
+    - path to an rpSBML file, to a folder of rpSBML files, or to a tar
+      archive of rpSBML files (str or Path),
+    - rpSBML content (str starting by "<", or bytes),
+    - tar archive content (bytes),
+    - binary or text file handle, read as content,
+    - any iterable of the above.
+
+    :param sources: input(s)
+    :return: iterator over file paths and contents
+    """
+    if hasattr(sources, "read"):
+        sources = sources.read()
+    if isinstance(sources, str) and sources.lstrip().startswith("<"):
+        sources = sources.encode("utf-8")
+    if isinstance(sources, bytes):
+        if _is_archive(sources):
+            yield from iter_tar_rpsbmls(BytesIO(sources))
+        else:
+            yield sources
+    elif isinstance(sources, (str, Path)):
+        path = Path(sources)
+        if path.is_dir():
+            yield from (str(file) for file in sorted(path.glob("*.xml")))
+        elif not path.is_file():
+            raise FileNotFoundError(f'"{sources}" not found')
+        # Only files not named as rpSBML are probed for the tar format
+        elif path.suffix != ".xml" and tarfile.is_tarfile(path):
+            yield from iter_tar_rpsbmls(str(path))
+        else:
+            yield str(path)
+    else:
+        for source in sources:
+            yield from iter_sources(source)
+
+
+class PipelineResult:
+    """Network built by a Pipeline, ready to be written or embedded."""
+
+    def __init__(
+        self,
+        network: dict,
+        pathways_info: dict,
+        depictions: dict | None = None,
+        compact: bool = False,
+        hide_panels: bool = False,
+        structures: dict | None = None,
+    ):
+        """Store the result.
+
+        :param network: network of elements
+        :param pathways_info: pathway information
+        :param depictions: table of depictions referenced by nodes, if
+            depictions are deduplicated
+        :param compact: whether to write network.json in compact mode
+        :param hide_panels: whether to hide side panels by default in HTML
+        :param structures: table of 2D structures referenced by nodes, if
+            depictions are drawn by the viewer
+        """
+        self.network = network
+        self.pathways_info = pathways_info
+        self.depictions = depictions
+        self.compact = compact
+        self.hide_panels = hide_panels
+        self.structures = structures
+
+    def network_json(self) -> str:
+        """Return the content of network.json, as read by the viewer."""
+        ofh = StringIO()
+        write_network_json(
+            self.network,
+            self.pathways_info,
+            ofh,
+            compact=self.compact,
+            depictions=self.depictions,
+            structures=self.structures,
+        )
+        return ofh.getvalue()
+
+    def html(self) -> bytes:
+        """Return the autonomous HTML page, with all assets embedded."""
+        ofh = BytesIO()
+        write_autonomous_html(
+            str(TEMPLATE_FOLDER),
+            ofh,
+            hide_side_panels=self.hide_panels,
+            network=BytesIO(self.network_json().encode("utf-8")),
+        )
+        return ofh.getvalue()
+
+    def write(
+        self,
+        out_folder: str | Path,
+        shard_size: int | None = None,
+        assets: str = "copy",
+        asset_store: str | Path | None = None,
+    ) -> None:
+        """Write the viewer (templates and network.json) into a folder.
+
+        :param out_folder: output folder
+        :param shard_size: if given, network elements are split into shards
+            of this number of pathways (see write_network_shards)
+        :param assets: how templates are put into the folder, see
+            Viewer.copy_templates
+        :param asset_store: folder of the shared asset store, see
+            Viewer.copy_templates
+        """
+        os.makedirs(out_folder, exist_ok=True)
+        Viewer(out_folder=out_folder).copy_templates(
+            mode=assets, asset_store=asset_store
+        )
+        self.write_network(out_folder, shard_size=shard_size)
+
+    def write_network(
+        self, out_folder: str | Path, shard_size: int | None = None
+    ) -> None:
+        """Write network.json (and shards, if any) into a viewer folder.
+
+        :param out_folder: viewer folder
+        :param shard_size: if given, network elements are split into shards
+            of this number of pathways (see write_network_shards)
+        """
+        if shard_size is not None:
+            write_network_shards(
+                self.network,
+                self.pathways_info,
+                out_folder,
+                shard_size=shard_size,
+                compact=self.compact,
+                depictions=self.depictions,
+                structures=self.structures,
+            )
+            return
+        # Written aside then renamed, so that the viewer never reads a
+        # partial file
+        json_out_file = os.path.join(out_folder, "network.json")
+        with open(json_out_file + ".tmp", "w", encoding="utf-8") as ofh:
+            write_network_json(
+                self.network,
+                self.pathways_info,
+                ofh,
+                compact=self.compact,
+                depictions=self.depictions,
+                structures=self.structures,
+            )
+        os.replace(json_out_file + ".tmp", json_out_file)
+
+
+class Pipeline:
+    """Build viewer networks from rpSBML files, within the current process.
+
+    Configuration and caches (cofactor index, depictions, parsed files) are
+    set up once and kept between runs, so that repeated runs in a
+    long-running process are cheap.
+
+    Example
+    -------
+    >>> with Pipeline(workers=4) as pipeline:
+    ...     result = pipeline.run("pathways.tar")
+    ...     html = result.html()
+    """
+
+    def __init__(
+        self,
+        cofactor_file: str | Path | CofactorIndex | None = DEFAULT_COFACTOR_FILE,
+        depiction_cache: str | Path | DepictionCache | MemoryDepictionCache = None,
+        depiction_cache_size: int = DepictionCache.DEFAULT_MAX_SIZE,
+        parse_cache: str | Path | ParseCache | None = None,
+        workers: int = 1,
+        compact_json: bool = False,
+        dedup_depictions: bool = False,
+        hide_panels: bool = False,
+        top_k: int | None = None,
+        rank_by: str = "global_score",
+        depiction: str = "svg",
+        precompute_layout: bool = False,
+    ):
+        """Set up the pipeline.
+
+        :param cofactor_file: file listing cofactors, or cofactor index
+            already built. If None, cofactors are not annotated.
+        :param depiction_cache: path to an on-disk depiction cache (see
+            DepictionCache), or cache object. By default, depictions are
+            cached in memory, for the lifetime of the pipeline.
+        :param depiction_cache_size: maximum total size of cached
+            depictions, in bytes, when the cache is set up by the pipeline
+        :param parse_cache: folder of an on-disk cache of parsed files, or
+            cache object. By default, parsed files are not cached.
+        :param workers: number of worker processes used to parse and draw,
+            0 or less uses all available cores
+        :param compact_json: whether to write network.json in compact mode
+        :param dedup_depictions: whether to write depictions once into a
+            table referenced by nodes
+        :param hide_panels: whether to hide side panels by default in HTML
+        :param top_k: if given, only the best top_k pathways of each run are
+            kept (see parse_all_pathways)
+        :param rank_by: score to rank pathways by, when top_k is given
+        :param depiction: "svg" to embed SVG depictions drawn by RDKit,
+            "coords" to only embed the 2D structures of chemicals, drawn by
+            the viewer (see annotate_structures)
+        :param precompute_layout: whether to compute node positions, used by
+            the viewer as its default layout (see annotate_layout)
+        """
+        if depiction not in DEPICTION_MODES:
+            raise ValueError(f'Unknown depiction mode "{depiction}".')
+        if depiction == "coords" and dedup_depictions:
+            raise ValueError("Depictions can only be deduplicated in svg mode.")
+        self.cofactor_file = cofactor_file
+        self.workers = workers
+        self.compact_json = compact_json
+        self.dedup_depictions = dedup_depictions
+        self.hide_panels = hide_panels
+        self.top_k = top_k
+        self.rank_by = rank_by
+        self.depiction = depiction
+        self.precompute_layout = precompute_layout
+        self._cofactor_index = None
+
+        # Caches set up here are closed along with the pipeline
+        self._owned_caches = []
+        if depiction_cache is None:
+            depiction_cache = MemoryDepictionCache(max_size=depiction_cache_size)
+        elif isinstance(depiction_cache, (str, Path)):
+            depiction_cache = DepictionCache(
+                depiction_cache, max_size=depiction_cache_size
+            )
+            self._owned_caches.append(depiction_cache)
+        self.depiction_cache = depiction_cache
+        if isinstance(parse_cache, (str, Path)):
+            parse_cache = ParseCache(parse_cache)
+        self.parse_cache = parse_cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def cofactor_index(self) -> CofactorIndex | None:
+        """Cofactor index, built on first use. None if no cofactor file."""
+        if self._cofactor_index is None and self.cofactor_file is not None:
+            if isinstance(self.cofactor_file, CofactorIndex):
+                self._cofactor_index = self.cofactor_file
+            elif not os.path.exists(self.cofactor_file):
+                logger.error("Cofactor file not found: %s", self.cofactor_file)
+                self.cofactor_file = None
+            else:
+                self._cofactor_index = CofactorIndex.from_file(self.cofactor_file)
+        return self._cofactor_index
+
+    def run(self, sources, profiler: Profiler = None) -> PipelineResult:
+        """Build the network of a set of rpSBML files.
+
+        :param sources: rpSBML files, see iter_sources for accepted inputs
+        :param profiler: profiler recording the parse, cofactors and
+            depiction stages, if any
+        :return: the result
+        """
+        if profiler is None:
+            profiler = Profiler(enabled=False)
+
+        # Parse
+        with profiler.stage("parse") as items:
+            if self.parse_cache is not None:
+                hits, misses = self.parse_cache.hits, self.parse_cache.misses
+            network, pathways_info = parse_all_pathways(
+                input_files=iter_sources(sources),
+                workers=self.workers,
+                cache=self.parse_cache,
+                parse_times=profiler.parse_times,
+                top_k=self.top_k,
+                rank_by=self.rank_by,
+            )
+            items["pathways"] = len(pathways_info)
+            items["nodes"] = len(network["elements"]["nodes"])
+            items["edges"] = len(network["elements"]["edges"])
+            if self.parse_cache is not None:
+                items["parse_cache_hits"] = self.parse_cache.hits - hits
+                items["parse_cache_misses"] = self.parse_cache.misses - misses
+        if len(pathways_info) == 0:
+            raise FileNotFoundError("No rpSBML files found in input. Exit.")
+
+        # Add cofactor annotations (if any)
+        if self.cofactor_index is not None:
+            with profiler.stage("cofactors") as items:
+                network = annotate_cofactors(network, self.cofactor_index)
+                items["cofactors"] = sum(
+                    1
+                    for node in network["elements"]["nodes"]
+                    if node["data"]["cofactor"]
+                )
+
+        # Add chemical SVGs, or structures
+        with profiler.stage("depiction") as items:
+            depictions = None
+            structures = None
+            if self.depiction == "coords":
+                structures = annotate_structures(
+                    network, cache=self.depiction_cache, workers=self.workers
+                )
+            else:
+                network = annotate_chemical_svg(
+                    network, cache=self.depiction_cache, workers=self.workers
+                )
+                if self.dedup_depictions:
+                    depictions = deduplicate_depictions(network)
+            items["depictions"] = sum(
+                1 for node in network["elements"]["nodes"] if node["data"]["svg"]
+            )
+
+        # Add node positions (if requested)
+        if self.precompute_layout:
+            with profiler.stage("layout") as items:
+                network = annotate_layout(network)
+                items["nodes"] = len(network["elements"]["nodes"])
+
+        return PipelineResult(
+            network,
+            pathways_info,
+            depictions=depictions,
+            compact=self.compact_json,
+            hide_panels=self.hide_panels,
+            structures=structures,
+        )
+
+    def close(self) -> None:
+        """Release caches set up by the pipeline."""
+        for cache in self._owned_caches:
+            cache.close()
+        self._owned_caches = []
+
+
+class IncrementalBuild:
+    """Network of a Pipeline, growing as rpSBML files are added.
+
+    Only nodes of pathways added since the last result are annotated
+    (cofactors, depictions), annotations of other nodes are kept from
+    previous results.
+
+    Example
+    -------
+    >>> build = IncrementalBuild(pipeline)
+    >>> build.add(["pathway_1.xml", "pathway_2.xml"])
+    >>> build.result().write_network("viewer")
+    >>> build.add(["pathway_3.xml"])
+    >>> build.result().write_network("viewer")
+    """
+
+    def __init__(self, pipeline: Pipeline):
+        """Start an empty network.
+
+        :param pipeline: pipeline providing settings and caches
+        """
+        self.pipeline = pipeline
+        self._merger = NetworkMerger()
+        self._annotations = {}
+        self._touched = set()
+
+    def __len__(self) -> int:
+        """Number of pathways added so far."""
+        return len(self._merger.pathways_info)
+
+    def add(self, sources) -> int:
+        """Parse and merge rpSBML files.
+
+        :param sources: rpSBML files, see iter_sources for accepted inputs
+        :return: number of pathways added
+        """
+        count = 0
+        for nodes, edges, pathway in _iter_parsed_sources(
+            iter_sources(sources),
+            workers=self.pipeline.workers,
+            cache=self.pipeline.parse_cache,
+        ):
+            self._merger.add(nodes, edges, pathway)
+            self._touched.update(nodes.keys())
+            count += 1
+        return count
+
+    def result(self) -> PipelineResult:
+        """Build the network of pathways added so far.
+
+        :return: the result
+        """
+        network, pathways_info = self._merger.get_network()
+        if len(pathways_info) == 0:
+            raise FileNotFoundError("No rpSBML files found in input. Exit.")
+        nodes = network["elements"]["nodes"]
+
+        # Annotate nodes changed since the last result
+        touched = {
+            "elements": {
+                "nodes": [node for node in nodes if node["data"]["id"] in self._touched]
+            }
+        }
+        if self.pipeline.cofactor_index is not None:
+            annotate_cofactors(touched, self.pipeline.cofactor_index)
+        if self.pipeline.depiction == "svg":
+            annotate_chemical_svg(
+                touched,
+                cache=self.pipeline.depiction_cache,
+                workers=self.pipeline.workers,
+            )
+        for node in touched["elements"]["nodes"]:
+            self._annotations[node["data"]["id"]] = {
+                "cofactor": node["data"]["cofactor"],
+                "svg": node["data"]["svg"],
+            }
+        self._touched = set()
+
+        # Restore annotations of the other ones
+        for node in nodes:
+            node["data"].update(self._annotations[node["data"]["id"]])
+
+        depictions = None
+        structures = None
+        if self.pipeline.depiction == "coords":
+            # Reaction entries depend on all edges, structures of chemicals
+            # already seen are read from the cache
+            structures = annotate_structures(
+                network,
+                cache=self.pipeline.depiction_cache,
+                workers=self.pipeline.workers,
+            )
+        elif self.pipeline.dedup_depictions:
+            depictions = deduplicate_depictions(network)
+        # Positions depend on the whole network
+        if self.pipeline.precompute_layout:
+            annotate_layout(network)
+        return PipelineResult(
+            network,
+            pathways_info,
+            depictions=depictions,
+            compact=self.pipeline.compact_json,
+            hide_panels=self.pipeline.hide_panels,
+            structures=structures,
+        )
+
+
+def watch_folder(
+    folder: str | Path, interval: float = 2.0, idle_timeout: float | None = None
+) -> Iterator[list[str]]:
+    """Yield batches of rpSBML files as they appear in a folder.
+
+    The folder is polled every `interval` seconds. A file is considered
+    complete, and yielded, once it has not been modified for `interval`
+    seconds. Files already yielded are not yielded again, even if modified.
+    The first batch holds all complete files already in the folder.
+
+    :param folder: folder to watch
+    :param interval: polling interval, in seconds
+    :param idle_timeout: if given, stop once no new file showed up for this
+        number of seconds. By default, watch until interrupted.
+    :return: iterator over lists of file paths, sorted by name
+    """
+    seen = set()
+    last_seen = time.monotonic()
+    while True:
+        now = time.time()
+        batch = []
+        for path in sorted(Path(folder).glob("*.xml")):
+            if path in seen:
+                continue
+            try:
+                modified = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            last_seen = time.monotonic()
+            if now - modified >= interval:
+                batch.append(path)
+        if batch:
+            seen.update(batch)
+            yield [str(path) for path in batch]
+        elif idle_timeout is not None and time.monotonic() - last_seen >= idle_timeout:
+            return
+        time.sleep(interval)
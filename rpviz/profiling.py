@@ -0,0 +1,155 @@
+"""Per-stage instrumentation of rpviz runs."""
+
+from __future__ import annotations
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+from rpviz._version import __version__
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss() -> int | None:
+    """Peak resident memory of the process and of its children, in bytes.
+
+    None if not available on the platform.
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Reported in bytes on macOS, in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def _cpu_time() -> float:
+    """CPU time used by the process and by its terminated children, in s."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Profiler:
+    """Record wall time, CPU time and memory of successive stages.
+
+    When disabled, stages are not measured and nothing is written, so that
+    the instrumented code does not have to care.
+
+    The high-water mark of the resident memory of the process and of worker
+    processes is recorded at the end of each stage, along with how much the
+    stage raised it. Since it is a process-wide peak, it may come from an
+    earlier stage. Optionally, the peak of Python allocations of each stage
+    (tracemalloc, current process only) is also measured. Tracing slows down
+    allocations, so that wall and CPU times of traced stages are inflated.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        cprofile_stage: str | None = None,
+        cprofile_path: str | Path | None = None,
+        trace_memory: bool = False,
+    ):
+        """Set up the profiler.
+
+        :param enabled: whether to measure stages
+        :param cprofile_stage: name of a stage to run under cProfile
+        :param cprofile_path: file where cProfile stats of that stage are
+            dumped (pstats format)
+        :param trace_memory: whether to trace Python allocations of stages
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_stage = cprofile_stage
+        self.cprofile_path = cprofile_path
+        self.stages = []
+        self.parse_times = [] if enabled else None
+
+    @contextmanager
+    def stage(self, name: str):
+        """Measure a stage.
+
+        Yield a dictionary into which the caller can put counts of items
+        processed.
+
+        :param name: name of the stage
+        """
+        items = {}
+        if not self.enabled:
+            yield items
+            return
+        # Only trace allocations of this stage, and stop before measuring others
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        rss_start = _peak_rss()
+        profile = None
+        if name == self.cprofile_stage:
+            profile = cProfile.Profile()
+            profile.enable()
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield items
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = _cpu_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(str(self.cprofile_path))
+            traced_peak = None
+            if tracing:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            rss_end = _peak_rss()
+            rss_increase = None
+            if rss_end is not None:
+                rss_increase = rss_end - rss_start
+            self.stages.append(
+                {
+                    "name": name,
+                    "wall_time_s": round(wall_time, 6),
+                    "cpu_time_s": round(cpu_time, 6),
+                    "peak_traced_memory_bytes": traced_peak,
+                    "process_peak_rss_bytes": rss_end,
+                    "process_peak_rss_increase_bytes": rss_increase,
+                    "items": items,
+                }
+            )
+
+    def report(self) -> dict:
+        """Return the report of stages measured so far."""
+        return {
+            "rpviz_version": __version__,
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "stages": self.stages,
+            "total_wall_time_s": round(sum(s["wall_time_s"] for s in self.stages), 6),
+            "parse_times": self.parse_times,
+        }
+
+    def write(self, path: str | Path) -> None:
+        """Write the report as JSON.
+
+        :param path: output file
+        """
+        with open(path, "w", encoding="utf-8") as ofh:
+            json.dump(self.report(), ofh, indent=4)
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+
+"""Local HTTP service rendering viewers on demand."""
+
+__author__ = "Thomas Duigou"
+__license__ = "MIT"
+
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from rpviz._version import __version__
+from rpviz.cache import DepictionCache
+from rpviz.pipeline import DEFAULT_COFACTOR_FILE, Pipeline
+
+logger = logging.getLogger(__name__)
+
+# Pipeline of each worker process, set up once by _init_worker
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_kwargs: dict) -> None:
+    """Set up the pipeline of a worker process, and warm it up."""
+    global _worker_pipeline
+    _worker_pipeline = Pipeline(**pipeline_kwargs)
+    # Build the cofactor index and import heavy dependencies now, so that
+    # the first request served by this worker does not pay for them
+    _ = _worker_pipeline.cofactor_index
+    importlib.import_module("rplibs")
+    importlib.import_module("rdkit.Chem.Draw")
+
+
+def _render(sources: list, output_format: str, hide_panels: bool, compact: bool):
+    """Render uploaded rpSBMLs, within a worker process.
+
+    :param sources: contents of uploaded files (rpSBML files or archives)
+    :param output_format: "html" for the autonomous HTML, "json" for
+        network.json
+    :param hide_panels: whether to hide side panels by default in HTML
+    :param compact: whether to write network.json in compact mode
+    :return: the rendered content, as bytes
+    """
+    result = _worker_pipeline.run(sources)
+    result.hide_panels = hide_panels
+    result.compact = compact
+    if output_format == "json":
+        return result.network_json().encode("utf-8")
+    return result.html()
+
+
+def _read_multipart(body: bytes, content_type: str) -> list:
+    """Extract file contents out of a multipart/form-data body."""
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    return [
+        part.get_payload(decode=True)
+        for part in message.iter_parts()
+        if part.get_filename() is not None
+    ]
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderServer(ThreadingHTTPServer):
+    """HTTP server dispatching render jobs to a pool of worker processes.
+
+    Each worker process holds its own Pipeline, so that imports, the
+    cofactor index and depiction caches stay warm across requests. At most
+    `workers` jobs run at the same time, and at most `max_queue` more wait
+    for a worker; further requests are rejected (503) rather than piling up.
+    If a worker process dies, the pool is started again, and jobs it was
+    running are rejected (503).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        pipeline_kwargs: dict,
+        workers: int = 1,
+        max_queue: int = 8,
+        max_upload_size: int = 512 * 1024**2,
+    ):
+        """Start the worker pool and bind the server.
+
+        :param address: (host, port) to listen to
+        :param pipeline_kwargs: parameters of the Pipeline of each worker
+        :param workers: number of worker processes, 0 or less uses all
+            available cores
+        :param max_queue: maximum number of jobs waiting for a worker
+        :param max_upload_size: maximum size of uploads, in bytes
+        """
+        if workers < 1:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.max_upload_size = max_upload_size
+        self.pipeline_kwargs = pipeline_kwargs
+        self.executor = self._start_executor()
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        super().__init__(address, RenderRequestHandler)
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.pipeline_kwargs,),
+        )
+
+    def _restart_executor(self, broken: ProcessPoolExecutor) -> None:
+        """Replace a broken worker pool, unless another job already did."""
+        with self._executor_lock:
+            if self.executor is broken:
+                logger.error("Worker pool broken, starting a new one")
+                self.executor = self._start_executor()
+                broken.shutdown(wait=False)
+
+    def render(self, sources: list, **options) -> bytes:
+        """Run a render job on the worker pool, blocking until it is done."""
+        if not self._slots.acquire(blocking=False):
+            raise _HTTPError(503, "Too many pending jobs, retry later.")
+        try:
+            executor = self.executor
+            try:
+                return executor.submit(_render, sources, **options).result()
+            except BrokenProcessPool:
+                self._restart_executor(executor)
+                raise _HTTPError(503, "Worker process lost, retry later.")
+        finally:
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Handle requests of the render server.
+
+    GET /health: status of the server.
+    POST /render: render uploaded files, sent either as the raw request body
+    (one rpSBML file, or a tar archive of rpSBML files) or as
+    multipart/form-data files. Query parameters: format ("html", default,
+    or "json"), hide_panels and compact ("1" to enable).
+    """
+
+    server_version = f"rpviz/{__version__}"
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def _send(self, status: int, content: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_json(self, status: int, obj: dict) -> None:
+        content = json.dumps(obj).encode("utf-8")
+        self._send(status, content, "application/json")
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "Not found."})
+            return
+        self._send_json(
+            200,
+            {"status": "ok", "version": __version__, "workers": self.server.workers},
+        )
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/render":
+            self._send_json(404, {"error": "Not found."})
+            return
+        query = parse_qs(url.query)
+        output_format = query.get("format", ["html"])[0]
+        try:
+            if output_format not in ("html", "json"):
+                raise _HTTPError(400, f'Unknown format "{output_format}".')
+            sources = self._read_sources()
+            content = self.server.render(
+                sources,
+                output_format=output_format,
+                hide_panels=query.get("hide_panels", ["0"])[0] == "1",
+                compact=query.get("compact", ["0"])[0] == "1",
+            )
+        except _HTTPError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except (FileNotFoundError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Render failed")
+            self._send_json(500, {"error": f"Render failed: {e}"})
+        else:
+            if output_format == "json":
+                self._send(200, content, "text/javascript; charset=utf-8")
+            else:
+                self._send(200, content, "text/html; charset=utf-8")
+
+    def _read_sources(self) -> list:
+        """Read uploaded files from the request body."""
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise _HTTPError(411, "Content-Length required.")
+        if length > self.server.max_upload_size:
+            raise _HTTPError(413, "Upload too large.")
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            sources = _read_multipart(body, content_type)
+        else:
+            sources = [body]
+        if not any(sources):
+            raise _HTTPError(400, "No file uploaded.")
+        return sources
+
+
+def build_arg_parser(prog="python -m rpviz serve"):
+    parser = argparse.ArgumentParser(
+        description="Serve viewers of uploaded rpSBML files over HTTP.", prog=prog
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1", help="Address to listen to. Default: %(default)s"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="Port to listen to. Default: %(default)s"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help=(
+            "Number of worker processes, ie of jobs run at the same time. "
+            "Use 0 to use all available cores. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=8,
+        help=(
+            "Maximum number of jobs waiting for a worker, further requests "
+            "are rejected. Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--max-upload-size",
+        type=int,
+        default=512,
+        help="Maximum size of uploads, in MB. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--cofactor-file",
+        default=str(DEFAULT_COFACTOR_FILE),
+        help=(
+            "File listing structures to consider as cofactors. " "Default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--no-cofactor-detection",
+        action="store_true",
+        help="If set, no cofactor detection will be performed.",
+    )
+    parser.add_argument(
+        "--depiction-cache",
+        default=None,
+        help=(
+            "Optional file used to cache chemical depictions, shared by "
+            "workers, eg ~/.cache/rpviz/depictions.sqlite. If not provided, "
+            "depictions are only cached in the memory of each worker."
+        ),
+    )
+    parser.add_argument(
+        "--depiction-cache-size",
+        type=int,
+        default=DepictionCache.DEFAULT_MAX_SIZE // 1024**2,
+        help="Maximum size of the depiction cache, in MB. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--no-depiction-cache",
+        action="store_true",
+        help=(
+            "If set, depictions are only cached in the memory of each worker, "
+            "not on disk."
+        ),
+    )
+    parser.add_argument(
+        "--debug", action="store_true", help="Turn on debug instructions"
+    )
+    return parser
+
+
+def main(argv=None) -> None:
+    """Run the server until interrupted.
+
+    :param argv: command line arguments, by default read from sys.argv
+    """
+    args = build_arg_parser().parse_args(argv)
+    logging.getLogger().setLevel(logging.DEBUG if args.debug else logging.INFO)
+
+    pipeline_kwargs = {
+        "cofactor_file": None if args.no_cofactor_detection else args.cofactor_file,
+        "depiction_cache": None if args.no_depiction_cache else args.depiction_cache,
+        "depiction_cache_size": args.depiction_cache_size * 1024**2,
+    }
+    server = RenderServer(
+        (args.host, args.port),
+        pipeline_kwargs,
+        workers=args.workers,
+        max_queue=args.max_queue,
+        max_upload_size=args.max_upload_size * 1024**2,
+    )
+    host, port = server.server_address[:2]
+    logger.info(f"Serving on http://{host}:{port} with {server.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(stream=sys.stderr)
+    main()
@@ -10,8 +10,9 @@ class PathwayHandler {
      * 
      * @param {cytoscape.js object} cy
      * @param {json structure} pathways_info 
+     * @param {Boolean} shown: whether all pathways are currently displayed
      */
-    constructor(cy, pathways_info){
+    constructor(cy, pathways_info, shown=false){
         // List of the class attributes
         this.cy = cy;
         this.all_path_ids = new Set()
@@ -19,6 +20,10 @@ class PathwayHandler {
         this.path_to_nodes = new Object()
         this.path_to_scores = new Object()
         this.pinned_path_ids = new Set()
+        this.element_to_paths = new Object()  // Reverse index of path_to_nodes and path_to_edges
+        this.shown_path_ids = new Set()
+        this.shown_counts = new Object()  // Number of shown pathways involving each element
+        this.highlighted = cy.collection()
         
         for (let path_id in pathways_info){
             if (this.all_path_ids.has(path_id)){
@@ -28,14 +33,139 @@ class PathwayHandler {
                 this.all_path_ids.add(path_id);
                 // List involved edges and nodes
                 let info = pathways_info[path_id];
-                this.path_to_edges[path_id] = info['edge_ids'];
-                this.path_to_nodes[path_id] = info['node_ids'];
+                this.path_to_edges[path_id] = [];
+                this.path_to_nodes[path_id] = [];
                 // Extract scores
                 this.path_to_scores[path_id] = info['scores'];
-                // Set specific data field in the cytoscape object
-                cy.elements().data('pinned', 0);
             }
         }
+        this.index_pathways(pathways_info);
+        // Set specific data field in the cytoscape object
+        cy.elements().data('pinned', 0);
+        if (shown){
+            this.show_paths([...this.all_path_ids]);
+        }
+    }
+
+    /**
+     * Index the elements of pathways
+     *
+     * Pathways already indexed are replaced, which happens when their
+     * elements are loaded from shards.
+     *
+     * @param {Object} pathways: node and edge IDs, ie {path_id: {node_ids: [...], edge_ids: [...]}}
+     */
+    index_pathways(pathways){
+        let changed = new Set();
+        for (let path_id in pathways){
+            let shown = this.shown_path_ids.has(path_id);
+            if (shown){
+                this.count_shown_elements([path_id], -1, changed);
+            }
+            // Unlink previous elements
+            this.get_element_ids(path_id).forEach((element_id) => {
+                let path_ids = this.element_to_paths[element_id];
+                path_ids.splice(path_ids.indexOf(path_id), 1);
+            }, this);
+            // Link new ones
+            this.path_to_nodes[path_id] = pathways[path_id]['node_ids'];
+            this.path_to_edges[path_id] = pathways[path_id]['edge_ids'];
+            this.get_element_ids(path_id).forEach((element_id) => {
+                if (!(element_id in this.element_to_paths)){
+                    this.element_to_paths[element_id] = [];
+                }
+                this.element_to_paths[element_id].push(path_id);
+            }, this);
+            if (shown){
+                this.count_shown_elements([path_id], 1, changed);
+            }
+        }
+        this.apply_visibility(changed);
+    }
+
+    /**
+     * Get the IDs of the nodes and edges of a pathway
+     *
+     * @param {String} path_id: pathway ID
+     */
+    get_element_ids(path_id){
+        return [...(this.path_to_nodes[path_id] || []), ...(this.path_to_edges[path_id] || [])];
+    }
+
+    /**
+     * Get the collection of nodes and edges involved in pathways
+     *
+     * @param {Array} path_ids: pathway IDs
+     */
+    get_elements(path_ids){
+        let elements = this.cy.collection();
+        path_ids.forEach((path_id) => {
+            this.get_element_ids(path_id).forEach((element_id) => {
+                elements.merge(this.cy.getElementById(element_id));
+            }, this);
+        }, this);
+        return elements;
+    }
+
+    /**
+     * Update the number of shown pathways involving elements
+     *
+     * @param {Array} path_ids: pathway IDs, shown or hidden
+     * @param {Integer} step: 1 if pathways are shown, -1 if hidden
+     * @param {Set} changed: IDs of elements whose visibility may change, filled
+     */
+    count_shown_elements(path_ids, step, changed){
+        path_ids.forEach((path_id) => {
+            this.get_element_ids(path_id).forEach((element_id) => {
+                let count = (this.shown_counts[element_id] || 0) + step;
+                this.shown_counts[element_id] = count;
+                if (count == 0 || (count == 1 && step == 1)){
+                    changed.add(element_id);
+                }
+            }, this);
+        }, this);
+    }
+
+    /**
+     * Show or hide elements according to the number of shown pathways involving them
+     *
+     * @param {Set} element_ids: element IDs
+     * @return {cytoscape collection} elements made visible
+     */
+    apply_visibility(element_ids){
+        let visible = this.cy.collection();
+        let hidden = this.cy.collection();
+        element_ids.forEach((element_id) => {
+            if (this.shown_counts[element_id] > 0){
+                visible.merge(this.cy.getElementById(element_id));
+            } else {
+                hidden.merge(this.cy.getElementById(element_id));
+            }
+        }, this);
+        this.cy.batch(() => {
+            visible.css({visibility: 'visible'});
+            hidden.css({visibility: 'hidden'});
+        });
+        return visible;
+    }
+
+    /**
+     * Show exactly a set of pathways, hiding other ones
+     *
+     * Only elements of pathways shown or hidden by this call are updated.
+     *
+     * @param {Array} path_ids: pathway IDs
+     * @return {cytoscape collection} elements made visible
+     */
+    show_paths(path_ids){
+        let selected = new Set(path_ids);
+        let removed = [...this.shown_path_ids].filter((path_id) => ! selected.has(path_id));
+        let added = [...selected].filter((path_id) => ! this.shown_path_ids.has(path_id));
+        let changed = new Set();
+        this.count_shown_elements(removed, -1, changed);
+        this.count_shown_elements(added, 1, changed);
+        this.shown_path_ids = selected;
+        return this.apply_visibility(changed);
     }
 
     /**
@@ -98,7 +228,7 @@ class PathwayHandler {
      * @param {string} element_id: cytoscape element ID
      */
     involved_in_any_pinned_path(element_id){
-        let path_ids = this.cy.getElementById(element_id).data('path_ids')  // returns a list
+        let path_ids = this.element_to_paths[element_id] || [];
         for (let i = 0; i < path_ids.length; i++){
             if (this.pinned_path_ids.has(path_ids[i])){
                 return true
@@ -135,40 +265,26 @@ class PathwayHandler {
     highlight_pathways(path_ids=[]){
         // No pathway to highlight
         if (path_ids.length == 0){
-            this.cy.edges('[highlighted = 1]').forEach((edge) => {
-                edge.data('highlighted', 0);
-                edge.removeClass('highlighted');
+            this.cy.batch(() => {
+                this.highlighted.data('highlighted', 0);
+                this.highlighted.edges().removeClass('highlighted');
+                this.update_pinned_elements();
             });
-            this.cy.nodes('[highlighted = 1]').forEach((node) => {
-                node.data('highlighted', 0);
-            });
-            this.update_pinned_elements();
+            this.highlighted = this.cy.collection();
             return true;
         }
 
-        // No pinned pathways
-        if (this.pinned_path_ids.size == 0){
-            this.cy.elements().addClass('faded');
-        }
-
-        //
-        path_ids.forEach((path_id) => {
-            let edge_ids = this.path_to_edges[path_id];
-            let node_ids = this.path_to_nodes[path_id];
-            let element_ids = new Set([...node_ids, ...edge_ids]);
-            element_ids.forEach((element_id) => {
-                let element = this.cy.getElementById(element_id);
-                element.data('highlighted', 1);
-            }, this);
-        }, this);
-
-        this.cy.edges('[highlighted = 1]').forEach((edge) => {
-            edge.addClass('highlighted');
-            edge.removeClass('faded');
-        });
-        this.cy.nodes('[highlighted = 1]').forEach((node) => {
-            node.removeClass('faded');
+        let elements = this.get_elements(path_ids);
+        this.cy.batch(() => {
+            // No pinned pathways
+            if (this.pinned_path_ids.size == 0){
+                this.cy.elements().addClass('faded');
+            }
+            elements.data('highlighted', 1);
+            elements.edges().addClass('highlighted');
+            elements.removeClass('faded');
         });
+        this.highlighted = this.highlighted.union(elements);
     }
 
     /** Colourise one pathway
@@ -317,14 +433,7 @@ function get_checked_pathways(){
  * @param cy (cytoscape object): Cytoscape object
  */
 function get_edges_from_path_id(path_id, cy){
-    edges_col = cy.collection();
-    cy.edges().forEach(function(edge, index){
-        let edge_path_ids = edge.data('path_ids');
-        if (share_at_least_one(edge_path_ids, [path_id])){
-            edges_col = edges_col.union(edge);
-        }
-    });
-    return edges_col;
+    return path_handler.get_elements([path_id]).edges();
 }
 
 /**
@@ -439,8 +548,16 @@ function panel_reaction_info(node, show=true){
         let thermo_value = node.data('thermo_dg_m_gibbs');
         let rule_score = node.data('rule_score');
         let uniprot_ids = node.data('uniprot_ids');
+        let svg = node.data('svg');
         // Inject 
         $("span.reaction_info_rsmiles").html(rsmiles);
+        // Depiction (if any)
+        if (svg !== null && svg !== ""){
+            $('div.reaction-img-box').show();
+            $('img.reaction_info_svg').attr('src', svg);
+        } else {
+            $('div.reaction-img-box').hide();
+        }
         // Reaction name
         $("span.reaction_info_name").html(label);
         // Rule IDs
@@ -611,6 +728,412 @@ function share_at_least_one(array1, array2){
     return false;
 }
 
+/**
+ * Fill back node fields omitted from a compact network
+ *
+ * Fields set to null are not written into compact network files, their
+ * default value is restored here so that every node has the full schema.
+ *
+ * @param {Object} elements: network elements, ie {nodes: [...], edges: [...]}
+ */
+function fill_node_defaults(elements){
+    const node_fields = [
+        'svg', 'xlinks', 'rsmiles', 'rule_ids', 'rxn_template_ids',
+        'ec_numbers', 'thermo_dg_m_gibbs', 'rule_score', 'uniprot_ids',
+        'smiles', 'inchi', 'inchikey', 'target_chemical', 'sink_chemical',
+        'thermo_dg_m_formation', 'cofactor'
+    ];
+    for (let i = 0; i < elements['nodes'].length; i++){
+        let data = elements['nodes'][i]['data'];
+        for (let j = 0; j < node_fields.length; j++){
+            if (!(node_fields[j] in data)){
+                data[node_fields[j]] = null;
+            }
+        }
+    }
+}
+
+/**
+ * Replace depiction keys of nodes by the depictions themselves
+ *
+ * When depictions are deduplicated, each one is written once into a table
+ * and the svg field of nodes only holds its key. Nodes sharing a structure
+ * then share the same string once resolved.
+ *
+ * @param {Object} elements: network elements, ie {nodes: [...], edges: [...]}
+ * @param {Object} table: depictions, by key
+ */
+function resolve_depictions(elements, table){
+    for (let i = 0; i < elements['nodes'].length; i++){
+        let data = elements['nodes'][i]['data'];
+        if (data['svg'] !== null && data['svg'] in table){
+            data['svg'] = table[data['svg']];
+        }
+    }
+}
+
+/**
+ * Node positions computed at build time, by node ID
+ */
+var preset_positions = new Object();
+
+/**
+ * Collect node positions computed at build time (if any)
+ *
+ * These positions make the default layout, computing a layout in the
+ * browser being slow on large networks.
+ *
+ * @param {Object} elements: network elements, ie {nodes: [...], edges: [...]}
+ */
+function collect_preset_positions(elements){
+    for (let i = 0; i < elements['nodes'].length; i++){
+        let node = elements['nodes'][i];
+        if ('position' in node){
+            // Copied, cytoscape moves nodes by updating their position object
+            preset_positions[node['data']['id']] = {x: node['position']['x'], y: node['position']['y']};
+        }
+    }
+}
+
+// Structures ///////////////////////////
+
+/**
+ * 2D structures and reaction entries, by key
+ *
+ * Filled when depictions are drawn by the viewer (coords depiction mode),
+ * nodes then refer to their entry through their structure field.
+ */
+var structure_table = new Object();
+
+/**
+ * Pixels per unit of 2D coordinates, ie about 45 pixels per bond
+ */
+const STRUCTURE_SCALE = 30;
+
+/**
+ * Colours of atom labels, black if not listed
+ */
+const ATOM_COLOURS = {
+    'N': '#3050F8', 'O': '#FF0D0D', 'S': '#C6A100', 'P': '#FF8000',
+    'F': '#33A02C', 'Cl': '#33A02C', 'Br': '#A62929', 'I': '#940094'
+};
+
+/**
+ * Move structure keys of nodes into their structure field
+ *
+ * The svg field of nodes is emptied, it is filled by depict_node once the
+ * node is displayed.
+ *
+ * @param {Object} elements: network elements, ie {nodes: [...], edges: [...]}
+ * @param {Object} table: structures and reaction entries, by key
+ */
+function resolve_structures(elements, table){
+    Object.assign(structure_table, table);
+    for (let i = 0; i < elements['nodes'].length; i++){
+        let data = elements['nodes'][i]['data'];
+        if (data['svg'] !== null && data['svg'] in table){
+            data['structure'] = data['svg'];
+            data['svg'] = null;
+        }
+    }
+}
+
+/**
+ * Label of an atom, null for carbons drawn as plain vertices
+ *
+ * @param {Array} atom: [symbol, x, y, hydrogens, charge], hydrogens and
+ *  charge being optional
+ * @param {Integer} degree: number of bonds of the atom
+ */
+function atom_label(atom, degree){
+    let hs = atom.length > 3 ? atom[3] : 0;
+    let charge = atom.length > 4 ? atom[4] : 0;
+    if (atom[0] == 'C' && degree > 0 && charge == 0){
+        return null;
+    }
+    let label = atom[0];
+    if (hs > 0){
+        label += 'H' + (hs > 1 ? hs : '');
+    }
+    if (charge != 0){
+        label += (Math.abs(charge) > 1 ? Math.abs(charge) : '') + (charge > 0 ? '+' : '−');
+    }
+    return label;
+}
+
+/**
+ * Draw a 2D structure as SVG elements
+ *
+ * @param {Object} structure: {atoms: [...], bonds: [...]}, as written by
+ *  annotate_structures
+ * @return {Object} {width, height, body}, body being SVG elements drawn
+ *  within (0, 0) and (width, height)
+ */
+function draw_structure(structure){
+    const atoms = structure['atoms'];
+    const bonds = structure['bonds'];
+    const margin = 0.8;  // In coordinate units, room for labels
+    let degrees = atoms.map(() => 0);
+    bonds.forEach((bond) => { degrees[bond[0]]++; degrees[bond[1]]++; });
+    let labels = atoms.map((atom, i) => atom_label(atom, degrees[i]));
+    // Bounding box, y axis pointing down
+    let xs = atoms.map((atom) => atom[1]);
+    let ys = atoms.map((atom) => -atom[2]);
+    let x_min = Math.min(...xs) - margin;
+    let y_min = Math.min(...ys) - margin;
+    let width = (Math.max(...xs) + margin - x_min) * STRUCTURE_SCALE;
+    let height = (Math.max(...ys) + margin - y_min) * STRUCTURE_SCALE;
+    let px = (i) => (xs[i] - x_min) * STRUCTURE_SCALE;
+    let py = (i) => (ys[i] - y_min) * STRUCTURE_SCALE;
+    let body = '';
+    // Bonds, shortened at labelled atoms
+    bonds.forEach((bond) => {
+        let [i, j, order] = bond;
+        let dx = px(j) - px(i);
+        let dy = py(j) - py(i);
+        let length = Math.hypot(dx, dy) || 1;
+        let ux = dx / length;
+        let uy = dy / length;
+        let start = labels[i] === null ? 0 : 0.3 * STRUCTURE_SCALE;
+        let end = labels[j] === null ? 0 : 0.3 * STRUCTURE_SCALE;
+        let offsets = order == 2 ? [-0.08, 0.08] : (order == 3 ? [-0.13, 0, 0.13] : [0]);
+        offsets.forEach((offset) => {
+            let ox = -uy * offset * STRUCTURE_SCALE;
+            let oy = ux * offset * STRUCTURE_SCALE;
+            body += '<line x1="' + (px(i) + ux * start + ox).toFixed(1)
+                + '" y1="' + (py(i) + uy * start + oy).toFixed(1)
+                + '" x2="' + (px(j) - ux * end + ox).toFixed(1)
+                + '" y2="' + (py(j) - uy * end + oy).toFixed(1) + '"/>';
+        });
+    });
+    body = '<g stroke="#000000" stroke-width="2" stroke-linecap="round">' + body + '</g>';
+    // Labels
+    labels.forEach((label, i) => {
+        if (label !== null){
+            let colour = ATOM_COLOURS[atoms[i][0]] || '#000000';
+            body += '<text x="' + px(i).toFixed(1) + '" y="' + py(i).toFixed(1)
+                + '" fill="' + colour + '">' + label + '</text>';
+        }
+    });
+    return {width: width, height: height, body: body};
+}
+
+/**
+ * Wrap SVG elements into an SVG data URI
+ *
+ * @param {Number} width: width of the drawing
+ * @param {Number} height: height of the drawing
+ * @param {String} body: SVG elements
+ */
+function svg_data_uri(width, height, body){
+    let svg = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 '
+        + width.toFixed(1) + ' ' + height.toFixed(1) + '">'
+        + '<rect width="100%" height="100%" fill="#FFFFFF"/>'
+        + '<g font-family="sans-serif" font-size="' + (0.5 * STRUCTURE_SCALE)
+        + '" text-anchor="middle" dominant-baseline="central">' + body + '</g></svg>';
+    return 'data:image/svg+xml;charset=utf-8,' + encodeURIComponent(svg);
+}
+
+/**
+ * Depict a chemical, in a square image
+ *
+ * @param {Object} structure: {atoms: [...], bonds: [...]}
+ * @return {String} SVG data URI
+ */
+function chemical_depiction(structure){
+    let drawing = draw_structure(structure);
+    let side = Math.max(drawing.width, drawing.height);
+    let body = '<g transform="translate(' + ((side - drawing.width) / 2).toFixed(1)
+        + ',' + ((side - drawing.height) / 2).toFixed(1) + ')">' + drawing.body + '</g>';
+    return svg_data_uri(side, side, body);
+}
+
+/**
+ * Depict a reaction, ie its reactants and products on a line
+ *
+ * @param {Object} entry: {reactants: [keys], products: [keys]}
+ * @return {String} SVG data URI
+ */
+function reaction_depiction(entry){
+    const gap = STRUCTURE_SCALE;
+    let parts = [];
+    entry['reactants'].forEach((key, i) => {
+        if (i > 0){ parts.push('+'); }
+        parts.push(draw_structure(structure_table[key]));
+    });
+    parts.push('→');
+    entry['products'].forEach((key, i) => {
+        if (i > 0){ parts.push('+'); }
+        parts.push(draw_structure(structure_table[key]));
+    });
+    let height = Math.max(2 * gap, ...parts.filter((part) => typeof part !== 'string').map((part) => part.height));
+    let x = 0;
+    let body = '';
+    parts.forEach((part) => {
+        if (typeof part === 'string'){
+            body += '<text x="' + (x + gap).toFixed(1) + '" y="' + (height / 2).toFixed(1)
+                + '" font-size="' + (1.2 * STRUCTURE_SCALE) + '">' + part + '</text>';
+            x += 2 * gap;
+        } else {
+            body += '<g transform="translate(' + x.toFixed(1) + ','
+                + ((height - part.height) / 2).toFixed(1) + ')">' + part.body + '</g>';
+            x += part.width;
+        }
+    });
+    return svg_data_uri(x, height, body);
+}
+
+/**
+ * Draw the depiction of a node from its structure, if not done yet
+ *
+ * @param {cytoscape node} node: chemical or reaction node
+ */
+function depict_node(node){
+    let key = node.data('structure');
+    if (key === undefined || key === null || node.data('svg') !== null){
+        return;
+    }
+    let entry = structure_table[key];
+    if ('atoms' in entry){
+        node.data('svg', chemical_depiction(entry));
+    } else {
+        node.data('svg', reaction_depiction(entry));
+    }
+}
+
+/**
+ * Draw depictions of displayed chemicals
+ *
+ * Reactions are only depicted when tapped.
+ *
+ * @param {cytoscape collection} nodes: nodes to consider, all by default
+ */
+function depict_visible_nodes(nodes=cy.nodes()){
+    nodes.filter("[type = 'chemical'][?structure][!svg]").forEach((node) => {
+        if (node.visible()){
+            depict_node(node);
+        }
+    });
+}
+
+// Shards ///////////////////////////
+
+/**
+ * Promises of shards already loaded or being loaded, by shard index
+ */
+var shard_promises = new Object();
+var shard_resolvers = new Object();
+var loaded_shards = new Object();
+var nb_unrefreshed_shards = 0;  // Shards added since labels were last made
+
+/**
+ * Tell whether network elements are split into shards
+ *
+ * In such a case, network.json only holds an index and the network_shards
+ * variable, elements being loaded on demand from shard files.
+ */
+function is_sharded(){
+    return typeof network_shards !== 'undefined';
+}
+
+/**
+ * Tell whether elements of a pathway have been added into the network
+ *
+ * @param {String} path_id: pathway ID
+ */
+function is_pathway_loaded(path_id){
+    return ! is_sharded() || network_shards['path_to_shard'][path_id] in loaded_shards;
+}
+
+/**
+ * Receive the content of a shard
+ *
+ * Called by shard files once loaded.
+ *
+ * @param {Integer} shard_idx: shard index
+ * @param {Object} content: shard elements and pathway info
+ */
+function rpviz_add_shard(shard_idx, content){
+    shard_resolvers[shard_idx](content);
+}
+
+/**
+ * Add elements of a shard into the network
+ *
+ * Elements already in the network (shared with a shard loaded before) are
+ * skipped.
+ *
+ * @param {Object} content: shard elements and pathway info
+ */
+function add_shard_elements(content){
+    fill_node_defaults(content['elements']);
+    collect_preset_positions(content['elements']);
+    if ('depictions' in content){
+        resolve_depictions(content['elements'], content['depictions']);
+    }
+    if ('structures' in content){
+        resolve_structures(content['elements'], content['structures']);
+    }
+    let new_elements = [];
+    ['nodes', 'edges'].forEach((group) => {
+        content['elements'][group].forEach((element) => {
+            if (cy.getElementById(element['data']['id']).empty()){
+                element['group'] = group;
+                element['data']['pinned'] = 0;
+                new_elements.push(element);
+            }
+        });
+    });
+    cy.add(new_elements).css({visibility: 'hidden'});  // Until their pathways are shown
+    path_handler.index_pathways(content['pathways']);
+}
+
+/**
+ * Load shards holding a list of pathways
+ *
+ * A shard that fails to load is forgotten, so that it is fetched again
+ * next time one of its pathways is selected.
+ *
+ * @param {Array} path_ids: pathway IDs
+ * @return {Promise} settled once all shards are loaded or failed, rejected
+ *     with the first error if any
+ */
+function load_pathway_shards(path_ids){
+    let promises = [];
+    let shard_idxs = new Set(path_ids.map((path_id) => network_shards['path_to_shard'][path_id]));
+    shard_idxs.forEach((shard_idx) => {
+        if (!(shard_idx in shard_promises)){
+            shard_promises[shard_idx] = new Promise((resolve, reject) => {
+                shard_resolvers[shard_idx] = resolve;
+                let script = document.createElement('script');
+                script.src = network_shards['files'][shard_idx];
+                script.onerror = () => {
+                    script.remove();
+                    reject(new Error('Unable to load ' + script.src));
+                };
+                document.head.appendChild(script);
+            }).then((content) => {
+                add_shard_elements(content);
+                loaded_shards[shard_idx] = true;
+                nb_unrefreshed_shards++;
+            }).catch((error) => {
+                delete shard_promises[shard_idx];
+                delete shard_resolvers[shard_idx];
+                throw error;
+            });
+        }
+        promises.push(shard_promises[shard_idx]);
+    });
+    return Promise.allSettled(promises).then((results) => {
+        let failed = results.find((result) => result.status == 'rejected');
+        if (failed !== undefined){
+            throw failed.reason;
+        }
+    });
+}
+
+// Labels ///////////////////////////
+
 /**
  * Make labels for chemicals
  *
@@ -660,13 +1183,23 @@ function make_reaction_labels(max_length=10){
 // Live ///////////////////////////
 
 
-$(function(){
+/**
+ * Start the viewer: load the network, fill in the page and bind its controls
+ *
+ * @param {Object} cy_options: options of the Cytoscape object
+ * @return {Object} functions driving the network display
+ */
+function init_viewer(cy_options){
 
     // Cytoscape object to play with all along
-    var cy = window.cy = cytoscape({
-        container: document.getElementById('cy'),
-        motionBlur: true
-    });
+    var cy = window.cy = cytoscape(cy_options);
+
+    // Cofactor display status, cofactors are shown until hidden at startup
+    var cofactors_shown = true;
+
+    // Layouts already computed, by displayed elements, least recently used first
+    var layout_cache = new Map();
+    const LAYOUT_CACHE_SIZE = 20;
 
     // Basic stuff to do only once
     build_pathway_table();
@@ -674,7 +1207,8 @@ $(function(){
     panel_chemical_info(null, false);
     panel_reaction_info(null, false);
     panel_pathway_info(null, false);
-    init_network(true);
+    init_network(! is_sharded());  // Sharded elements are loaded on demand
+    window.path_handler = new PathwayHandler(cy, pathways_info, ! is_sharded());  // Shown by init_network
     annotate_hiddable_cofactors();  // Need to be done after init_network so the network is already loaded
     refresh_layout();
     show_cofactors(false);
@@ -682,7 +1216,6 @@ $(function(){
     make_pathway_table_sortable();  // Should be called only after the table has been populated with values
 
     // Pathway Handler stuff
-    window.path_handler = new PathwayHandler(cy, pathways_info);
     path_handler.colourise_pathways('__ALL__', 'global_score');
 
     /**
@@ -696,6 +1229,14 @@ $(function(){
         cy.minZoom(1e-50);
         
         // Load the full network
+        fill_node_defaults(network['elements']);
+        collect_preset_positions(network['elements']);
+        if (typeof depictions !== 'undefined'){
+            resolve_depictions(network['elements'], depictions);
+        }
+        if (typeof structures !== 'undefined'){
+            resolve_structures(network['elements'], structures);
+        }
         cy.json({elements: network['elements']});
         
         // Create node labels
@@ -704,9 +1245,10 @@ $(function(){
         
         // Hide them 'by default'
         if (! show_graph){
-            show_pathways(selected_paths='__NONE__');
+            cy.elements().css({visibility: 'hidden'});
         } else {
             $('input[name=path_checkbox]').prop('checked', true);  // Check all
+            depict_visible_nodes();  // Depictions drawn by the viewer (if any)
         }
         
         // Once the layout is done:
@@ -799,6 +1341,7 @@ $(function(){
         
         cy.on('tap', 'node', function(evt){
             let node = evt.target;
+            depict_node(node);
             // Dump into console
             console.log(node.data());
             // Print info
@@ -822,22 +1365,89 @@ $(function(){
         
     }
     
+    /**
+     * Key of the layout cache, ie what defines displayed elements
+     */
+    function layout_cache_key(){
+        return [...path_handler.shown_path_ids].sort().join('\n') + '|' + cofactors_shown;
+    }
+
+    /**
+     * Store positions of a layout into the cache
+     *
+     * The least recently used layout is evicted once the cache is full.
+     *
+     * @param {String} key: cache key
+     * @param {cytoscape collection} nodes: nodes laid out
+     */
+    function store_layout(key, nodes){
+        let positions = new Object();
+        nodes.forEach((node) => {
+            let position = node.position();
+            positions[node.id()] = {x: position.x, y: position.y};  // Copied, positions are updated in place
+        });
+        layout_cache.delete(key);
+        layout_cache.set(key, positions);
+        if (layout_cache.size > LAYOUT_CACHE_SIZE){
+            layout_cache.delete(layout_cache.keys().next().value);
+        }
+    }
+
+    /**
+     * Get positions of a layout from the cache, if all nodes are in
+     *
+     * @param {String} key: cache key
+     * @param {cytoscape collection} nodes: nodes to lay out
+     * @return {Object} positions by node ID, null if not cached
+     */
+    function get_cached_layout(key, nodes){
+        let positions = layout_cache.get(key);
+        if (positions === undefined || ! nodes.every((node) => node.id() in positions)){
+            return null;
+        }
+        // Mark as recently used
+        layout_cache.delete(key);
+        layout_cache.set(key, positions);
+        return positions;
+    }
+
     /**
      * Trigger a layout rendering
+     *
+     * Layouts already computed for the same displayed elements are restored
+     * from cache. Otherwise, positions computed at build time are used when
+     * available for all nodes. A fresh layout is computed if requested, or
+     * if none of these is available.
      * 
      * @param {cytoscape collection} element_collection: a collection of elements.
+     * @param {Boolean} fresh: compute a new layout, even if positions are available
      */
-    function render_layout(element_collection){
+    function render_layout(element_collection, fresh=false){
         // Playing with zoom to get the best fit
         cy.minZoom(1e-50);
         cy.on('layoutstop', function(e){
             cy.minZoom(1e-50);  // Allow full zoom-out range
         });
         // Layout
-        let layout = element_collection.layout({
-            name: 'breadthfirst',
-            roots: cy.elements("node[?target_chemical]")
-        });
+        let nodes = element_collection.nodes();
+        let key = layout_cache_key();
+        let positions = fresh ? null : get_cached_layout(key, nodes);
+        if (positions === null && ! fresh && nodes.every((node) => node.id() in preset_positions)){
+            positions = preset_positions;
+        }
+        let layout;
+        if (positions !== null){
+            layout = element_collection.layout({
+                name: 'preset',
+                positions: (node) => positions[node.id()]
+            });
+        } else {
+            layout = element_collection.layout({
+                name: 'breadthfirst',
+                roots: cy.elements("node[?target_chemical]")
+            });
+            layout.one('layoutstop', () => store_layout(key, nodes));
+        }
         layout.run();
     }
         
@@ -850,31 +1460,13 @@ $(function(){
     function show_pathways(selected_paths='__ALL__'){
       
         if (selected_paths == '__ALL__'){
-            cy.nodes().css({visibility: 'visible'});
-            cy.edges().css({visibility: 'visible'});
+            selected_paths = [...path_handler.all_path_ids];
         } else if (selected_paths == '__NONE__'){
-            cy.nodes().css({visibility: 'hidden'});
-            cy.edges().css({visibility: 'hidden'});
-        } else {
-            // Nodes
-            cy.nodes().forEach(function(node, index){
-                let node_paths = node.data('path_ids');
-                if (share_at_least_one(node_paths, selected_paths)){
-                    node.css({visibility:'visible'});
-                } else {
-                    node.css({visibility:'hidden'});
-                }
-            });
-            // Edges
-            cy.edges().forEach(function(edge, index){
-                let edge_paths = edge.data('path_ids');
-                if (share_at_least_one(edge_paths, selected_paths)){
-                    edge.css({visibility:'visible'});
-                } else {
-                    edge.css({visibility:'hidden'});
-                }
-            });
+            selected_paths = [];
         }
+        // Only elements of pathways shown or hidden since the last call are updated
+        let shown_elements = path_handler.show_paths(selected_paths);
+        depict_visible_nodes(shown_elements.nodes());  // Depictions drawn by the viewer (if any)
     }
 
     /**
@@ -925,6 +1517,7 @@ $(function(){
      * @param show (bool): will show cofactors if true
      */
     function show_cofactors(show=true){
+        cofactors_shown = show;
         if (show){
             cy.elements().style("display", "element");
         } else {
@@ -950,15 +1543,56 @@ $(function(){
     
     /**
      * Refresh layout according to visible nodes
+     *
+     * @param {Boolean} fresh: compute a new layout, even if positions are available
      */
-    function refresh_layout(){
-        render_layout(cy.elements().not(':hidden'));
+    function refresh_layout(fresh=false){
+        render_layout(cy.elements().not(':hidden'), fresh);
     }
     
+    /**
+     * Show pathways, loading their elements beforehand if needed
+     *
+     * @param selected_paths (array or str): path IDs or special flags
+     */
+    function select_pathways(selected_paths='__ALL__'){
+        if (! is_sharded()){
+            show_pathways(selected_paths);
+            return;
+        }
+        let path_ids = selected_paths;
+        if (selected_paths == '__ALL__'){
+            path_ids = Object.keys(pathways_info);
+        } else if (selected_paths == '__NONE__'){
+            path_ids = [];
+        }
+        let refresh = () => {
+            let nb_new = nb_unrefreshed_shards;
+            nb_unrefreshed_shards = 0;
+            if (nb_new > 0){
+                make_chemical_labels(6);
+                make_reaction_labels(9);
+                annotate_hiddable_cofactors();
+                path_handler.colourise_pathways('__ALL__', 'global_score');
+            }
+            // The selection may have changed while loading, pathways still
+            // loading are shown once their own shards are in
+            show_pathways(get_checked_pathways().filter(is_pathway_loaded));
+            if (nb_new > 0){
+                show_cofactors(cofactors_shown);  // Also refreshes the layout
+            }
+        };
+        load_pathway_shards(path_ids).then(refresh, (error) => {
+            refresh();  // Shards that did load
+            console.error(error);
+            alert('Unable to load the selected pathways (' + error.message + '), please select them again to retry.');
+        });
+    }
+
     // When a pathway is checked
     $("input[name=path_checkbox]").change(function(){
         selected_paths = get_checked_pathways();
-        show_pathways(selected_paths);
+        select_pathways(selected_paths);
     });
     
     /** 
@@ -1010,11 +1644,11 @@ $(function(){
         $('input[name=path_checkbox]').prop('checked', false);  // Uncheck all
     });
     $('#view_all_pathways_button').on('click', function(event){
-        show_pathways(selected_paths='__ALL__');  // Show all
+        select_pathways(selected_paths='__ALL__');  // Show all
         $('input[name=path_checkbox]').prop('checked', true);  // Check all
     });
     $('#redraw_pathways_button').on('click', function(event){
-        refresh_layout();
+        refresh_layout(true);
     });
     
     // Cofactors handling
@@ -1022,7 +1656,7 @@ $(function(){
         show_cofactors(true);
         // Update visible pathways to update their cofactor nodes visibility
         selected_paths = get_checked_pathways();
-        show_pathways(selected_paths);
+        select_pathways(selected_paths);
         // Update hilighted pathways to update their cofactor nodes status
         path_handler.update_pinned_elements();
     });
@@ -1072,4 +1706,23 @@ $(function(){
         }
     }
 
+    // Sharded network: start with the first pathway of the sorted table
+    if (is_sharded()){
+        $('#table_choice tbody tr:first input[name=path_checkbox]').prop('checked', true);
+        select_pathways(get_checked_pathways());
+    }
+
+    return {
+        show_pathways: show_pathways,
+        select_pathways: select_pathways,
+        show_cofactors: show_cofactors,
+        refresh_layout: refresh_layout
+    };
+}
+
+$(function(){
+    init_viewer({
+        container: document.getElementById('cy'),
+        motionBlur: true
+    });
 });
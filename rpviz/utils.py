@@ -3,18 +3,41 @@
 
 """Utility methods to build rpviz html pages."""
 
+from __future__ import annotations
+
 __author__ = "Thomas Duigou"
 __license__ = "MIT"
 
 import os
-import csv
+import re
+import json
 import logging
-from typing import Dict, Union
-
-from rplibs import rpSBML, rpPathway
-from rplibs.rpReaction import rpReaction
-from rplibs.rpCompound import rpCompound
-from rplibs.cobra_format import uncobraize
+import hashlib
+import heapq
+import time
+import shutil
+import tarfile
+import tempfile
+from collections import deque
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Union
+
+from rpviz.cofactors import CofactorIndex
+
+logger = logging.getLogger(__name__)
+
+# rplibs (and through it cobra and libSBML) is slow to import, it is only
+# imported where files are parsed
+if TYPE_CHECKING:
+    from rplibs import rpPathway, rpSBML
+    from rplibs.rpCompound import rpCompound
+    from rplibs.rpReaction import rpReaction
+
+    from rpviz.cache import DepictionCache, ParseCache
 
 DEBUG = True
 
@@ -383,6 +406,8 @@ def _get_specie_xlinks_old(specie_dict: dict) -> list:
 
 
 def _get_specie_xlinks(cmpd: rpCompound) -> dict:
+    from rplibs.cobra_format import uncobraize
+
     return [
         {
             "db_name": "metanetx",
@@ -418,58 +443,275 @@ def _edge_seem_equal(edge1: dict, edge2: dict) -> bool:
     return False
 
 
-def _merge_nodes(node1: dict, node2: dict) -> dict:
-    node3 = {}
-    for key in node1.keys():
-        # Only node 1 has a value
-        if node1[key] is None:
-            value = node2[key]
-        # Only node 2 has a value
-        elif node2[key] is None:
-            value = node1[key]
-        # Both have a value
-        else:
-            # list of strings
-            if key in ["path_ids", "rule_ids", "all_labels"]:
-                value = list(set(node1[key] + node2[key]))
-            # important str values
-            elif key in ["smiles", "inchi", "inchikey"]:
-                value = node1[key]
-                if node1[key] != node2[key]:
+# Fields of nodes, in the order of the viewer schema
+_NODE_SCHEMA = (
+    "id",
+    "path_ids",
+    "type",
+    "label",
+    "all_labels",
+    "svg",
+    "xlinks",
+    "rsmiles",
+    "rule_ids",
+    "rxn_template_ids",
+    "ec_numbers",
+    "thermo_dg_m_gibbs",
+    "rule_score",
+    "uniprot_ids",
+    "smiles",
+    "inchi",
+    "inchikey",
+    "target_chemical",
+    "sink_chemical",
+    "thermo_dg_m_formation",
+    "cofactor",
+)
+
+
+class _NodeRecord(MutableMapping):
+    """Node of a network.
+
+    Records are read and annotated as mappings of the viewer schema, and
+    are only turned into dictionaries when written (see write_network_json).
+    Subclasses only store fields that can be set for their type of node,
+    other fields of the viewer schema are None. Merged list fields
+    (SET_KEYS) are kept as lists until a second occurrence shows up, then
+    accumulated into insertion-ordered sets (dict keys), until finalized.
+    """
+
+    __slots__ = ()
+    # Fields of the viewer schema, for this type of node
+    SCHEMA = ()
+    SET_KEYS = ("path_ids", "rule_ids", "all_labels")
+    CHECKED_KEYS = ("smiles", "inchi", "inchikey")
+
+    def __init__(self, node: Mapping):
+        for field in self.__slots__:
+            setattr(self, field, node.get(field))
+
+    def __getitem__(self, key: str):
+        if key in self.__slots__:
+            return getattr(self, key)
+        if key in self.SCHEMA:
+            return None
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key in self.__slots__:
+            setattr(self, key, value)
+        elif key not in self.SCHEMA or value is not None:
+            # Fields not stored for this type of node can only be None
+            raise KeyError(f"{key} cannot be set on a {self.type} node")
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("Fields of a node cannot be removed")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.SCHEMA)
+
+    def __len__(self) -> int:
+        return len(self.SCHEMA)
+
+    def merge(self, node: dict) -> None:
+        """Merge another occurrence of the node (see NetworkMerger)."""
+        for key in self.__slots__:
+            value = node.get(key)
+            if value is None:
+                continue
+            old_value = getattr(self, key)
+            if old_value is None:
+                setattr(self, key, value)
+            elif key in self.SET_KEYS:
+                if isinstance(old_value, list):
+                    old_value = dict.fromkeys(old_value)
+                    setattr(self, key, old_value)
+                old_value.update(dict.fromkeys(value))
+            elif key in self.CHECKED_KEYS:
+                if value != old_value:
                     logging.warning(
                         f"Not the same {key} when merging nodes: "
-                        f"{node1[key]} vs {node2[key]}. "
+                        f"{value} vs {old_value}. "
                         f"Keeping the first one"
                     )
-            # float
-            elif key == "rule_score":  # float value
-                value = max(node1[key], node2[key])
-            # list of dicts
+                setattr(self, key, value)
+            elif key == "rule_score":
+                setattr(self, key, max(value, old_value))
             elif key == "xlinks":
-                value = []
-                done = set()
-                for entry in node1[key]:
-                    tag = f'{entry["db_name"]}-{entry["entity_id"]}'
-                    if tag not in done:
-                        value.append(entry)
-                        done.add(tag)
-            # backup plan
+                xlinks = {}
+                for entry in value:
+                    xlinks.setdefault(f'{entry["db_name"]}-{entry["entity_id"]}', entry)
+                setattr(self, key, list(xlinks.values()))
             else:
-                value = node1[key]
-        node3[key] = value
+                setattr(self, key, value)
+
+    def finalized(self) -> _NodeRecord:
+        """Return a copy of the node, with merged lists built and path_ids sorted."""
+        record = type(self)(self)
+        for key in self.SET_KEYS:
+            if record[key] is not None:
+                record[key] = list(record[key])
+        record.path_ids = sorted(record.path_ids)
+        return record
+
+    def to_dict(self) -> dict:
+        """Return the node data, as expected by the viewer."""
+        data = dict.fromkeys(self.SCHEMA)
+        for field in self.__slots__:
+            data[field] = getattr(self, field)
+        return data
+
+
+class _ReactionRecord(_NodeRecord):
+    __slots__ = (
+        "all_labels",
+        "ec_numbers",
+        "id",
+        "label",
+        "path_ids",
+        "rsmiles",
+        "rule_ids",
+        "rule_score",
+        "rxn_template_ids",
+        "svg",
+        "thermo_dg_m_gibbs",
+        "type",
+        "uniprot_ids",
+        "xlinks",
+    )
+    SCHEMA = _NODE_SCHEMA
+
+
+class _ChemicalRecord(_NodeRecord):
+    __slots__ = (
+        "all_labels",
+        "cofactor",
+        "id",
+        "inchi",
+        "inchikey",
+        "label",
+        "path_ids",
+        "sink_chemical",
+        "smiles",
+        "svg",
+        "target_chemical",
+        "thermo_dg_m_formation",
+        "type",
+        "xlinks",
+    )
+    SCHEMA = tuple(field for field in _NODE_SCHEMA if field != "uniprot_ids")
+
+
+class _EdgeRecord(Mapping):
+    """Edge of a network, read as a mapping of the viewer schema."""
+
+    __slots__ = ("id", "path_ids", "source", "target")
+
+    def __init__(self, edge: Mapping):
+        self.id = edge["id"]
+        self.path_ids = edge["path_ids"]
+        self.source = edge["source"]
+        self.target = edge["target"]
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def merge(self, edge: dict) -> None:
+        """Merge another occurrence of the edge (see NetworkMerger)."""
+        if isinstance(self.path_ids, list):
+            self.path_ids = dict.fromkeys(self.path_ids)
+        self.path_ids.update(dict.fromkeys(edge["path_ids"]))
+        self.id = edge["id"]
+        self.source = edge["source"]
+        self.target = edge["target"]
+
+    def finalized(self) -> _EdgeRecord:
+        """Return a copy of the edge, with path_ids sorted."""
+        record = _EdgeRecord(self)
+        record.path_ids = sorted(record.path_ids)
+        return record
+
+    def to_dict(self) -> dict:
+        """Return the edge data, as expected by the viewer."""
+        return {
+            "id": self.id,
+            "path_ids": self.path_ids,
+            "source": self.source,
+            "target": self.target,
+        }
 
-    return node3
 
+class NetworkMerger:
+    """Merge parsed pathways into a single network.
 
-def _merge_edges(edge1: dict, edge2: dict) -> dict:
-    edge3 = {}
-    for key in edge1.keys():
-        if key == "path_ids":
-            value = sorted(list(set(edge1[key] + edge2[key])))
-        else:
-            value = edge1[key]
-        edge3[key] = value
-    return edge3
+    Pathways can be added one at a time. A node (or edge) shared by several
+    pathways is merged in place as new occurrences come: values of the
+    latest occurrence win, except that None never overrides a value,
+    rule_score keeps the maximum, and list values (path_ids, rule_ids,
+    all_labels) are accumulated into sets. Lists are only materialized, and
+    path_ids sorted, when the network is built (see get_network), so that
+    merging does not slow down on nodes shared by many pathways.
+
+    Nodes and edges are held as compact records (slotted objects, storing
+    only the fields of their type of node) rather than dictionaries. The
+    network keeps them as element data through annotation, they are only
+    turned into dictionaries of the viewer schema when written.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        self.pathways_info = {}
+
+    def add(self, nodes: dict, edges: dict, pathway: dict) -> None:
+        """Add a parsed pathway.
+
+        :param nodes: nodes of the pathway, by ID
+        :param edges: edges of the pathway, by ID
+        :param pathway: pathway info
+        """
+        self.pathways_info[pathway["path_id"]] = pathway
+        for node_id, node in nodes.items():
+            if node_id in self.nodes:
+                self.nodes[node_id].merge(node)
+            elif node["type"] == "reaction":
+                self.nodes[node_id] = _ReactionRecord(node)
+            else:
+                self.nodes[node_id] = _ChemicalRecord(node)
+        for edge_id, edge in edges.items():
+            if edge_id in self.edges:
+                self.edges[edge_id].merge(edge)
+            else:
+                self.edges[edge_id] = _EdgeRecord(edge)
+
+    def get_network(self) -> tuple:
+        """Build the network from pathways added so far.
+
+        Element data are new records, so that merging can go on afterwards.
+
+        :return: tuple of (network, pathways_info), as outputted by the
+            parse_all_pathways method
+        """
+        network = {
+            "elements": {
+                "nodes": [{"data": node.finalized()} for node in self.nodes.values()],
+                "edges": [{"data": edge.finalized()} for edge in self.edges.values()],
+            }
+        }
+        # Pathway info, sorted by pathway ID
+        pathways_info = {
+            path_id: self.pathways_info[path_id]
+            for path_id in sorted(self.pathways_info.keys())
+        }
+        return network, pathways_info
 
 
 def parse_one_pathway(rp_pathway: rpPathway) -> tuple:
@@ -635,13 +877,280 @@ def parse_one_pathway(rp_pathway: rpPathway) -> tuple:
     return nodes, edges, pathway
 
 
-def parse_all_pathways(input_files: list) -> tuple:
+def _rpsbml_from_bytes(content: bytes) -> rpSBML:
+    """Build an rpSBML object from an in-memory SBML document.
+
+    rplibs only loads SBML from files, the content is spooled to a temporary
+    file that is removed once loaded.
+
+    :param content: SBML document content
+    :return: rpSBML object
+    """
+    from rplibs import rpSBML
+
+    fd, path = tempfile.mkstemp(suffix=".xml")
+    try:
+        with os.fdopen(fd, "wb") as ofh:
+            ofh.write(content)
+        return rpSBML(path)
+    finally:
+        os.remove(path)
+
+
+def _parse_one_source(source) -> tuple:
+    """Load one rpSBML and extract its nodes, edges and pathway info.
+
+    Defined at module level so that it can be dispatched to worker processes.
+
+    :param source: path to an rpSBML file, or content of an rpSBML file
+        as bytes
+    :return: tuple of (nodes, edges, pathway) plain dictionaries
+    """
+    from rplibs import rpPathway, rpSBML
+
+    if isinstance(source, bytes):
+        rpsbml = _rpsbml_from_bytes(source)
+    else:
+        rpsbml = rpSBML(str(source))
+    pathway = rpPathway.from_rpSBML(rpsbml=rpsbml)
+    return parse_one_pathway(pathway)
+
+
+def _timed_parse_one_source(source) -> tuple:
+    """Same as _parse_one_source, along with the time taken, in seconds."""
+    start = time.perf_counter()
+    parsed = _parse_one_source(source)
+    return parsed, time.perf_counter() - start
+
+
+def _iter_parsed_sources(
+    sources: Iterable,
+    workers: int = 1,
+    cache: ParseCache = None,
+    parse_times: list | None = None,
+) -> Iterator[tuple]:
+    """Parse rpSBMLs, yielding results in the order of sources.
+
+    Sources are consumed lazily: with several workers, only a bounded
+    number of sources are read ahead of the parsed results, so that reading
+    (e.g. from an archive) overlaps with parsing.
+
+    :param sources: iterable of rpSBML file paths or contents as bytes
+    :param workers: number of worker processes, 1 parses in the current
+        process, 0 or less uses all available cores
+    :param cache: cache of parsed files, only files not found in it are
+        parsed
+    :param parse_times: if given, a record is appended for each source,
+        with its pathway ID, file path (None for contents), parse time in
+        seconds (None if found in cache)
+    :return: iterator over (nodes, edges, pathway) tuples
+    """
+    if workers < 1:
+        workers = os.cpu_count() or 1
+    parse = _parse_one_source if parse_times is None else _timed_parse_one_source
+
+    def finish(key, parsed, name, cached):
+        if isinstance(parsed, Future):
+            parsed = parsed.result()
+        parse_time = None
+        if not cached:
+            if parse_times is not None:
+                parsed, parse_time = parsed
+            if key is not None:
+                cache.put(key, parsed)
+        if parse_times is not None:
+            parse_times.append(
+                {
+                    "path_id": parsed[2]["path_id"],
+                    "source": name,
+                    "parse_time_s": parse_time,
+                }
+            )
+        return parsed
+
+    # Results are yielded in the order of sources, so that merging them stays
+    # deterministic whatever the order in which workers complete. Pending
+    # entries are (key, parsed, name, cached) tuples, where key is the cache
+    # key to store the result under (None without cache), parsed is the
+    # result or its future, and cached tells whether it was read from cache.
+    pending = deque()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for source in sources:
+            key = None
+            name = None if isinstance(source, bytes) else str(source)
+            if cache is not None:
+                if not isinstance(source, bytes):
+                    with open(source, "rb") as ifh:
+                        source = ifh.read()
+                key = cache.make_key(source)
+                parsed = cache.get(key)
+                if parsed is not None:
+                    pending.append((key, parsed, name, True))
+                    continue
+            if executor is None:
+                pending.append((key, parse(source), name, False))
+            else:
+                pending.append((key, executor.submit(parse, source), name, False))
+            while pending and (
+                len(pending) > 2 * workers or not isinstance(pending[0][1], Future)
+            ):
+                yield finish(*pending.popleft())
+        while pending:
+            yield finish(*pending.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _select_tar_rpsbmls(tar: tarfile.TarFile, tar_path) -> dict[str, int]:
+    """Pick the rpSBML members of a tar archive, reading their headers only.
+
+    :param tar: archive, opened for streaming
+    :param tar_path: path or file object of the archive, for messages
+    :return: position of selected members in the archive, by name
+    """
+    root = {}
+    nested = {}
+    for position, member in enumerate(tar):
+        member_path = PurePosixPath(member.name)
+        if (
+            not member.isfile()
+            or member_path.suffix != ".xml"
+            or member_path.name.startswith("._")
+        ):
+            continue
+        depth = len(member_path.parts) - 1
+        # Later occurrences of a name overwrite previous ones, as extracting would
+        if depth == 0:
+            root[str(member_path)] = position
+        elif depth == 1:
+            nested[str(member_path)] = position
+    if root and nested:
+        logger.warning(
+            f'rpSBML files found both at the root and in a folder of "{tar_path}". '
+            f"The {len(nested)} nested file(s) are ignored."
+        )
+    return root or nested
+
+
+def iter_tar_rpsbmls(tar_path) -> Iterator[bytes]:
+    """Stream rpSBML file contents out of a tar archive.
+
+    The archive is read sequentially, without extracting it to disk: a first
+    pass over member headers picks rpSBML files, a second one reads them.
+    rpSBML files are expected either at the root of the archive or within a
+    single root folder. When both are present, only files at the root are
+    read. Tar "fork" files (name starting by "._") are skipped, and when a
+    file name appears more than once, only its last occurrence is read.
+
+    Parameters
+    ----------
+    tar_path : str or file object
+        Path to the tar archive, compressed or not, or binary file handle
+        to read it from. Handles that cannot seek are read into memory.
+
+    Yields
+    ------
+    bytes
+        Content of each rpSBML file.
+    """
+    if hasattr(tar_path, "read"):
+        if not tar_path.seekable():
+            tar_path = BytesIO(tar_path.read())
+        start = tar_path.tell()
+        source = {"fileobj": tar_path}
+    else:
+        source = {"name": tar_path}
+    with tarfile.open(mode="r|*", **source) as tar:
+        selected = _select_tar_rpsbmls(tar, tar_path)
+    if hasattr(tar_path, "read"):
+        tar_path.seek(start)
+    selected = set(selected.values())
+    with tarfile.open(mode="r|*", **source) as tar:
+        for position, member in enumerate(tar):
+            if position in selected:
+                yield tar.extractfile(member).read()
+
+
+# Scores exposed by _get_pathway_score
+PATHWAY_SCORES = [
+    "global_score",
+    "rule_score",
+    "fba_target_flux",
+    "thermo_dg_m_gibbs",
+    "steps",
+]
+# Scores for which lower values rank first
+ASCENDING_SCORES = ["thermo_dg_m_gibbs", "steps"]
+
+
+def _top_pathways(parsed: Iterable, top_k: int, rank_by: str) -> list:
+    """Keep the best parsed pathways according to one of their scores.
+
+    Only `top_k` parsed pathways are held at any time (bounded heap, whose
+    root is the worst pathway kept so far). Pathways without the score
+    rank last, ties are broken by input order.
+
+    :param parsed: iterable of (nodes, edges, pathway) tuples
+    :param top_k: number of pathways to keep
+    :param rank_by: score to rank pathways by, see PATHWAY_SCORES
+    :return: (nodes, edges, pathway) tuples of kept pathways, in input order
+    """
+    sign = -1 if rank_by in ASCENDING_SCORES else 1
+    heap = []
+    count = 0
+    for index, (nodes, edges, pathway) in enumerate(parsed):
+        count += 1
+        score = pathway["scores"].get(rank_by)
+        rank = (0, 0) if score is None else (1, sign * score)
+        entry = (rank, -index, (nodes, edges, pathway))
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+    logger.info(f"Keeping {len(heap)} best pathway(s) out of {count} by {rank_by}")
+    return [entry[2] for entry in sorted(heap, key=lambda entry: -entry[1])]
+
+
+def parse_all_pathways(
+    input_files: Iterable,
+    workers: int = 1,
+    cache: ParseCache = None,
+    parse_times: list | None = None,
+    top_k: int | None = None,
+    rank_by: str = "global_score",
+) -> tuple:
     """Parse all pathways from a list of SBML files.
 
     Parameters
     ----------
-    input_files : list
-        List of SBML file paths to parse.
+    input_files : iterable
+        SBML file paths to parse, or SBML contents as bytes (e.g. as
+        yielded by iter_tar_rpsbmls). It is consumed lazily.
+    workers : int, optional
+        Number of worker processes used to load and parse files, by
+        default 1 (no parallelism). Use 0 or less to use all available
+        cores. Results are merged in the order of input files, so that
+        the output does not depend on this value.
+    cache : ParseCache, optional
+        Cache of parsed files. Files already in the cache are not parsed
+        again, and newly parsed files are stored into it. By default, no
+        cache is used.
+    parse_times : list, optional
+        If given, a record is appended for each file, with its pathway ID,
+        file path (None for contents), and parse time in seconds (None if
+        found in cache). By default None.
+    top_k : int, optional
+        If given, only the `top_k` best pathways according to `rank_by` are
+        kept, the other ones do not contribute nodes nor edges. Only that
+        number of parsed pathways is held in memory. By default, all
+        pathways are kept.
+    rank_by : str, optional
+        Score to rank pathways by when `top_k` is given, one of
+        PATHWAY_SCORES, by default "global_score". Higher values rank first,
+        except for thermo_dg_m_gibbs and steps. Pathways without this score
+        rank last.
 
     Returns
     -------
@@ -651,207 +1160,829 @@ def parse_all_pathways(input_files: list) -> tuple:
         - pathways_info: dict, a dictionary containing information about each
           pathway.
     """
-    network = {"elements": {"nodes": [], "edges": []}}
-    all_nodes = {}
-    all_edges = {}
-    pathways_info = {}
-
-    for sbml_path in input_files:
-        rpsbml = rpSBML(str(sbml_path))
-        pathway = rpPathway.from_rpSBML(rpsbml=rpsbml)
-        nodes, edges, pathway = parse_one_pathway(pathway)
-        # Store pathway
-        pathways_info[pathway["path_id"]] = pathway
-        # Store nodes
-        for node_id, node_dict in nodes.items():
-            if node_id in all_nodes:
-                all_nodes[node_id] = _merge_nodes(node_dict, all_nodes[node_id])
-            else:
-                all_nodes[node_id] = node_dict
-        # Store edges
-        for edge_id, edge_dict in edges.items():
-            if edge_id in all_edges:
-                all_edges[edge_id] = _merge_edges(edge_dict, all_edges[edge_id])
-            else:
-                all_edges[edge_id] = edge_dict
-
-    # Finally store nodes
-    for node in all_nodes.values():
-        network["elements"]["nodes"].append({"data": node})
-    for edge in all_edges.values():
-        network["elements"]["edges"].append({"data": edge})
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k should be at least 1, got {top_k}")
+    if rank_by not in PATHWAY_SCORES:
+        raise ValueError(f'Unknown score "{rank_by}", expected one of {PATHWAY_SCORES}')
+    parsed = _iter_parsed_sources(input_files, workers, cache, parse_times)
+    if top_k is not None:
+        parsed = _top_pathways(parsed, top_k, rank_by)
+    merger = NetworkMerger()
+    for nodes, edges, pathway in parsed:
+        merger.add(nodes, edges, pathway)
 
-    # Finally, sort node and edge IDs everywhere
-    for node in network["elements"]["nodes"]:
-        node["data"]["path_ids"] = sorted(node["data"]["path_ids"])
-    for node in network["elements"]["edges"]:
-        node["data"]["path_ids"] = sorted(node["data"]["path_ids"])
-    # Finally, sort pathway_info by pathway ID
-    pathways_info_ordered = {}
-    path_ids_ordered = sorted(pathways_info.keys())
-    for path_id in path_ids_ordered:
-        pathways_info_ordered[path_id] = pathways_info[path_id]
+    if cache is not None:
+        logger.info(f"Parse cache: {cache.hits} hit(s), {cache.misses} miss(es)")
 
-    return network, pathways_info_ordered
+    return merger.get_network()
 
 
-def annotate_cofactors(network: Dict, cofactor_file: str) -> Dict:
+def annotate_cofactors(network: dict, cofactor_file: str | CofactorIndex) -> dict:
     """Annotate cofactors based on structures listed in the cofactor file.
 
     Parameters
     ----------
     network : dict
         Network of elements as outputted by the sbml_to_json method.
-    cofactor_file : str
-        File path to the cofactor file.
+    cofactor_file : str or CofactorIndex
+        File path to the cofactor file, or cofactor index already built from
+        such a file (see CofactorIndex.from_file).
 
     Returns
     -------
     dict
         Network annotated with cofactor information.
     """
-    if not os.path.exists(cofactor_file):
+    if isinstance(cofactor_file, CofactorIndex):
+        cofactors = cofactor_file
+    elif not os.path.exists(cofactor_file):
         logging.error("Cofactor file not found: %s", cofactor_file)
         return network
-
-    # Collect cofactor IDs and structures
-    cof_inchis = set()
-    cof_ids = set()
-    with open(cofactor_file, "r", encoding="utf-8") as ifh:
-        reader = csv.DictReader(ifh, delimiter="\t")
-        for row in reader:
-            if row["ID"].startswith("#"):
-                # Skip row starting with comments
-                continue
-            if row["INCHI"] != "":
-                # InChI describing cofactors
-                cof_inchis.add(row["INCHI"])
-            if row["ID"] != "":
-                # IDs of cofactors
-                cof_ids |= set(row["ID"].split(","))
+    else:
+        cofactors = CofactorIndex.from_file(cofactor_file)
 
     # Match and annotate network elements
     for node in network["elements"]["nodes"]:
-        if node["data"]["type"] == "chemical" and node["data"]["inchi"] is not None:
-            match = False
-            for inchi in cof_inchis:
-                if node["data"]["inchi"].find(inchi) > -1:  # Match
-                    node["data"]["cofactor"] = True
-                    match = True
-                    continue
-            if match:
-                continue  # Optimisation
-        if node["data"]["type"] == "chemical" and len(node["data"]["all_labels"]) > 0:
-            match = False
-            for id_ in cof_ids:
-                for label in node["data"]["all_labels"]:
-                    if label == id_:
-                        node["data"]["cofactor"] = True
-                        match = True
-                        continue
-            if match:
-                continue
+        data = node["data"]
+        if data["type"] == "chemical" and cofactors.match(
+            data["inchi"], data["all_labels"], data["inchikey"]
+        ):
+            data["cofactor"] = True
 
     return network
 
 
-def annotate_chemical_svg(network: Dict) -> Dict:
+def _depict_inchi(inchi: str, width: int = 200, height: int = 200) -> str | None:
+    """Draw a chemical as an SVG data URI.
+
+    :param inchi: InChI of the chemical
+    :param width: width of the picture, in pixels
+    :param height: height of the picture, in pixels
+    :return: the SVG depiction as a data URI, None if the depiction failed
+    """
+    from rdkit.Chem import MolFromInchi
+    from rdkit.Chem.Draw import rdMolDraw2D
+    from rdkit.Chem.AllChem import Compute2DCoords
+    from urllib import parse
+
+    try:
+        mol = MolFromInchi(inchi)
+        # if mol is None:
+        #     raise BaseException('Mol is None')
+        Compute2DCoords(mol)
+        drawer = rdMolDraw2D.MolDraw2DSVG(width, height)
+        drawer.DrawMolecule(mol)
+        drawer.FinishDrawing()
+        svg_draft = drawer.GetDrawingText().replace("svg:", "")
+        return "data:image/svg+xml;charset=utf-8," + parse.quote(svg_draft)
+    except BaseException as e:
+        msg = 'SVG depiction failed from inchi: "{}"'.format(inchi)
+        logger.warning(msg)
+        logger.warning("Below the RDKit backtrace...")
+        logger.warning(e)
+        return None
+
+
+def _depict_inchis(
+    inchis: list, depict, params: dict, cache: DepictionCache, workers: int
+) -> dict[str, str]:
+    """Depict distinct structures, reading and filling the cache.
+
+    :param inchis: distinct InChIs to depict
+    :param depict: function depicting one InChI, returning a string or None
+    :param params: parameters of depict, and other parameters the
+        depictions depend on (used to build cache keys)
+    :param cache: cache of depictions, if any
+    :param workers: number of worker processes, 0 or less uses all
+        available cores
+    :return: depictions by InChI, empty strings for failed ones
+    """
+    # Look for already known depictions
+    depictions = {}
+    if cache is not None:
+        keys = {inchi: cache.make_key(inchi, **params) for inchi in inchis}
+        found = cache.get_many(keys.values())
+        depictions = {inchi: found[key] for inchi, key in keys.items() if key in found}
+        logger.info(f"Depictions found in cache: {len(depictions)} / {len(keys)}")
+
+    # Draw the other ones
+    to_draw = [inchi for inchi in inchis if inchi not in depictions]
+    if workers < 1:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(to_draw) < 2:
+        drawn = [depict(inchi) for inchi in to_draw]
+    else:
+        chunksize = max(1, len(to_draw) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            drawn = list(executor.map(depict, to_draw, chunksize=chunksize))
+    # Failed depictions are stored as empty strings, so that they are
+    # not attempted again when read from cache
+    drawn = {inchi: depiction or "" for inchi, depiction in zip(to_draw, drawn)}
+    depictions.update(drawn)
+
+    # Remember new depictions
+    if cache is not None:
+        cache.put_many({keys[inchi]: depiction for inchi, depiction in drawn.items()})
+
+    return depictions
+
+
+def _depictable_nodes(network: dict) -> list:
+    """Chemical nodes having a structure to depict."""
+    return [
+        node
+        for node in network["elements"]["nodes"]
+        if (
+            node["data"]["type"] == "chemical"
+            and node["data"]["inchi"] is not None
+            and node["data"]["inchi"] != ""
+        )
+    ]
+
+
+def annotate_chemical_svg(
+    network: dict,
+    cache: DepictionCache = None,
+    width: int = 200,
+    height: int = 200,
+    workers: int = 1,
+) -> dict:
     """Annotate chemical nodes with SVGs depiction.
 
+    Each distinct structure is drawn only once, whatever the number of nodes
+    sharing it.
+
     Parameters
     ----------
     network : dict
         Network of elements as outputted by the sbml_to_json method.
+    cache : DepictionCache, optional
+        Persistent cache of depictions. Structures already in the cache are
+        not drawn again, and new depictions are stored into it. By default,
+        no cache is used.
+    width : int, optional
+        Width of depictions, in pixels, by default 200.
+    height : int, optional
+        Height of depictions, in pixels, by default 200.
+    workers : int, optional
+        Number of worker processes used to draw structures, by default 1
+        (no parallelism). Use 0 or less to use all available cores.
 
     Returns
     -------
     dict
         Network annotated with SVG depictions of chemical nodes.
     """
-    from rdkit.Chem import MolFromInchi
-    from rdkit.Chem.Draw import rdMolDraw2D
+    nodes = _depictable_nodes(network)
+    # Distinct structures, in order of first appearance
+    inchis = list(dict.fromkeys(node["data"]["inchi"] for node in nodes))
+
+    params = {"width": width, "height": height}
+    if cache is not None:
+        import rdkit
+
+        params["rdkit"] = rdkit.__version__
+    svgs = _depict_inchis(
+        inchis,
+        partial(_depict_inchi, width=width, height=height),
+        params,
+        cache,
+        workers,
+    )
+
+    # Annotate
+    for node in nodes:
+        node["data"]["svg"] = svgs[node["data"]["inchi"]] or None
+
+    return network
+
+
+def _inchi_coords(inchi: str) -> str | None:
+    """Compute the 2D coordinates of a chemical, for the viewer to draw it.
+
+    :param inchi: InChI of the chemical
+    :return: JSON of {"atoms": [[symbol, x, y, hydrogens, charge], ...],
+        "bonds": [[begin atom, end atom, order], ...]}, None if it failed.
+        Bonds are kekulized. Trailing hydrogen and charge values are omitted
+        when null, hydrogens are only given for atoms labelled by the
+        viewer (heteroatoms and isolated carbons).
+    """
+    from rdkit.Chem import Kekulize, MolFromInchi
     from rdkit.Chem.AllChem import Compute2DCoords
-    from urllib import parse
 
+    try:
+        mol = MolFromInchi(inchi)
+        Kekulize(mol, clearAromaticFlags=True)
+        Compute2DCoords(mol)
+        conformer = mol.GetConformer()
+        atoms = []
+        for atom in mol.GetAtoms():
+            position = conformer.GetAtomPosition(atom.GetIdx())
+            # Adding 0.0 turns -0.0 into 0.0
+            x, y = round(position.x, 2) + 0.0, round(position.y, 2) + 0.0
+            entry = [atom.GetSymbol(), x, y]
+            hydrogens = 0
+            if atom.GetSymbol() != "C" or atom.GetDegree() == 0:
+                hydrogens = atom.GetTotalNumHs()
+            charge = atom.GetFormalCharge()
+            if hydrogens or charge:
+                entry.append(hydrogens)
+            if charge:
+                entry.append(charge)
+            atoms.append(entry)
+        bonds = [
+            [
+                bond.GetBeginAtomIdx(),
+                bond.GetEndAtomIdx(),
+                int(bond.GetBondTypeAsDouble()),
+            ]
+            for bond in mol.GetBonds()
+        ]
+        return json.dumps({"atoms": atoms, "bonds": bonds}, separators=(",", ":"))
+    except BaseException as e:  # noqa: BLE001, RDKit errors are not typed
+        logger.warning(f'2D coordinates failed from inchi: "{inchi}"')
+        logger.warning("Below the RDKit backtrace...")
+        logger.warning(e)
+        return None
+
+
+def _structure_key(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def annotate_structures(
+    network: dict, cache: DepictionCache = None, workers: int = 1
+) -> dict[str, dict]:
+    """Annotate nodes with 2D structures, drawn by the viewer.
+
+    Rather than SVG depictions, the 2D coordinates and bonds of each
+    distinct structure are stored once in the returned table, and the "svg"
+    field of chemical nodes holds the key of their structure. Reaction nodes
+    get the key of an entry listing the structures of their reactants and
+    products, cofactors excepted. The viewer draws depictions from these
+    tables when nodes are displayed.
+
+    Parameters
+    ----------
+    network : dict
+        Network of elements as outputted by the parse_all_pathways method,
+        with cofactors annotated (if any).
+    cache : DepictionCache, optional
+        Persistent cache of structures, see annotate_chemical_svg. By
+        default, no cache is used.
+    workers : int, optional
+        Number of worker processes used to compute structures, by default 1
+        (no parallelism). Use 0 or less to use all available cores.
+
+    Returns
+    -------
+    dict
+        Structures and reaction entries, by key.
+    """
+    nodes = _depictable_nodes(network)
+    inchis = list(dict.fromkeys(node["data"]["inchi"] for node in nodes))
+
+    params = {"format": "coords"}
+    if cache is not None:
+        import rdkit
+
+        params["rdkit"] = rdkit.__version__
+    coords = _depict_inchis(inchis, _inchi_coords, params, cache, workers)
+
+    # Chemicals
+    structures = {}
+    keys = {}
+    for inchi, content in coords.items():
+        if content:
+            keys[inchi] = _structure_key(inchi)
+            structures[keys[inchi]] = json.loads(content)
+    for node in nodes:
+        node["data"]["svg"] = keys.get(node["data"]["inchi"])
+
+    # Reactions
+    chemicals = {
+        node["data"]["id"]: node["data"]
+        for node in network["elements"]["nodes"]
+        if node["data"]["type"] == "chemical"
+    }
+    sides = {
+        node["data"]["id"]: {"reactants": [], "products": []}
+        for node in network["elements"]["nodes"]
+        if node["data"]["type"] == "reaction"
+    }
+    for edge in network["elements"]["edges"]:
+        source, target = edge["data"]["source"], edge["data"]["target"]
+        if target in sides and source in chemicals:
+            sides[target]["reactants"].append(chemicals[source])
+        elif source in sides and target in chemicals:
+            sides[source]["products"].append(chemicals[target])
     for node in network["elements"]["nodes"]:
-        if (
-            node["data"]["type"] == "chemical"
-            and node["data"]["inchi"] is not None
-            and node["data"]["inchi"] != ""
-        ):
-            inchi = node["data"]["inchi"]
-            try:
-                mol = MolFromInchi(inchi)
-                # if mol is None:
-                #     raise BaseException('Mol is None')
-                Compute2DCoords(mol)
-                drawer = rdMolDraw2D.MolDraw2DSVG(200, 200)
-                drawer.DrawMolecule(mol)
-                drawer.FinishDrawing()
-                svg_draft = drawer.GetDrawingText().replace("svg:", "")
-                svg = "data:image/svg+xml;charset=utf-8," + parse.quote(svg_draft)
-                node["data"]["svg"] = svg
-            except BaseException as e:
-                msg = 'SVG depiction failed from inchi: "{}"'.format(inchi)
-                logging.warning(msg)
-                logging.warning("Below the RDKit backtrace...")
-                logging.warning(e)
-                node["data"]["svg"] = None
+        if node["data"]["id"] not in sides:
+            continue
+        entry = {
+            side: [
+                chemical["svg"]
+                for chemical in side_chemicals
+                if chemical["svg"] is not None and not chemical["cofactor"]
+            ]
+            for side, side_chemicals in sides[node["data"]["id"]].items()
+        }
+        node["data"]["svg"] = None
+        if entry["reactants"] or entry["products"]:
+            key = _structure_key(json.dumps(entry))
+            structures[key] = entry
+            node["data"]["svg"] = key
 
-    return network
+    return structures
 
 
-def get_autonomous_html(ifolder, hide_side_panels=False):
-    """Merge all needed file into a single HTML
+def deduplicate_depictions(network: dict) -> dict[str, str]:
+    """Move chemical depictions into a table shared by nodes.
 
-    :param ifolder: folder containing the files to be merged
-    :param hide_side_panels: bool, whether to hide side panels by default
-    :return html_str: string, the HTML
+    Depictions are identical for all nodes sharing a structure. Each of them
+    is stored once in the returned table, keyed by a hash of its content,
+    and the "svg" field of nodes is replaced by the corresponding key. The
+    viewer resolves keys back into depictions when loading the network.
+
+    Parameters
+    ----------
+    network : dict
+        Network of elements as outputted by the annotate_chemical_svg method.
+
+    Returns
+    -------
+    dict
+        Depictions, by key.
     """
-    # find and open the index file
-    html_string = open(ifolder + "/index.html", "rb").read()
-    # open and read JS files and replace them in the HTML
-    js_replace = [
-        "js/chroma-2.1.0.min.js",
-        "js/cytoscape-3.19.0.min.js",
-        "js/cytoscape-dagre-2.3.2.js",
-        "js/dagre-0.8.5.min.js",
-        "js/jquery-3.6.0.min.js",
-        "js/jquery-ui-1.12.1.min.js",
-        "js/jquery.tablesorter-2.31.3.min.js",
-        "js/viewer.js",
-    ]
-    for js in js_replace:
-        js_string = open(ifolder + "/" + js, "rb").read()
-        ori = b'src="' + js.encode() + b'">'
-        rep = b">" + js_string
-        html_string = html_string.replace(ori, rep)
-    # open and read style.css and replace it in the HTML
-    css_replace = [
-        "css/jquery.tablesorte.theme.default-2.31.2.min.css",
-        "css/viewer.css",
+    depictions = {}
+    keys = {}
+    for node in network["elements"]["nodes"]:
+        svg = node["data"].get("svg")
+        if svg is None:
+            continue
+        if svg not in keys:
+            key = hashlib.sha256(svg.encode("utf-8")).hexdigest()[:16]
+            keys[svg] = key
+            depictions[key] = svg
+        node["data"]["svg"] = keys[svg]
+    return depictions
+
+
+def annotate_layout(
+    network: dict, level_spacing: float = 200.0, node_spacing: float = 200.0
+) -> dict:
+    """Annotate nodes with positions of a layered layout.
+
+    Like the breadthfirst layout of the viewer, nodes are put on levels
+    according to their distance to target chemicals, the targets being on
+    the top level. Nodes of a level are ordered by the mean position of
+    their neighbours on the level above, so that edges mostly run straight
+    down. Cofactors are left out of levels, and put next to the nodes they
+    are linked to, unless a reaction they take part in would then miss
+    reactants or products. Positions are stored into the "position" field of nodes,
+    which the viewer uses as a preset layout.
+
+    Parameters
+    ----------
+    network : dict
+        Network of elements as outputted by the parse_all_pathways method,
+        with cofactors annotated (if any).
+    level_spacing : float, optional
+        Vertical distance between levels, in pixels, by default 200.
+    node_spacing : float, optional
+        Horizontal distance between nodes of a level, in pixels, by default
+        200.
+
+    Returns
+    -------
+    dict
+        Network annotated with node positions.
+    """
+    nodes = network["elements"]["nodes"]
+    neighbours = {node["data"]["id"]: [] for node in nodes}
+    edges = [
+        (edge["data"]["source"], edge["data"]["target"])
+        for edge in network["elements"]["edges"]
+        if edge["data"]["source"] in neighbours and edge["data"]["target"] in neighbours
     ]
-    for css_file in css_replace:
-        css_bytes = open(ifolder + "/" + css_file, "rb").read()
+    for source, target in edges:
+        neighbours[source].append(target)
+        neighbours[target].append(source)
+    cofactors = {node["data"]["id"] for node in nodes if node["data"].get("cofactor")}
+
+    # Keep cofactors needed by reactions to have both reactants and products
+    sides = {}
+    for source, target in edges:
+        if source not in cofactors:
+            sides.setdefault(target, set()).add("reactants")
+        if target not in cofactors:
+            sides.setdefault(source, set()).add("products")
+    cofactors = {
+        node_id
+        for node_id in cofactors
+        if all(len(sides.get(reaction, ())) == 2 for reaction in neighbours[node_id])
+    }
+
+    # Levels, from targets first then from any node left (disconnected parts)
+    levels = []
+    level_of = {}
+    roots = [node["data"]["id"] for node in nodes if node["data"]["target_chemical"]]
+    roots += [node["data"]["id"] for node in nodes]
+    for root in roots:
+        if root in level_of or root in cofactors:
+            continue
+        level_of[root] = 0
+        queue = deque([root])
+        while queue:
+            node_id = queue.popleft()
+            level = level_of[node_id]
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(node_id)
+            for neighbour in neighbours[node_id]:
+                if neighbour not in level_of and neighbour not in cofactors:
+                    level_of[neighbour] = level + 1
+                    queue.append(neighbour)
+
+    # Order levels by mean rank of neighbours on the level above
+    rank = {}
+    for level, level_ids in enumerate(levels):
+        if level > 0:
+            barycenters = {}
+            for node_id in level_ids:
+                ranks = [
+                    rank[neighbour]
+                    for neighbour in neighbours[node_id]
+                    if level_of.get(neighbour) == level - 1
+                ]
+                barycenters[node_id] = sum(ranks) / len(ranks) if ranks else 0
+            # Sort is stable, ties keep the order of discovery
+            level_ids.sort(key=barycenters.__getitem__)
+        for index, node_id in enumerate(level_ids):
+            rank[node_id] = index
+
+    positions = {}
+    for level, level_ids in enumerate(levels):
+        offset = (len(level_ids) - 1) / 2
+        for index, node_id in enumerate(level_ids):
+            positions[node_id] = {
+                "x": round((index - offset) * node_spacing, 1),
+                "y": round(level * level_spacing, 1),
+            }
+
+    # Cofactors, shifted aside from the nodes they are linked to
+    shifts = {}
+    for node in nodes:
+        node_id = node["data"]["id"]
+        if node_id not in cofactors:
+            continue
+        anchors = [
+            positions[anchor] for anchor in neighbours[node_id] if anchor in positions
+        ]
+        if anchors:
+            x = sum(anchor["x"] for anchor in anchors) / len(anchors)
+            y = sum(anchor["y"] for anchor in anchors) / len(anchors)
+        else:
+            x, y = 0, len(levels) * level_spacing
+        shift = shifts[(x, y)] = shifts.get((x, y), 0) + 1
+        positions[node_id] = {
+            "x": round(x + shift * node_spacing / 2, 1),
+            "y": round(y + level_spacing / 3, 1),
+        }
+
+    for node in nodes:
+        node["position"] = positions[node["data"]["id"]]
+
+    return network
+
+
+def _get_compact_json_encoder():
+    """Return the fastest available function encoding an object as compact JSON.
+
+    orjson is used when installed, otherwise the standard library is used.
+    """
+    try:
+        import orjson
+    except ImportError:
+        return partial(json.dumps, separators=(",", ":"))
+
+    def encode(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+    return encode
+
+
+def _record_to_dict(obj) -> dict:
+    """Encode network records (see NetworkMerger) for json.dumps."""
+    if isinstance(obj, (_NodeRecord, _EdgeRecord)):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _compact_element(element: dict) -> dict:
+    """Return a copy of a network element without its fields set to None."""
+    data = element["data"]
+    if isinstance(data, (_NodeRecord, _EdgeRecord)):
+        data = data.to_dict()
+    data = {
+        field: field_value
+        for field, field_value in data.items()
+        if field_value is not None
+    }
+    return {**element, "data": data}
+
+
+def _write_compact_network(network: dict, ofh, encode) -> None:
+    """Stream the network as compact JSON, element by element.
+
+    Fields set to None are omitted, the viewer fills them back with defaults.
+    """
+    ofh.write("{")
+    for i, (key, value) in enumerate(network.items()):
+        if i:
+            ofh.write(",")
+        ofh.write(encode(key) + ":")
+        if key != "elements":
+            ofh.write(encode(value))
+            continue
+        ofh.write("{")
+        for j, (group, elements) in enumerate(value.items()):
+            if j:
+                ofh.write(",")
+            ofh.write(encode(group) + ":[")
+            for k, element in enumerate(elements):
+                if k:
+                    ofh.write(",")
+                ofh.write(encode(_compact_element(element)))
+            ofh.write("]")
+        ofh.write("}")
+    ofh.write("}")
+
+
+def write_network_json(
+    network: dict,
+    pathways_info: dict,
+    ofh,
+    compact: bool = False,
+    depictions: dict[str, str] | None = None,
+    structures: dict[str, dict] | None = None,
+) -> None:
+    """Write the network and pathway info in the format read by the viewer.
+
+    Parameters
+    ----------
+    network : dict
+        Network of elements as outputted by the parse_all_pathways method.
+    pathways_info : dict
+        Pathway information as outputted by the parse_all_pathways method.
+    ofh : file object
+        Text file handle to write to.
+    compact : bool, optional
+        If True, the output is written without indentation and element
+        fields set to None are omitted. It is streamed element by element
+        rather than built in memory, using orjson when installed. By
+        default False.
+    depictions : dict, optional
+        Table of depictions referenced by nodes, as outputted by the
+        deduplicate_depictions method. If given, it is written into the
+        depictions variable. By default None.
+    structures : dict, optional
+        Table of 2D structures referenced by nodes, as outputted by the
+        annotate_structures method. If given, it is written into the
+        structures variable. By default None.
+    """
+    if not compact:
+        ofh.write("network = " + json.dumps(network, indent=4, default=_record_to_dict))
+        ofh.write(os.linesep)
+        ofh.write("pathways_info = " + json.dumps(pathways_info, indent=4))
+        if depictions is not None:
+            ofh.write(os.linesep)
+            ofh.write("depictions = " + json.dumps(depictions, indent=4))
+        if structures is not None:
+            ofh.write(os.linesep)
+            ofh.write("structures = " + json.dumps(structures))
+        return
+    encode = _get_compact_json_encoder()
+    ofh.write("network = ")
+    _write_compact_network(network, ofh, encode)
+    ofh.write(os.linesep)
+    ofh.write("pathways_info = {")
+    for i, (path_id, info) in enumerate(pathways_info.items()):
+        if i:
+            ofh.write(",")
+        ofh.write(encode(path_id) + ":" + encode(info))
+    ofh.write("}")
+    if depictions is not None:
+        ofh.write(os.linesep)
+        ofh.write("depictions = " + encode(depictions))
+    if structures is not None:
+        ofh.write(os.linesep)
+        ofh.write("structures = " + encode(structures))
+
+
+def write_network_shards(
+    network: dict,
+    pathways_info: dict,
+    out_folder: str,
+    shard_size: int = 1,
+    compact: bool = False,
+    depictions: dict[str, str] | None = None,
+    structures: dict[str, dict] | None = None,
+) -> None:
+    """Write the network split into shards of pathways, along with an index.
+
+    The index, written in network.json, holds an empty network and the
+    pathway information without node and edge IDs, ie what is needed to
+    build the pathway table. Elements of each group of shard_size pathways
+    are written into a separate script (shards/shard_<N>.js), fetched by the
+    viewer only when one of these pathways is selected. The mapping between
+    pathways and shards is stored in the network_shards variable.
+
+    Parameters
+    ----------
+    network : dict
+        Network of elements as outputted by the parse_all_pathways method.
+    pathways_info : dict
+        Pathway information as outputted by the parse_all_pathways method.
+    out_folder : str
+        Viewer folder.
+    shard_size : int, optional
+        Number of pathways per shard, by default 1.
+    compact : bool, optional
+        If True, the index is written in compact mode (see
+        write_network_json). Shards are always compact. By default False.
+    depictions : dict, optional
+        Table of depictions referenced by nodes, as outputted by the
+        deduplicate_depictions method. If given, each shard holds the
+        depictions of its own nodes. By default None.
+    structures : dict, optional
+        Table of 2D structures referenced by nodes, as outputted by the
+        annotate_structures method. If given, each shard holds the
+        structures of its own nodes. By default None.
+    """
+    nodes_by_id = {node["data"]["id"]: node for node in network["elements"]["nodes"]}
+    edges_by_id = {edge["data"]["id"]: edge for edge in network["elements"]["edges"]}
+    shard_folder = Path(out_folder) / "shards"
+    shard_folder.mkdir(parents=True, exist_ok=True)
+    for old_file in shard_folder.glob("shard_*.js"):
+        old_file.unlink()
+
+    encode = _get_compact_json_encoder()
+    path_ids = list(pathways_info.keys())
+    shard_files = []
+    path_to_shard = {}
+    for shard_idx, start in enumerate(range(0, len(path_ids), shard_size)):
+        chunk = path_ids[start : start + shard_size]
+        node_ids = dict.fromkeys(
+            node_id
+            for path_id in chunk
+            for node_id in pathways_info[path_id]["node_ids"]
+        )
+        edge_ids = dict.fromkeys(
+            edge_id
+            for path_id in chunk
+            for edge_id in pathways_info[path_id]["edge_ids"]
+        )
+        shard = {
+            "elements": {
+                "nodes": [_compact_element(nodes_by_id[_id]) for _id in node_ids],
+                "edges": [_compact_element(edges_by_id[_id]) for _id in edge_ids],
+            },
+            "pathways": {
+                path_id: {
+                    "node_ids": pathways_info[path_id]["node_ids"],
+                    "edge_ids": pathways_info[path_id]["edge_ids"],
+                }
+                for path_id in chunk
+            },
+        }
+        if depictions is not None:
+            shard["depictions"] = {
+                node["data"]["svg"]: depictions[node["data"]["svg"]]
+                for node in shard["elements"]["nodes"]
+                if node["data"].get("svg") is not None
+            }
+        if structures is not None:
+            keys = [
+                node["data"]["svg"]
+                for node in shard["elements"]["nodes"]
+                if node["data"].get("svg") is not None
+            ]
+            # Reaction entries refer to structures of their chemicals
+            keys += [
+                key
+                for entry_key in keys
+                if "atoms" not in structures[entry_key]
+                for side in ("reactants", "products")
+                for key in structures[entry_key][side]
+            ]
+            shard["structures"] = {key: structures[key] for key in keys}
+        shard_file = f"shards/shard_{shard_idx}.js"
+        with open(Path(out_folder) / shard_file, "w", encoding="utf-8") as ofh:
+            ofh.write(f"rpviz_add_shard({shard_idx}, ")
+            ofh.write(encode(shard))
+            ofh.write(");")
+        shard_files.append(shard_file)
+        path_to_shard.update(dict.fromkeys(chunk, shard_idx))
+
+    # Index
+    index_info = {
+        path_id: {**info, "node_ids": [], "edge_ids": []}
+        for path_id, info in pathways_info.items()
+    }
+    with open(Path(out_folder) / "network.json", "w", encoding="utf-8") as ofh:
+        write_network_json(
+            {"elements": {"nodes": [], "edges": []}}, index_info, ofh, compact=compact
+        )
+        ofh.write(os.linesep)
+        ofh.write(
+            "network_shards = "
+            + json.dumps({"files": shard_files, "path_to_shard": path_to_shard})
+        )
+
+
+_AUTONOMOUS_JS = [
+    "js/chroma-2.1.0.min.js",
+    "js/cytoscape-3.19.0.min.js",
+    "js/cytoscape-dagre-2.3.2.js",
+    "js/dagre-0.8.5.min.js",
+    "js/jquery-3.6.0.min.js",
+    "js/jquery-ui-1.12.1.min.js",
+    "js/jquery.tablesorter-2.31.3.min.js",
+    "js/viewer.js",
+]
+_AUTONOMOUS_CSS = [
+    "css/jquery.tablesorte.theme.default-2.31.2.min.css",
+    "css/viewer.css",
+]
+_HIDE_PANELS_JS = b'<script type="text/javascript">document.addEventListener("DOMContentLoaded", function() { $("#interaction, #info").addClass("panel-hidden"); $("#viewer").addClass("panels-hidden"); });</script>'
+
+
+def write_autonomous_html(
+    ifolder: str, ofh, hide_side_panels: bool = False, network=None
+) -> None:
+    """Merge all needed files into a single HTML, written as it is assembled.
+
+    The template is scanned once, and each inlined file is copied by chunks
+    from its source to the output, so that the page is never held in memory.
+
+    Parameters
+    ----------
+    ifolder : str
+        Folder containing the files to be merged.
+    ofh : file object
+        Binary file handle to write to.
+    hide_side_panels : bool, optional
+        Whether to hide side panels by default, by default False.
+    network : file object, optional
+        Binary file handle to read the network from, in place of the
+        network.json file of ifolder. By default None.
+    """
+    with open(os.path.join(ifolder, "index.html"), "rb") as ifh:
+        template = ifh.read()
+
+    # What to replace, and with what (prefix, file, suffix)
+    replacements = {}
+    for js_file in _AUTONOMOUS_JS:
+        ori = b'src="' + js_file.encode() + b'">'
+        replacements[ori] = (b">", js_file, b"")
+    for css_file in _AUTONOMOUS_CSS:
         ori = (
             b'<link href="'
             + css_file.encode()
             + b'" rel="stylesheet" type="text/css"/>'
         )
-        rep = b'<style type="text/css">' + css_bytes + b"</style>"
-        html_string = html_string.replace(ori, rep)
-
-    # Add CSS to hide side panels if requested
+        replacements[ori] = (b'<style type="text/css">', css_file, b"</style>")
     if hide_side_panels:
-        hide_panels_js = b'<script type="text/javascript">document.addEventListener("DOMContentLoaded", function() { $("#interaction, #info").addClass("panel-hidden"); $("#viewer").addClass("panels-hidden"); });</script>'
-        html_string = html_string.replace(b"</head>", hide_panels_js + b"</head>")
-
-    # replace the network
-    net_string = open(ifolder + "/network.json", "rb").read()
-    ori = b'src="' + "network.json".encode() + b'">'
-    rep = b">" + net_string
-    html_string = html_string.replace(ori, rep)
-    return html_string
+        replacements[b"</head>"] = (_HIDE_PANELS_JS + b"</head>", None, b"")
+    replacements[b'src="network.json">'] = (b">", "network.json", b"")
+    pattern = re.compile(b"|".join(re.escape(ori) for ori in replacements))
+
+    position = 0
+    for match in pattern.finditer(template):
+        ofh.write(template[position : match.start()])
+        prefix, file_name, suffix = replacements[match.group()]
+        ofh.write(prefix)
+        if file_name == "network.json" and network is not None:
+            shutil.copyfileobj(network, ofh)
+        elif file_name is not None:
+            with open(os.path.join(ifolder, file_name), "rb") as ifh:
+                shutil.copyfileobj(ifh, ofh)
+        ofh.write(suffix)
+        position = match.end()
+    ofh.write(template[position:])
+
+
+def get_autonomous_html(ifolder, hide_side_panels=False):
+    """Merge all needed file into a single HTML
+
+    :param ifolder: folder containing the files to be merged
+    :param hide_side_panels: bool, whether to hide side panels by default
+    :return html_str: string, the HTML
+    """
+    html = BytesIO()
+    write_autonomous_html(ifolder, html, hide_side_panels=hide_side_panels)
+    return html.getvalue()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,48 @@
+"""Fixtures shared by the rpviz test cases."""
+
+from __future__ import annotations
+
+import pytest
+
+from rpviz.utils import _NODE_SCHEMA
+
+
+def _node(node_id: str, node_type: str, path_ids: list, **data) -> dict:
+    """Node data of the viewer schema, unset fields being None."""
+    node = dict.fromkeys(_NODE_SCHEMA)
+    if node_type == "chemical":
+        del node["uniprot_ids"]
+    node.update(
+        {
+            "id": node_id,
+            "path_ids": list(path_ids),
+            "type": node_type,
+            "label": node_id,
+            "all_labels": [node_id],
+            "xlinks": [],
+        }
+    )
+    node.update(data)
+    return node
+
+
+def _edge(source: str, target: str, path_ids: list) -> dict:
+    """Edge data of the viewer schema."""
+    return {
+        "id": f"{source}_{target}",
+        "path_ids": list(path_ids),
+        "source": source,
+        "target": target,
+    }
+
+
+@pytest.fixture
+def make_node():
+    """Build node data, see _node."""
+    return _node
+
+
+@pytest.fixture
+def make_edge():
+    """Build edge data, see _edge."""
+    return _edge
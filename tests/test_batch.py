@@ -0,0 +1,55 @@
+"""Test cases for the rpviz batch module."""
+
+import json
+from pathlib import Path
+
+from rpviz.batch import main
+
+REF_IN_DIR = Path(__file__).resolve().parent / "inputs" / "as_dir"
+REF_IN_TAR = Path(__file__).resolve().parent / "inputs" / "as_tar.tgz"
+
+
+def test_manifest(tmpdir):
+    """Test that a broken input does not abort the other jobs."""
+    manifest = tmpdir / "manifest.tsv"
+    manifest.write_text(
+        "\n".join(
+            [
+                "# input\toutput\tautonomous HTML",
+                f"{REF_IN_TAR}\tout_tar\tout_tar.html",
+                "missing.tgz\tout_missing",
+                f"{REF_IN_DIR}\tout_dir",
+            ]
+        ),
+        encoding="utf-8",
+    )
+    summary = tmpdir / "summary.json"
+    args = [
+        "--manifest",
+        str(manifest),
+        "--no-depiction-cache",
+        "--summary",
+        str(summary),
+    ]
+    assert main(args) == 1
+    statuses = json.loads(summary.read_text(encoding="utf-8"))["jobs"]
+    assert [status["status"] for status in statuses] == ["ok", "failed", "ok"]
+    assert statuses[0]["pathways"] == 4
+    assert (tmpdir / "out_tar" / "network.json").exists()
+    assert (tmpdir / "out_tar.html").exists()
+    assert (tmpdir / "out_dir" / "network.json").exists()
+
+
+def test_inputs(tmpdir):
+    """Test that output folders are named after inputs."""
+    args = [
+        "--inputs",
+        str(REF_IN_TAR),
+        "--output-root",
+        str(tmpdir),
+        "--jobs",
+        "2",
+        "--no-depiction-cache",
+    ]
+    assert main(args) == 0
+    assert (tmpdir / "as_tar" / "network.json").exists()
@@ -0,0 +1,21 @@
+"""Test cases for the rpviz cache module."""
+
+from rpviz.cache import ParseCache
+
+
+def test_parse_cache_clear(tmp_path):
+    """Test that clearing the parse cache leaves other content alone."""
+    cache = ParseCache(tmp_path)
+    key = cache.make_key(b"<sbml/>")
+    cache.put(key, ([], [], {}))
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "keep.txt").write_text("keep", encoding="utf-8")
+    (tmp_path / "keep.txt").write_text("keep", encoding="utf-8")
+    assert cache.get(key) == ([], [], {})
+
+    cache.clear()
+    assert cache.get(key) is None
+    assert not (tmp_path / key[:2]).exists()
+    assert (other / "keep.txt").exists()
+    assert (tmp_path / "keep.txt").exists()
@@ -163,3 +163,252 @@ def test_without_cofactors(mocker, tmpdir):
         for node in test_objects["network"]["elements"]["nodes"]
         if node["data"]["type"] == "chemical"
     )
+
+
+def test_parallel_parse(mocker, tmpdir):
+    """Test that parsing with several workers gives the serial output."""
+    outputs = []
+    for jobs in ("1", "2"):
+        out_dir = tmpdir / f"jobs_{jobs}"
+        args = [
+            "prog",
+            str(REF_IN_DIR),
+            str(out_dir),
+            "--no-cofactor-detection",
+            "--jobs",
+            jobs,
+        ]
+        mocker.patch("sys.argv", args)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        with open(out_dir / "network.json", encoding="utf-8") as fh:
+            outputs.append(fh.read())
+    assert outputs[0] == outputs[1]
+
+
+def test_depiction_cache(mocker, tmpdir):
+    """Test that depictions read from cache match freshly drawn ones."""
+    cache_file = tmpdir / "depictions.sqlite"
+    outputs = []
+    for run in ("cold", "warm"):
+        out_dir = tmpdir / run
+        args = [
+            "prog",
+            str(REF_IN_DIR),
+            str(out_dir),
+            "--no-cofactor-detection",
+            "--depiction-cache",
+            str(cache_file),
+        ]
+        mocker.patch("sys.argv", args)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        outputs.append(__read_multi_object_json(out_dir / "network.json"))
+    assert cache_file.exists()
+    assert not deepdiff.DeepDiff(outputs[0], outputs[1], ignore_order=True)
+
+
+def test_parse_cache(mocker, tmpdir):
+    """Test that parsed files read from cache give the same output."""
+    cache_dir = tmpdir / "parse_cache"
+    outputs = []
+    for run in ("cold", "warm"):
+        out_dir = tmpdir / run
+        args = [
+            "prog",
+            str(REF_IN_TAR),
+            str(out_dir),
+            "--no-cofactor-detection",
+            "--parse-cache",
+            str(cache_dir),
+        ]
+        mocker.patch("sys.argv", args)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        with open(out_dir / "network.json", encoding="utf-8") as fh:
+            outputs.append(fh.read())
+    assert len(list(Path(cache_dir).glob("*/*.json"))) == 4
+    assert outputs[0] == outputs[1]
+
+
+def test_compact_json(mocker, tmpdir):
+    """Test that the compact output holds the same non-empty data."""
+    outputs = []
+    for option in ([], ["--compact-json"]):
+        out_dir = tmpdir / ("compact" if option else "default")
+        args = ["prog", str(REF_IN_TAR), str(out_dir), "--no-cofactor-detection"]
+        mocker.patch("sys.argv", args + option)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        outputs.append(__read_multi_object_json(out_dir / "network.json"))
+    default, compact = outputs
+    for node in default["network"]["elements"]["nodes"]:
+        node["data"] = {k: v for k, v in node["data"].items() if v is not None}
+    assert not deepdiff.DeepDiff(default, compact, ignore_order=True)
+    assert (tmpdir / "compact" / "network.json").size() < (
+        tmpdir / "default" / "network.json"
+    ).size()
+
+
+def test_sharded_output(mocker, tmpdir):
+    """Test that shards hold all elements of the network."""
+    args = [
+        "prog",
+        str(REF_IN_TAR),
+        str(tmpdir),
+        "--no-cofactor-detection",
+        "--shard-size",
+        "3",
+    ]
+    mocker.patch("sys.argv", args)
+    parser = __build_arg_parser()
+    args = parser.parse_args()
+    __run(args)
+    index = __read_multi_object_json(tmpdir / "network.json")
+    assert index["network"]["elements"] == {"nodes": [], "edges": []}
+    assert len(index["network_shards"]["files"]) == 2
+    node_ids = set()
+    for shard_file in index["network_shards"]["files"]:
+        content = (tmpdir / shard_file).read_text(encoding="utf-8")
+        shard = json.loads(content[content.index(",") + 1 : content.rindex(")")])
+        node_ids |= {node["data"]["id"] for node in shard["elements"]["nodes"]}
+    ref_objects = __read_multi_object_json(REF_OUT_DIR / "network.json")
+    assert node_ids == {
+        node["data"]["id"] for node in ref_objects["network"]["elements"]["nodes"]
+    }
+
+
+def test_dedup_depictions(mocker, tmpdir):
+    """Test that deduplicated depictions resolve to the default ones."""
+    outputs = []
+    for option in ([], ["--dedup-depictions"]):
+        out_dir = tmpdir / ("dedup" if option else "default")
+        args = ["prog", str(REF_IN_TAR), str(out_dir), "--no-cofactor-detection"]
+        mocker.patch("sys.argv", args + option)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        outputs.append(__read_multi_object_json(out_dir / "network.json"))
+    default, dedup = outputs
+    depictions = dedup.pop("depictions")
+    assert len(set(depictions.values())) == len(depictions)
+    for node in dedup["network"]["elements"]["nodes"]:
+        if node["data"]["svg"] is not None:
+            node["data"]["svg"] = depictions[node["data"]["svg"]]
+    assert default == dedup
+
+
+def test_autonomous_html(mocker, tmpdir):
+    """Test that the autonomous HTML inlines all assets and the network."""
+    html_file = tmpdir / "viewer.html"
+    args = [
+        "prog",
+        str(REF_IN_TAR),
+        str(tmpdir / "out"),
+        "--no-cofactor-detection",
+        "--autonomous_html",
+        str(html_file),
+    ]
+    mocker.patch("sys.argv", args)
+    parser = __build_arg_parser()
+    args = parser.parse_args()
+    __run(args)
+    html = html_file.read_binary()
+    assert b'src="js/viewer.js"' not in html
+    assert b'src="network.json"' not in html
+    assert b'<link href="css/viewer.css"' not in html
+    assert (tmpdir / "out" / "network.json").read_binary() in html
+
+
+def test_profile(mocker, tmpdir):
+    """Test that the profile report covers all stages and files."""
+    profile_file = tmpdir / "profile.json"
+    args = [
+        "prog",
+        str(REF_IN_TAR),
+        str(tmpdir / "out"),
+        "--no-depiction-cache",
+        "--profile",
+        str(profile_file),
+        "--profile-stage",
+        "parse",
+    ]
+    mocker.patch("sys.argv", args)
+    parser = __build_arg_parser()
+    args = parser.parse_args()
+    __run(args)
+    report = json.loads(profile_file.read_text(encoding="utf-8"))
+    assert [stage["name"] for stage in report["stages"]] == [
+        "parse",
+        "cofactors",
+        "depiction",
+        "templates",
+        "write_json",
+    ]
+    assert report["stages"][0]["items"]["pathways"] == 4
+    assert len(report["parse_times"]) == 4
+    assert (tmpdir / "profile.json.parse.pstats").exists()
+
+
+def test_watch(mocker, tmpdir):
+    """Test that the watch mode gives the same network as a single run."""
+    args = [
+        "prog",
+        str(REF_IN_DIR),
+        str(tmpdir),
+        "--no-cofactor-detection",
+        "--watch",
+        "--watch-interval",
+        "0.1",
+        "--watch-timeout",
+        "0.3",
+    ]
+    mocker.patch("sys.argv", args)
+    parser = __build_arg_parser()
+    args = parser.parse_args()
+    __run(args)
+    ref_objects = __read_multi_object_json(REF_OUT_DIR / "network.json")
+    test_objects = __read_multi_object_json(tmpdir / "network.json")
+    assert not deepdiff.DeepDiff(
+        ref_objects,
+        test_objects,
+        ignore_order=True,
+        exclude_regex_paths=EXCLUDE_SVG,
+    )
+    assert not (tmpdir / "network.json.tmp").exists()
+
+
+@pytest.mark.parametrize("mode", ["update", "hardlink", "symlink"])
+def test_assets(mocker, tmpdir, mode):
+    """Test that assets are copied or linked according to the mode."""
+    store = tmpdir / "store"
+    for out_folder in (tmpdir / "out_1", tmpdir / "out_2"):
+        args = [
+            "prog",
+            str(REF_IN_TAR),
+            str(out_folder),
+            "--no-depiction-cache",
+            "--assets",
+            mode,
+            "--asset-store",
+            str(store),
+        ]
+        mocker.patch("sys.argv", args)
+        parser = __build_arg_parser()
+        args = parser.parse_args()
+        __run(args)
+        # Run twice, over existing files
+        __run(args)
+        assert (out_folder / "network.json").exists()
+    viewer_1 = Path(tmpdir / "out_1" / "js" / "viewer.js")
+    viewer_2 = Path(tmpdir / "out_2" / "js" / "viewer.js")
+    assert viewer_1.read_bytes() == viewer_2.read_bytes()
+    if mode == "update":
+        assert not store.exists()
+    else:
+        assert viewer_1.samefile(viewer_2)
+        assert viewer_1.is_symlink() == (mode == "symlink")
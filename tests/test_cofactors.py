@@ -0,0 +1,42 @@
+"""Test cases for the rpviz cofactors module."""
+
+import csv
+from pathlib import Path
+
+from rpviz.cofactors import CofactorIndex
+
+COF_FILE = Path(__file__).resolve().parent / "inputs" / "cofactors_mnx_202507.tsv"
+
+
+def __naive_match(inchi, labels, cof_inchis, cof_ids) -> bool:
+    """Reference implementation, testing every cofactor one by one."""
+    if inchi is not None and any(inchi.find(cof) > -1 for cof in cof_inchis):
+        return True
+    return any(label == id_ for id_ in cof_ids for label in labels)
+
+
+def test_same_as_naive_matching():
+    """Test that the index gives the same results as pairwise matching."""
+    index = CofactorIndex.from_file(COF_FILE)
+    with open(COF_FILE, encoding="utf-8") as ifh:
+        rows = list(csv.DictReader(ifh, delimiter="\t"))
+    queries = [(None, ["MNXM2"]), (None, ["UNKNOWN"]), ("InChI=1S/C8H8", ["X"])]
+    for row in rows:
+        # Exact InChI, InChI having extra layers, truncated InChI
+        queries.append((row["INCHI"], ["X"]))
+        queries.append((row["INCHI"] + "/i1+1", []))
+        queries.append((row["INCHI"][:-2], []))
+    for inchi, labels in queries:
+        assert index.match(inchi, labels) == __naive_match(
+            inchi, labels, index.inchis, index.ids
+        )
+
+
+def test_inchikey_shortcut():
+    """Test that InChIKeys do not match on their own."""
+    index = CofactorIndex(
+        inchis=["InChI=1S/H2O/h1H2"],
+        inchikeys={"XLYOFNOQVPJJNP-UHFFFAOYSA-N": ["InChI=1S/H2O/h1H2"]},
+    )
+    assert index.match("InChI=1S/H2O/h1H2", [], "XLYOFNOQVPJJNP-UHFFFAOYSA-N")
+    assert not index.match("InChI=1S/CH4/h1H4", [], "XLYOFNOQVPJJNP-UHFFFAOYSA-N")
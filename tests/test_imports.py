@@ -0,0 +1,21 @@
+"""Test cases for the import cost of rpviz modules."""
+
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["rplibs", "cobra", "libsbml", "rdkit", "pandas", "bs4"]
+
+
+@pytest.mark.parametrize("module", ["rpviz", "rpviz.__main__", "rpviz.server"])
+def test_no_heavy_import(module):
+    """Test that heavy dependencies are not imported at startup."""
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert process.stdout.strip() == ""
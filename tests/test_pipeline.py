@@ -0,0 +1,110 @@
+"""Test cases for the rpviz pipeline module."""
+
+from contextlib import ExitStack
+from pathlib import Path
+
+import deepdiff
+import pytest
+
+from rpviz import Pipeline
+from rpviz.pipeline import IncrementalBuild
+
+REF_IN_DIR = Path(__file__).resolve().parent / "inputs" / "as_dir"
+REF_IN_TAR = Path(__file__).resolve().parent / "inputs" / "as_tar.tgz"
+
+
+def __nodes(result) -> dict:
+    return {
+        node["data"]["id"]: node["data"] for node in result.network["elements"]["nodes"]
+    }
+
+
+def test_inputs():
+    """Test that all kinds of inputs give the same network."""
+    xml_files = sorted(REF_IN_DIR.glob("*.xml"))
+    with Pipeline(cofactor_file=None) as pipeline, ExitStack() as stack:
+        handles = [stack.enter_context(open(file, "rb")) for file in xml_files]
+        results = [
+            pipeline.run(REF_IN_DIR),
+            pipeline.run(xml_files),
+            pipeline.run([file.read_bytes() for file in xml_files]),
+            pipeline.run([file.read_text(encoding="utf-8") for file in xml_files]),
+            pipeline.run(handles),
+        ]
+        tar_results = [
+            pipeline.run(REF_IN_TAR),
+            pipeline.run(REF_IN_TAR.read_bytes()),
+        ]
+    for result in results[1:]:
+        assert __nodes(result) == __nodes(results[0])
+        assert result.pathways_info == results[0].pathways_info
+    # Archive order may differ, only compare contents
+    for result in tar_results:
+        assert not deepdiff.DeepDiff(
+            __nodes(result), __nodes(results[0]), ignore_order=True
+        )
+
+
+def test_outputs(tmpdir):
+    """Test that the HTML and the written viewer hold the network."""
+    with Pipeline() as pipeline:
+        result = pipeline.run(REF_IN_TAR)
+    network_json = result.network_json()
+    assert network_json.encode("utf-8") in result.html()
+    result.write(tmpdir)
+    assert (tmpdir / "network.json").read_text(encoding="utf-8") == network_json
+    assert (tmpdir / "index.html").exists()
+    assert any(node["data"]["cofactor"] for node in result.network["elements"]["nodes"])
+
+
+def test_incremental_build():
+    """Test that adding files in batches gives the same network at once."""
+    xml_files = sorted(REF_IN_DIR.glob("*.xml"))
+    with Pipeline() as pipeline:
+        result = pipeline.run(xml_files)
+        build = IncrementalBuild(pipeline)
+        assert build.add(xml_files[:1]) == 1
+        partial = build.result()
+        assert build.add(xml_files[1:]) == len(xml_files) - 1
+        incremental = build.result()
+    assert len(partial.pathways_info) == 1
+    assert __nodes(incremental) == __nodes(result)
+    assert incremental.pathways_info == result.pathways_info
+
+
+def test_top_k():
+    """Test that only the best pathways contribute to the network."""
+    with Pipeline(cofactor_file=None) as pipeline:
+        result = pipeline.run(REF_IN_TAR)
+        scores = {
+            path_id: info["scores"]["global_score"]
+            for path_id, info in result.pathways_info.items()
+        }
+        pipeline.top_k = 2
+        top_result = pipeline.run(REF_IN_TAR)
+    best = sorted(scores, key=lambda path_id: scores[path_id], reverse=True)[:2]
+    assert sorted(top_result.pathways_info) == sorted(best)
+    for node in top_result.network["elements"]["nodes"]:
+        assert set(node["data"]["path_ids"]) <= set(best)
+
+
+def test_depiction_coords():
+    """Test that nodes refer to 2D structures in coords depiction mode."""
+    with Pipeline(cofactor_file=None, depiction="coords") as pipeline:
+        result = pipeline.run(REF_IN_TAR)
+    structures = result.structures
+    assert "structures = " in result.network_json()
+    for node in result.network["elements"]["nodes"]:
+        key = node["data"]["svg"]
+        if node["data"]["type"] == "chemical" and node["data"]["inchi"]:
+            assert len(structures[key]["atoms"]) > 0
+        elif key is not None:
+            entry = structures[key]
+            for chemical_key in entry["reactants"] + entry["products"]:
+                assert "atoms" in structures[chemical_key]
+    assert any(
+        node["data"]["type"] == "reaction" and node["data"]["svg"] is not None
+        for node in result.network["elements"]["nodes"]
+    )
+    with pytest.raises(ValueError):
+        Pipeline(depiction="coords", dedup_depictions=True)
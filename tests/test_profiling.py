@@ -0,0 +1,21 @@
+"""Test cases for the rpviz profiling module."""
+
+import tracemalloc
+
+from rpviz.profiling import Profiler
+
+
+def test_memory_tracing():
+    """Test that allocations are only traced on request, stage by stage."""
+    profiler = Profiler()
+    with profiler.stage("untraced"):
+        assert not tracemalloc.is_tracing()
+    profiler.trace_memory = True
+    with profiler.stage("traced"):
+        assert tracemalloc.is_tracing()
+        data = [0] * 100000
+    assert not tracemalloc.is_tracing()
+    untraced, traced = profiler.stages
+    assert untraced["peak_traced_memory_bytes"] is None
+    assert traced["peak_traced_memory_bytes"] >= len(data) * 8
+    assert traced["process_peak_rss_bytes"] >= untraced["process_peak_rss_bytes"]
@@ -0,0 +1,76 @@
+"""Test cases for the rpviz server module."""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from rpviz.server import RenderServer
+
+REF_IN_TAR = Path(__file__).resolve().parent / "inputs" / "as_tar.tgz"
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = RenderServer(
+        ("127.0.0.1", 0), {"cofactor_file": None}, workers=1, max_queue=1
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def __post(url: str, data: bytes) -> bytes:
+    request = urllib.request.Request(url, data=data)
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def test_health(server_url):
+    with urllib.request.urlopen(server_url + "/health") as response:
+        assert json.loads(response.read())["status"] == "ok"
+
+
+def test_render(server_url):
+    tar_content = REF_IN_TAR.read_bytes()
+    network_json = __post(server_url + "/render?format=json", tar_content)
+    assert network_json.startswith(b"network = ")
+    html = __post(server_url + "/render", tar_content)
+    assert b"<html" in html
+    assert b"network = " in html
+
+
+def test_errors(server_url):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        __post(server_url + "/render", b"")
+    assert e.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as e:
+        __post(server_url + "/render?format=pdf", REF_IN_TAR.read_bytes())
+    assert e.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as e:
+        __post(server_url + "/unknown", b"")
+    assert e.value.code == 404
+
+
+def test_broken_workers():
+    """Test that a broken worker pool is started again."""
+    # Workers fail to start, as the pipeline does not accept these options
+    server = RenderServer(("127.0.0.1", 0), {"unknown": None}, workers=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/render"
+    try:
+        for _ in range(2):
+            executor = server.executor
+            with pytest.raises(urllib.error.HTTPError) as e:
+                __post(url, REF_IN_TAR.read_bytes())
+            assert e.value.code == 503
+            assert server.executor is not executor
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,266 @@
+"""Test cases for the rpviz utils module."""
+
+from __future__ import annotations
+
+import copy
+import json
+import tarfile
+from io import BytesIO, StringIO
+
+import pytest
+
+from rpviz.cache import MemoryDepictionCache
+from rpviz.utils import (
+    _NODE_SCHEMA,
+    NetworkMerger,
+    annotate_chemical_svg,
+    annotate_layout,
+    iter_tar_rpsbmls,
+    write_network_json,
+)
+
+
+@pytest.fixture
+def make_pathway(make_node, make_edge):
+    """Build a parsed pathway of one reaction consuming one chemical."""
+
+    def make(path_id: str, rule_score: float, ec_numbers: list | None = None) -> tuple:
+        nodes = {
+            "RXN": make_node(
+                "RXN",
+                "reaction",
+                [path_id],
+                rule_ids=[f"RULE_{path_id}"],
+                ec_numbers=ec_numbers,
+                rule_score=rule_score,
+            ),
+            "CMPD": make_node(
+                "CMPD",
+                "chemical",
+                [path_id],
+                all_labels=["CMPD", f"name_{path_id}"],
+                inchi="InChI=1S/CH4/h1H4",
+                target_chemical=True,
+                sink_chemical=False,
+                cofactor=False,
+            ),
+        }
+        edges = {"CMPD_RXN": make_edge("CMPD", "RXN", [path_id])}
+        return nodes, edges, {"path_id": path_id}
+
+    return make
+
+
+def test_network_merger(make_pathway):
+    """Test that nodes and edges shared by pathways are merged."""
+    merger = NetworkMerger()
+    merger.add(*make_pathway("P2", 0.9, ["1.1.1.1"]))
+    merger.add(*make_pathway("P1", 0.5))
+    network, pathways_info = merger.get_network()
+    assert list(pathways_info) == ["P1", "P2"]
+    reaction, chemical = [node["data"] for node in network["elements"]["nodes"]]
+    assert list(reaction) == list(_NODE_SCHEMA)
+    assert "uniprot_ids" not in chemical
+    assert reaction["path_ids"] == ["P1", "P2"]
+    assert reaction["rule_ids"] == ["RULE_P2", "RULE_P1"]
+    assert reaction["rule_score"] == 0.9
+    # None never overrides a value
+    assert reaction["ec_numbers"] == ["1.1.1.1"]
+    assert chemical["all_labels"] == ["CMPD", "name_P2", "name_P1"]
+    assert network["elements"]["edges"][0]["data"]["path_ids"] == ["P1", "P2"]
+    # Merging can go on after the network is built
+    merger.add(*make_pathway("P3", 0.1))
+    network, _ = merger.get_network()
+    assert network["elements"]["nodes"][0]["data"]["path_ids"] == ["P1", "P2", "P3"]
+
+
+def test_network_merger_accumulators(make_pathway):
+    """Test that shared elements accumulate values across many pathways."""
+    pathways = [
+        make_pathway("P3", 0.2, ["1.1.1.1"]),
+        make_pathway("P1", 0.7),
+        make_pathway("P2", 0.4, ["2.2.2.2"]),
+    ]
+    # Same rule as a previous pathway, and a duplicated cross-reference
+    xlink = {"db_name": "intenz", "entity_id": "2.2.2.2", "url": "url"}
+    pathways[2][0]["RXN"]["rule_ids"] = ["RULE_P3"]
+    pathways[2][0]["RXN"]["xlinks"] = [xlink, dict(xlink)]
+    snapshot = copy.deepcopy(pathways)
+    merger = NetworkMerger()
+    for pathway in pathways:
+        merger.add(*pathway)
+    # Pathways are merged without being modified
+    assert pathways == snapshot
+    network, _ = merger.get_network()
+    reaction, chemical = [node["data"] for node in network["elements"]["nodes"]]
+    assert reaction["path_ids"] == ["P1", "P2", "P3"]
+    assert reaction["rule_ids"] == ["RULE_P3", "RULE_P1"]
+    assert reaction["rule_score"] == 0.7
+    assert reaction["ec_numbers"] == ["2.2.2.2"]
+    assert reaction["xlinks"] == [xlink]
+    assert chemical["all_labels"] == ["CMPD", "name_P3", "name_P1", "name_P2"]
+    assert network["elements"]["edges"][0]["data"]["path_ids"] == ["P1", "P2", "P3"]
+
+
+def test_network_records_written(make_pathway):
+    """Test that merged elements are annotated in place and written as dicts."""
+    merger = NetworkMerger()
+    merger.add(*make_pathway("P1", 0.5))
+    network, pathways_info = merger.get_network()
+    reaction, chemical = [node["data"] for node in network["elements"]["nodes"]]
+    chemical["cofactor"] = True
+    chemical["svg"] = "<svg/>"
+    # Fields not stored for reactions only take None
+    reaction.update({"cofactor": None, "svg": None})
+    annotate_layout(network)
+    expected = [dict(reaction), dict(chemical)]
+    assert expected[1]["cofactor"] is True
+    for compact in (False, True):
+        ofh = StringIO()
+        write_network_json(network, pathways_info, ofh, compact=compact)
+        content = ofh.getvalue().split("pathways_info = ")[0][len("network = ") :]
+        nodes = [node["data"] for node in json.loads(content)["elements"]["nodes"]]
+        if compact:
+            assert nodes == [
+                {key: value for key, value in data.items() if value is not None}
+                for data in expected
+            ]
+        else:
+            assert nodes == expected
+
+
+def test_annotate_chemical_svg(monkeypatch):
+    """Test that each distinct chemical is drawn once, across processes."""
+    inchis = ["InChI=1S/CH4/h1H4", "InChI=1S/H2O/h1H2", "InChI=1S/CH4/h1H4", "bad"]
+    network = {
+        "elements": {
+            "nodes": [
+                {"data": {"id": f"C{index}", "type": "chemical", "inchi": inchi}}
+                for index, inchi in enumerate(inchis)
+            ]
+        }
+    }
+    cache = MemoryDepictionCache()
+    network = annotate_chemical_svg(network, cache=cache, workers=2)
+    svgs = [node["data"]["svg"] for node in network["elements"]["nodes"]]
+    assert svgs[0].startswith("data:image/svg+xml")
+    assert svgs[1].startswith("data:image/svg+xml")
+    assert svgs[0] != svgs[1]
+    # Nodes sharing a structure share its single depiction
+    assert svgs[2] is svgs[0]
+    assert svgs[3] is None
+
+    # Depictions, failures included, are read from cache rather than redrawn
+    def depict(inchi, **kwargs):
+        raise AssertionError(f"{inchi} drawn again")
+
+    monkeypatch.setattr("rpviz.utils._depict_inchi", depict)
+    network = annotate_chemical_svg(network, cache=cache, workers=2)
+    assert [node["data"]["svg"] for node in network["elements"]["nodes"]] == svgs
+
+
+def test_annotate_layout():
+    """Test that nodes are put on levels below targets, cofactors aside."""
+
+    def node(node_id, target=False, cofactor=False):
+        return {
+            "data": {"id": node_id, "target_chemical": target, "cofactor": cofactor}
+        }
+
+    def edge(source, target):
+        return {"data": {"source": source, "target": target}}
+
+    # PRE + ATP -> RXN1 -> TARGET + ADP, PRE2 -> RXN2 -> ATP
+    network = {
+        "elements": {
+            "nodes": [
+                node("PRE2"),
+                node("RXN2"),
+                node("PRE"),
+                node("ATP", cofactor=True),
+                node("RXN1"),
+                node("ADP", cofactor=True),
+                node("TARGET", target=True),
+            ],
+            "edges": [
+                edge("PRE", "RXN1"),
+                edge("ATP", "RXN1"),
+                edge("RXN1", "TARGET"),
+                edge("RXN1", "ADP"),
+                edge("PRE2", "RXN2"),
+                edge("RXN2", "ATP"),
+            ],
+        }
+    }
+    annotate_layout(network, level_spacing=10, node_spacing=10)
+    positions = {
+        node["data"]["id"]: (node["position"]["x"], node["position"]["y"])
+        for node in network["elements"]["nodes"]
+    }
+    assert positions["TARGET"] == (0, 0)
+    assert positions["RXN1"] == (0, 10)
+    # ADP is aside of RXN1, ATP is levelled as the product of RXN2
+    assert positions["ADP"][1] not in (0, 10, 20)
+    assert positions["PRE"][1] == positions["ATP"][1] == 20
+    assert positions["RXN2"][1] == 30
+    assert positions["PRE2"][1] == 40
+
+
+def __write_tar(path, members: list) -> None:
+    """Write a tar archive from (name, content) members, in order."""
+    with tarfile.open(path, "w:gz") as tar:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, BytesIO(content))
+
+
+def test_iter_tar_rpsbmls_nested(tmp_path):
+    """Test that files are read from a root folder, skipping other files."""
+    tar_path = tmp_path / "nested.tgz"
+    __write_tar(
+        tar_path,
+        [
+            ("folder/rp_1.xml", b"1"),
+            ("folder/._rp_1.xml", b"fork"),
+            ("folder/README.md", b"readme"),
+            ("folder/sub/rp_2.xml", b"too deep"),
+            ("folder/rp_3.xml", b"3"),
+        ],
+    )
+    assert list(iter_tar_rpsbmls(str(tar_path))) == [b"1", b"3"]
+    with open(tar_path, "rb") as ifh:
+        assert list(iter_tar_rpsbmls(ifh)) == [b"1", b"3"]
+
+
+def test_iter_tar_rpsbmls_root_and_nested(tmp_path):
+    """Test that nested files are ignored when files are found at the root."""
+    tar_path = tmp_path / "mixed.tgz"
+    __write_tar(
+        tar_path,
+        [
+            ("folder/rp_1.xml", b"nested 1"),
+            ("rp_2.xml", b"root 2"),
+            ("folder/rp_3.xml", b"nested 3"),
+            ("rp_4.xml", b"root 4"),
+        ],
+    )
+    assert list(iter_tar_rpsbmls(str(tar_path))) == [b"root 2", b"root 4"]
+
+
+def test_iter_tar_rpsbmls_duplicates(tmp_path):
+    """Test that only the last occurrence of a file name is read."""
+    tar_path = tmp_path / "duplicates.tgz"
+    __write_tar(
+        tar_path,
+        [
+            ("folder/rp_1.xml", b"first"),
+            ("folder/rp_2.xml", b"2"),
+            ("folder/rp_1.xml", b"second"),
+        ],
+    )
+    assert list(iter_tar_rpsbmls(str(tar_path))) == [b"2", b"second"]
+    # Streams that cannot be read twice give the same files
+    stream = BytesIO(tar_path.read_bytes())
+    stream.seekable = lambda: False
+    assert list(iter_tar_rpsbmls(stream)) == [b"2", b"second"]
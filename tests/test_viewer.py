@@ -0,0 +1,136 @@
+"""Test cases for the rpviz Viewer module."""
+
+from __future__ import annotations
+
+import json
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from rpviz.Viewer import Viewer
+
+# Start the viewer headless, then compare the layout it ends up with to a
+# freshly computed one. The page itself is not there: jQuery and the document
+# give empty selections, as they would for missing elements.
+STARTUP_SCRIPT = """
+const fs = require('fs');
+const vm = require('vm');
+const [js_folder, network_file] = process.argv.slice(2);
+globalThis.window = globalThis;
+globalThis.cytoscape = require(js_folder + '/cytoscape-3.19.0.min.js');
+globalThis.chroma = require(js_folder + '/chroma-2.1.0.min.js');
+const empty_selection = {length: 0};
+for (const method of [
+    'addClass', 'append', 'change', 'click', 'css', 'each', 'hide', 'hover',
+    'on', 'prop', 'removeClass', 'show', 'tablesorter'
+]){
+    empty_selection[method] = () => empty_selection;
+}
+for (const getter of ['attr', 'data', 'html', 'text', 'val']){
+    empty_selection[getter] = (...args) => args.length ? empty_selection : undefined;
+}
+globalThis.$ = () => empty_selection;
+globalThis.document = {querySelectorAll: () => []};
+vm.runInThisContext(fs.readFileSync(network_file, 'utf8'));
+vm.runInThisContext(fs.readFileSync(js_folder + '/viewer.js', 'utf8'));
+const viewer = init_viewer({headless: true, styleEnabled: true});
+const positions = () => JSON.stringify(
+    cy.nodes(':visible').map((node) => [node.id(), node.position()])
+);
+const startup = positions();
+viewer.refresh_layout(true);
+console.log(JSON.stringify({startup: startup, fresh: positions()}));
+process.exit(0);
+"""
+
+
+def __network(make_node, make_edge) -> tuple[dict, dict]:
+    path_ids = ["rp_001"]
+    nodes = [
+        make_node("T", "chemical", path_ids, target_chemical=True),
+        make_node("A", "chemical", path_ids),
+        make_node("S", "chemical", path_ids, sink_chemical=True),
+        make_node("C", "chemical", path_ids, cofactor=True),
+        make_node("D", "chemical", path_ids, cofactor=True),
+        make_node("R1", "reaction", path_ids),
+        make_node("R2", "reaction", path_ids),
+    ]
+    edges = [
+        make_edge(source, target, path_ids)
+        for source, target in [
+            ("T", "R1"),
+            ("D", "R1"),
+            ("R1", "A"),
+            ("R1", "C"),
+            ("A", "R2"),
+            ("D", "R2"),
+            ("R2", "S"),
+            ("R2", "C"),
+        ]
+    ]
+    pathways_info = {
+        "rp_001": {
+            "path_id": "rp_001",
+            "nb_steps": 2,
+            "node_ids": [node["id"] for node in nodes],
+            "edge_ids": [edge["id"] for edge in edges],
+            "scores": {
+                "rule_score": 0.5,
+                "steps": 2,
+                "global_score": 0.5,
+                "thermo_dg_m_gibbs": 0.0,
+                "fba_target_flux": 0.5,
+            },
+        }
+    }
+    elements = {
+        "nodes": [{"data": node} for node in nodes],
+        "edges": [{"data": edge} for edge in edges],
+    }
+    return {"elements": elements}, pathways_info
+
+
+@pytest.mark.parametrize("link_mode", ["hardlink", "symlink"])
+@pytest.mark.parametrize("copy_mode", ["copy", "update"])
+def test_link_to_copy_rebuild(tmp_path, link_mode, copy_mode):
+    """Test that copying over linked assets leaves the asset store intact."""
+    store = tmp_path / "store"
+    viewer = Viewer(out_folder=tmp_path / "out")
+    viewer.copy_templates(mode=link_mode, asset_store=store)
+    output_file = Path(tmp_path / "out" / "js" / "viewer.js")
+    stored_file = next(store.glob("*/js/viewer.js"))
+    content = stored_file.read_bytes()
+    assert output_file.samefile(stored_file)
+
+    viewer.copy_templates(mode=copy_mode)
+    assert not output_file.is_symlink()
+    assert not output_file.samefile(stored_file)
+    assert output_file.read_bytes() == content
+    # Editing the output does not touch the store
+    output_file.write_text("// edited\n", encoding="utf-8")
+    assert stored_file.read_bytes() == content
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_startup_layout(tmp_path, make_node, make_edge):
+    """Test that the layout shown at startup matches a fresh one."""
+    network, pathways_info = __network(make_node, make_edge)
+    network_file = tmp_path / "network.json"
+    network_file.write_text(
+        f"network = {json.dumps(network)}\n"
+        f"pathways_info = {json.dumps(pathways_info)}\n",
+        encoding="utf-8",
+    )
+    script_file = tmp_path / "startup.js"
+    script_file.write_text(STARTUP_SCRIPT, encoding="utf-8")
+    js_folder = Viewer(out_folder=tmp_path / "out").template_folder / "js"
+    completed = subprocess.run(
+        ["node", str(script_file), str(js_folder), str(network_file)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    layouts = json.loads(completed.stdout.splitlines()[-1])
+    assert layouts["startup"] == layouts["fresh"]